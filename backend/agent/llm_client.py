@@ -2,12 +2,123 @@
 ModelScope OpenAI 兼容 API 客户端
 使用 OpenAI SDK 调用 ModelScope API
 属于 Agent Layer
+
+容错（见 llm_resilience）：
+- 对冲请求：流式调用在最近首字耗时的 LLM_HEDGE_QUANTILE 分位内没有首字时再发一个请求，先出首字的胜出，另一个立即取消
+- 重试：首字之前的上游错误在重试预算内重试一次
+- 熔断：连续失败后直接拒绝调用，不再排队等上游超时
+
+只有上游故障（5xx、连接错误、超过单次超时上限）才重试、对冲并计入熔断；
+4xx（参数错误、上下文超长、鉴权失败）重发也不会成功，直接返回且不计入熔断；
+调用方自己的截止时间用完（deadline_scope）记为 aborted，同样不计入熔断。
 """
+import asyncio
 import logging
-from openai import AsyncOpenAI
+import time
+from typing import Dict, List, Optional, Tuple
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+from backend.agent.llm_resilience import circuit_breaker, retry_budget
+from backend.agent.llm_scheduler import Lease, LLMScheduler, Priority, estimate_tokens, llm_scheduler
+from backend.config import settings
+from backend.core.deadline import DeadlineExceeded, bounded, expired
+from backend.core.latency import LatencyWindow
+from backend.core.metrics import registry
 
 logger = logging.getLogger(__name__)
 
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_seconds",
+    "LLM 调用总耗时（call: complete / stream，outcome: ok / error / rejected / timeout / aborted）",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+LLM_TTFT_SECONDS = registry.histogram(
+    "llm_ttft_seconds",
+    "流式调用从发出请求到收到首个文本片段的耗时",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0),
+)
+LLM_INTER_TOKEN_SECONDS = registry.histogram(
+    "llm_inter_token_seconds",
+    "流式调用相邻文本片段之间的间隔",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LLM_STREAM_CHUNKS = registry.counter(
+    "llm_stream_chunks_total", "流式调用收到的文本片段数"
+)
+LLM_HEDGES = registry.counter(
+    "llm_hedges_total", "流式对冲请求（model，outcome: won / lost / skipped）"
+)
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "上游错误后的重试次数（model，call: complete / stream）"
+)
+
+# 单次生成的 token 上限（也是调度器为输出预留的 token 数）
+MAX_TOKENS = 2000
+
+# 首字耗时样本少于该数时不对冲（分位数不可靠）
+_HEDGE_MIN_SAMPLES = 20
+
+# 各模型最近的流式首字耗时（客户端按请求创建，窗口按模型全局共享）
+_TTFT_WINDOWS: Dict[str, LatencyWindow] = {}
+
+
+def ttft_window(model_name: str) -> LatencyWindow:
+    window = _TTFT_WINDOWS.get(model_name)
+    if window is None:
+        window = _TTFT_WINDOWS.setdefault(model_name, LatencyWindow())
+    return window
+
+
+def recent_ttft(q: float = 0.9) -> Optional[float]:
+    """所有模型最近首字耗时 q 分位中的最大值；没有近期样本时返回 None"""
+    values = [v for v in (w.percentile(q) for w in list(_TTFT_WINDOWS.values())) if v is not None]
+    return max(values) if values else None
+
+
+class LLMAPIError(RuntimeError):
+    """上游调用失败；retryable 为 False 表示请求本身有误（4xx），重发也不会成功"""
+
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """上游故障（连接错误、5xx）；其余 API 错误（4xx）与本地异常视为请求本身的问题"""
+    if isinstance(exc, APIConnectionError):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def _retryable(exc: BaseException) -> bool:
+    return isinstance(exc, LLMAPIError) and exc.retryable
+
+
+def _failure_outcome(exc: BaseException) -> str:
+    """失败调用的 outcome：error 与 timeout 计入熔断，rejected 与 aborted 不计"""
+    if isinstance(exc, DeadlineExceeded):
+        return "aborted" if expired() else "timeout"
+    if isinstance(exc, LLMAPIError):
+        return "error" if exc.retryable else "rejected"
+    return "error" if _is_transient(exc) else "rejected"
+
+
+class _Attempt:
+    """一次上游流式请求（主请求、重试或对冲请求），持有自己的调度名额"""
+
+    __slots__ = ("stream", "lease", "task")
+
+    def __init__(self, stream, lease: Optional[Lease]):
+        self.stream = stream
+        self.lease = lease
+        self.task: Optional[asyncio.Task] = None
+
+    def first_chunk(self) -> asyncio.Task:
+        """在后台等待首个片段（可与其他请求竞争）"""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.stream.__anext__())
+        return self.task
+
 
 class ModelScopeLLMClient:
     """
@@ -19,7 +130,8 @@ class ModelScopeLLMClient:
         self,
         model_name: str,
         api_key: str,
-        api_base: str
+        api_base: str,
+        scheduler: Optional[LLMScheduler] = None,
     ):
         """
         初始化 LLM 客户端
@@ -28,28 +140,62 @@ class ModelScopeLLMClient:
             model_name: 模型名称（如 'Qwen/Qwen3-32B'）
             api_key: ModelScope API Key
             api_base: API 基础 URL
+            scheduler: 准入调度器，默认使用全局 llm_scheduler
         """
         self.model_name = model_name
+        self.scheduler = scheduler or llm_scheduler
         self.client = AsyncOpenAI(
             base_url=api_base.rstrip('/'),
             api_key=api_key
         )
         logger.info(f"ModelScopeLLMClient 初始化: model={model_name}, api_base={api_base}")
     
-    async def acomplete(self, prompt: str) -> "LLMResponse":
+    async def acomplete(
+        self,
+        prompt: str,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[str] = None,
+    ) -> "LLMResponse":
         """
         异步完成文本生成
         
         Args:
             prompt: 输入提示词
+            priority: 调度优先级
+            user_id: 发起调用的用户（调度器按用户公平排队）
             
         Returns:
             LLMResponse 对象（兼容 llama-index 接口）
+
+        Raises:
+            CircuitOpenError: 模型熔断中
+            LLMBusyError: 调度器排队超时
+            LLMAPIError: 上游调用失败
+            DeadlineExceeded: 请求截止时间已到或超过 LLM_REQUEST_TIMEOUT
         """
+        circuit_breaker(self.model_name).check()
+        retry_budget(self.model_name).deposit()
+        async with self.scheduler.slot(priority, user_id, estimate_tokens(prompt) + MAX_TOKENS) as lease:
+            try:
+                return await self._complete(prompt, lease)
+            except LLMAPIError as e:
+                if not e.retryable or not self._may_retry():
+                    raise
+            LLM_RETRIES.inc(model=self.model_name, call="complete")
+            logger.warning("LLM 调用失败，重试一次: model=%s", self.model_name)
+            return await self._complete(prompt, lease)
+
+    def _may_retry(self) -> bool:
+        """熔断器放行且重试预算充足时才允许重试 / 对冲"""
+        return circuit_breaker(self.model_name).allow() and retry_budget(self.model_name).withdraw()
+
+    async def _complete(self, prompt: str, lease) -> "LLMResponse":
+        started = time.perf_counter()
+        outcome = "error"
         try:
             logger.info(f"调用 ModelScope API: model={self.model_name}")
             
-            response = await self.client.chat.completions.create(
+            response = await bounded("llm.complete", self.client.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {
@@ -58,35 +204,182 @@ class ModelScopeLLMClient:
                     }
                 ],
                 temperature=0.7,
-                max_tokens=2000,
+                max_tokens=MAX_TOKENS,
                 stream=False,  # 非流式，简化处理
                 extra_body={
                     "enable_thinking": False  # ModelScope API 要求：非流式调用必须设置为 False
                 }
-            )
+            ), cap=settings.LLM_REQUEST_TIMEOUT)
             
             # 提取回答内容
             content = response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            lease.used = getattr(usage, "total_tokens", None) or estimate_tokens(prompt) + estimate_tokens(content or "")
             logger.info(f"API 调用成功，返回长度: {len(content) if content else 0}")
+            outcome = "ok"
             
             return LLMResponse(text=content or "")
+        except DeadlineExceeded as e:
+            outcome = _failure_outcome(e)
+            logger.warning("LLM 调用超时: model=%s, outcome=%s", self.model_name, outcome)
+            raise
         except Exception as e:
+            outcome = _failure_outcome(e)
             logger.error(f"LLM API 调用失败: {str(e)}", exc_info=True)
-            raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+            raise LLMAPIError(f"LLM API 调用失败: {str(e)}", retryable=outcome == "error") from e
+        finally:
+            circuit_breaker(self.model_name).record(outcome)
+            LLM_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, model=self.model_name, call="complete", outcome=outcome
+            )
     
-    async def astream(self, prompt: str):
+    async def astream(
+        self,
+        prompt: str,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[str] = None,
+    ):
         """
-        异步流式生成文本
+        异步流式生成文本（整个流式过程占用一个调度名额）
         
         Args:
             prompt: 输入提示词
+            priority: 调度优先级
+            user_id: 发起调用的用户（调度器按用户公平排队）
         
         Yields:
             每次产生一小段新增文本
+
+        Raises:
+            CircuitOpenError: 模型熔断中
+            LLMBusyError: 调度器排队超时
+            LLMAPIError: 上游调用失败
+            DeadlineExceeded: 请求截止时间已到，或超过 LLM_STREAM_IDLE_TIMEOUT 没有新片段
         """
+        circuit_breaker(self.model_name).check()
+        retry_budget(self.model_name).deposit()
+        tokens = estimate_tokens(prompt) + MAX_TOKENS
+        lease = await bounded("llm.queue", self.scheduler.acquire(priority, user_id, tokens))
+        attempts = [_Attempt(self._stream(prompt, lease), lease)]
+        try:
+            winner, first = await self._race(prompt, attempts, priority, user_id, tokens)
+            for attempt in attempts:
+                if attempt is not winner:
+                    await self._discard(attempt)
+            attempts = [winner]
+            if first is None:
+                return
+            yield first
+            async for text in winner.stream:
+                yield text
+        finally:
+            # 消费方提前关闭时立即关闭上游流并归还名额，而不是等垃圾回收
+            for attempt in attempts:
+                await self._discard(attempt)
+
+    def _hedge_delay(self) -> Optional[float]:
+        """发对冲请求前等待首字的时间；未启用或首字耗时样本不足时不对冲"""
+        if not settings.LLM_HEDGE_ENABLED:
+            return None
+        delay = ttft_window(self.model_name).percentile(settings.LLM_HEDGE_QUANTILE, min_samples=_HEDGE_MIN_SAMPLES)
+        return None if delay is None else max(delay, settings.LLM_HEDGE_MIN_DELAY)
+
+    def _start_hedge(self, prompt: str, priority: Priority, user_id: Optional[str], tokens: int) -> Optional[_Attempt]:
+        """发对冲请求：只用空闲的调度名额（不排队），并受熔断器与重试预算约束"""
+        lease = self.scheduler.try_acquire(priority, user_id, tokens)
+        if lease is not None and not self._may_retry():
+            lease.used = 0
+            self.scheduler.release(lease)
+            lease = None
+        if lease is None:
+            LLM_HEDGES.inc(model=self.model_name, outcome="skipped")
+            return None
+        logger.info("LLM 首字超过对冲延迟，发出对冲请求: model=%s", self.model_name)
+        return _Attempt(self._stream(prompt, lease), lease)
+
+    async def _race(
+        self,
+        prompt: str,
+        attempts: List[_Attempt],
+        priority: Priority,
+        user_id: Optional[str],
+        tokens: int,
+    ) -> Tuple[_Attempt, Optional[str]]:
+        """
+        等待首个文本片段，返回胜出的请求与其首个片段（上游没有输出任何文本时为 None）
+
+        新发出的对冲 / 重试请求追加到 attempts 中，由调用方负责关闭落选的请求。
+        """
+        started = time.perf_counter()
+        delay = self._hedge_delay()
+        hedge: Optional[_Attempt] = None
+        retried = False
+        pending = {attempts[0].first_chunk(): attempts[0]}
+        while True:
+            timeout = None
+            if hedge is None and delay is not None:
+                timeout = max(delay - (time.perf_counter() - started), 0)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # 对冲延迟已到仍没有首字；无论能否发出，只尝试一次
+                delay = None
+                hedge = self._start_hedge(prompt, priority, user_id, tokens)
+                if hedge is not None:
+                    attempts.append(hedge)
+                    pending[hedge.first_chunk()] = hedge
+                continue
+            error = None
+            winner = None
+            for task in done:
+                attempt = pending.pop(task)
+                # 同一轮完成的每个任务都取出异常：先遍历到成功的任务也不能漏掉另一个的失败（否则 asyncio 告警）
+                exc = task.exception()
+                if exc is None or isinstance(exc, StopAsyncIteration):
+                    if winner is None:
+                        winner = attempt, None if exc is not None else task.result()
+                else:
+                    error = exc
+            if winner is not None:
+                if hedge is not None:
+                    LLM_HEDGES.inc(model=self.model_name, outcome="won" if winner[0] is hedge else "lost")
+                return winner
+            if _failure_outcome(error) in ("rejected", "aborted"):
+                # 请求本身有误（4xx）或截止时间已到：另一个请求也不会成功，不再等它
+                raise error
+            if pending:
+                # 另一个请求还在进行
+                continue
+            # 全部失败：首字之前的上游故障在预算内重试一次（超时说明时间已不够，不重试）
+            if retried or not _retryable(error) or not self._may_retry():
+                raise error
+            retried = True
+            LLM_RETRIES.inc(model=self.model_name, call="stream")
+            logger.warning("LLM 流式调用失败，重试一次: model=%s", self.model_name)
+            retry = _Attempt(self._stream(prompt, attempt.lease), attempt.lease)
+            attempt.lease = None
+            attempts.append(retry)
+            pending[retry.first_chunk()] = retry
+
+    async def _discard(self, attempt: _Attempt) -> None:
+        """取消并关闭一次流式请求，归还其调度名额"""
+        if attempt.task is not None and not attempt.task.done():
+            attempt.task.cancel()
+            await asyncio.wait({attempt.task})
+        await attempt.stream.aclose()
+        if attempt.lease is not None:
+            self.scheduler.release(attempt.lease)
+            attempt.lease = None
+
+    async def _stream(self, prompt: str, lease):
         logger.info(f"调用 ModelScope API（stream）: model={self.model_name}")
+        started = time.perf_counter()
+        last = None
+        chunks = 0
+        output_tokens = 0
+        outcome = "error"
+        stream = None
         try:
-            stream = await self.client.chat.completions.create(
+            stream = await bounded("llm.stream", self.client.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {
@@ -95,20 +388,58 @@ class ModelScopeLLMClient:
                     }
                 ],
                 temperature=0.7,
-                max_tokens=2000,
+                max_tokens=MAX_TOKENS,
                 stream=True,
                 extra_body={
                     "enable_thinking": False,
                 },
-            )
-            async for chunk in stream:
+            ), cap=settings.LLM_STREAM_IDLE_TIMEOUT)
+            chunks_iter = stream.__aiter__()
+            while True:
+                # 每个片段都按剩余时间与空闲上限等待，上游卡住时不会无限挂起
+                try:
+                    chunk = await bounded("llm.stream", chunks_iter.__anext__(), cap=settings.LLM_STREAM_IDLE_TIMEOUT)
+                except StopAsyncIteration:
+                    break
                 delta = chunk.choices[0].delta
                 text = getattr(delta, "content", None)
                 if text:
+                    now = time.perf_counter()
+                    if last is None:
+                        LLM_TTFT_SECONDS.observe(now - started, model=self.model_name)
+                        ttft_window(self.model_name).add(now - started)
+                    else:
+                        LLM_INTER_TOKEN_SECONDS.observe(now - last, model=self.model_name)
+                    last = now
+                    chunks += 1
+                    output_tokens += estimate_tokens(text)
                     yield text
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            # 消费方提前关闭（客户端断开）或任务被取消
+            outcome = "aborted"
+            raise
+        except DeadlineExceeded as e:
+            outcome = _failure_outcome(e)
+            logger.warning("LLM 流式调用超时: model=%s, chunks=%d, outcome=%s", self.model_name, chunks, outcome)
+            raise
         except Exception as e:
+            outcome = _failure_outcome(e)
             logger.error(f"LLM 流式 API 调用失败: {str(e)}", exc_info=True)
-            raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+            raise LLMAPIError(f"LLM API 调用失败: {str(e)}", retryable=outcome == "error") from e
+        finally:
+            if stream is not None and outcome != "ok":
+                # 超时或提前结束时释放上游连接
+                try:
+                    await stream.close()
+                except Exception:
+                    pass
+            lease.used = estimate_tokens(prompt) + output_tokens
+            circuit_breaker(self.model_name).record(outcome)
+            LLM_STREAM_CHUNKS.inc(chunks, model=self.model_name)
+            LLM_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, model=self.model_name, call="stream", outcome=outcome
+            )
     
     async def close(self):
         """关闭客户端"""
@@ -0,0 +1,161 @@
+"""
+LLM 调用容错：熔断器与重试预算（按模型）
+
+- 熔断器：连续失败 failure_threshold 次后熔断，open_seconds 内的调用直接失败（不排队、不等上游超时）；
+  到期后放行一个探测调用，成功则恢复，失败则继续熔断
+- 重试预算：每次正常调用存入 ratio 个令牌，每次重试 / 对冲请求取出 1 个，
+  保证额外请求不超过正常调用的 ratio 倍，上游故障时不会被重试放大流量
+"""
+import logging
+import time
+from typing import Dict
+
+from backend.config import settings
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LLM_CIRCUIT_STATE = registry.gauge(
+    "llm_circuit_state", "LLM 熔断器状态（0 正常 / 1 熔断 / 2 探测中，model）"
+)
+LLM_CIRCUIT_REJECTED = registry.counter(
+    "llm_circuit_rejected_total", "熔断期间直接拒绝的 LLM 调用数（model）"
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """模型熔断中：近期连续失败，调用直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, open_seconds: float = 30.0):
+        """
+        Args:
+            name: 模型名称（用于日志与指标）
+            failure_threshold: 连续失败多少次后熔断
+            open_seconds: 熔断持续时间；也是探测调用的最长等待，探测没有结果时到期再放行一个
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._since = 0.0  # 熔断开始 / 探测放行的时间
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.log(
+                logging.WARNING if state == OPEN else logging.INFO,
+                "LLM 熔断器 %s: %s -> %s", self.name, self.state, state,
+            )
+        self.state = state
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[state], model=self.name)
+
+    def allow(self) -> bool:
+        """是否放行一次调用（熔断到期时放行的这一次即为探测）"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self._since < self.open_seconds:
+            return False
+        self._since = now
+        self._set_state(HALF_OPEN)
+        return True
+
+    def check(self) -> None:
+        """
+        放行检查
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        if not self.allow():
+            LLM_CIRCUIT_REJECTED.inc(model=self.name)
+            raise CircuitOpenError(f"模型 {self.name} 暂时不可用（连续失败已熔断），请稍后重试")
+
+    def record(self, outcome: str) -> None:
+        """
+        记录一次上游调用结果
+
+        Args:
+            outcome: ok / error / timeout / rejected / aborted
+                （rejected 为请求本身有误被上游拒绝（4xx），aborted 为调用方主动放弃或自身截止时间用完，均不计成败）
+        """
+        if outcome == "ok":
+            self._failures = 0
+            self._set_state(CLOSED)
+        elif outcome in ("error", "timeout"):
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._since = time.monotonic()
+                self._set_state(OPEN)
+        elif self.state == HALF_OPEN:
+            # 探测调用被放弃：允许立即再探测一次
+            self._since = float("-inf")
+
+
+class RetryBudget:
+    """
+    单个模型的重试预算（令牌桶，按调用次数而非时间补充）
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        """
+        Args:
+            ratio: 每次正常调用存入的令牌数，即额外请求与正常调用的比例上限
+            max_tokens: 令牌上限（允许的突发重试数）
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """取出一个令牌；预算不足时返回 False"""
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+# 客户端按请求创建，熔断器与重试预算按模型全局共享
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BUDGETS: Dict[str, RetryBudget] = {}
+
+
+def circuit_breaker(model_name: str) -> CircuitBreaker:
+    breaker = _BREAKERS.get(model_name)
+    if breaker is None:
+        breaker = _BREAKERS.setdefault(model_name, CircuitBreaker(
+            model_name,
+            failure_threshold=settings.LLM_BREAKER_FAILURES,
+            open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+        ))
+    return breaker
+
+
+def retry_budget(model_name: str) -> RetryBudget:
+    budget = _BUDGETS.get(model_name)
+    if budget is None:
+        budget = _BUDGETS.setdefault(model_name, RetryBudget(settings.LLM_RETRY_BUDGET_RATIO))
+    return budget
+
+
+def circuit_status() -> Dict[str, str]:
+    """各模型熔断器状态（供 /ready 报告）"""
+    return {name: breaker.state for name, breaker in list(_BREAKERS.items())}
@@ -0,0 +1,274 @@
+"""
+LLM 调用调度器
+所有 ModelScopeLLMClient 调用共用的全局准入控制：并发上限 + 每分钟 token 预算 + 优先级 + 按用户公平排队。
+
+- 优先级：interactive（学生在等首字的回答、追问）严格先于 background（回答后的知识提炼）
+- 同一优先级内按用户轮转：每次放行一个用户的最早请求，然后轮到下一个用户，单个用户的大量请求不会挤占其他人
+- token 预算：令牌桶按 tokens_per_minute / 60 每秒补充；准入时按提示词估算 + max_tokens 预留，结束后按实际用量退还差额
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+from backend.config import settings
+from backend.core.deadline import bounded
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LLM_QUEUE_WAIT = registry.histogram(
+    "llm_queue_wait_seconds", "LLM 调用在调度器中排队等待的时间（priority: interactive / background）"
+)
+LLM_QUEUE_DEPTH = registry.gauge(
+    "llm_queue_depth", "在调度器中排队的 LLM 调用数（priority: interactive / background）"
+)
+LLM_INFLIGHT = registry.gauge(
+    "llm_inflight", "正在进行的 LLM 调用数"
+)
+LLM_QUEUE_REJECTED = registry.counter(
+    "llm_queue_rejected_total", "排队超时被拒绝的 LLM 调用数（priority）"
+)
+LLM_TOKENS_USED = registry.counter(
+    "llm_tokens_used_total", "LLM 调用消耗的 token 数（估算，priority）"
+)
+
+
+class Priority(str, Enum):
+    """调用优先级"""
+    INTERACTIVE = "interactive"  # 用户正在等待的回答
+    BACKGROUND = "background"  # 回答结束后的后台处理
+
+
+# 出队顺序：前面的优先级有请求排队时，后面的一律等待
+_PRIORITY_ORDER = (Priority.INTERACTIVE, Priority.BACKGROUND)
+
+
+class LLMBusyError(RuntimeError):
+    """LLM 调度器繁忙：排队等待超过 queue_timeout"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：汉字约 1 token / 字，英文约 1 token / 3~4 字符（按 UTF-8 字节数 / 3）"""
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tokens: int):
+        self.future = future
+        self.tokens = tokens
+        self.enqueued_at = time.perf_counter()
+
+
+class Lease:
+    """一次准入：调用结束前把实际用量写入 used，退还多预留的 token"""
+
+    __slots__ = ("priority", "reserved", "used")
+
+    def __init__(self, priority: Priority, reserved: int):
+        self.priority = priority
+        self.reserved = reserved
+        self.used: Optional[int] = None
+
+
+class LLMScheduler:
+    """
+    全局 LLM 调度器
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        tokens_per_minute: int = 0,
+        queue_timeout: Optional[float] = 30.0,
+    ):
+        """
+        Args:
+            max_concurrency: 同时进行的上游调用数上限
+            tokens_per_minute: 每分钟 token 预算，0 表示不限
+            queue_timeout: 排队超时（秒），None 表示无限等待
+        """
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_timeout = queue_timeout
+        self._inflight = 0
+        # 优先级 -> 用户 -> 该用户的排队请求；OrderedDict 的顺序即轮转顺序
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in _PRIORITY_ORDER
+        }
+        self._depth: Dict[Priority, int] = {priority: 0 for priority in _PRIORITY_ORDER}
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._refill_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def queue_depth(self, priority: Optional[Priority] = None) -> int:
+        """排队中的调用数（不指定优先级时为全部）"""
+        if priority is not None:
+            return self._depth[priority]
+        return sum(self._depth.values())
+
+    # ---------- token 预算 ----------
+
+    def _refill(self) -> None:
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60
+        self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _clamp(self, tokens: int) -> int:
+        # 单次预留不超过桶容量，否则永远无法放行
+        return min(tokens, self.tokens_per_minute) if self.tokens_per_minute else tokens
+
+    def _can_admit(self, tokens: int) -> bool:
+        if self._inflight >= self.max_concurrency:
+            return False
+        if not self.tokens_per_minute:
+            return True
+        self._refill()
+        return self._tokens >= tokens
+
+    def _admit(self, priority: Priority, tokens: int) -> None:
+        self._inflight += 1
+        if self.tokens_per_minute:
+            self._tokens -= tokens
+        LLM_INFLIGHT.set(self._inflight)
+
+    # ---------- 排队 ----------
+
+    def _peek(self):
+        """按优先级、用户轮转找到下一个等待者（顺带丢弃已取消的）"""
+        for priority in _PRIORITY_ORDER:
+            users = self._queues[priority]
+            while users:
+                user, waiters = next(iter(users.items()))
+                while waiters and waiters[0].future.done():
+                    waiters.popleft()
+                if waiters:
+                    return priority, user, waiters[0]
+                del users[user]
+        return None
+
+    def _dispatch(self) -> None:
+        """在有空位和 token 预算时按顺序放行等待者"""
+        while True:
+            head = self._peek()
+            if head is None:
+                return
+            priority, user, waiter = head
+            if self._inflight >= self.max_concurrency:
+                return
+            if not self._can_admit(waiter.tokens):
+                self._wait_for_tokens(waiter.tokens)
+                return
+            users = self._queues[priority]
+            users[user].popleft()
+            if users[user]:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self._depth[priority] -= 1
+            LLM_QUEUE_DEPTH.set(self._depth[priority], priority=priority.value)
+            self._admit(priority, waiter.tokens)
+            waiter.future.set_result(None)
+
+    def _wait_for_tokens(self, tokens: int) -> None:
+        """token 不足时按补充速度定时重新放行"""
+        if self._refill_timer is not None:
+            self._refill_timer.cancel()
+        delay = (tokens - self._tokens) / (self.tokens_per_minute / 60)
+        self._refill_timer = asyncio.get_running_loop().call_later(max(delay, 0.01), self._on_refill)
+
+    def _on_refill(self) -> None:
+        self._refill_timer = None
+        self._dispatch()
+
+    async def acquire(self, priority: Priority, user_id: Optional[str], tokens: int) -> Lease:
+        """
+        等待准入
+
+        Raises:
+            LLMBusyError: 排队超过 queue_timeout
+        """
+        tokens = self._clamp(tokens)
+        started = time.perf_counter()
+        # 快速路径：没有人排队且有空位
+        if self.queue_depth() == 0 and self._can_admit(tokens):
+            self._admit(priority, tokens)
+            LLM_QUEUE_WAIT.observe(0.0, priority=priority.value)
+            return Lease(priority, tokens)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._queues[priority].setdefault(user_id or "", deque()).append(waiter)
+        self._depth[priority] += 1
+        LLM_QUEUE_DEPTH.set(self._depth[priority], priority=priority.value)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 放行与取消同时发生：已占用的名额要还回去
+                self._release(tokens, tokens)
+            else:
+                self._depth[priority] -= 1
+                LLM_QUEUE_DEPTH.set(self._depth[priority], priority=priority.value)
+                # 排在队首的请求离开后，后面的可能可以放行了
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_QUEUE_REJECTED.inc(priority=priority.value)
+                raise LLMBusyError(f"LLM 调用排队超过 {self.queue_timeout} 秒") from None
+            raise
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - started, priority=priority.value)
+        return Lease(priority, tokens)
+
+    def try_acquire(self, priority: Priority, user_id: Optional[str], tokens: int) -> Optional[Lease]:
+        """不排队的准入：没有人排队且有空位时立即放行，否则返回 None（用于对冲等可有可无的调用）"""
+        tokens = self._clamp(tokens)
+        if self.queue_depth() == 0 and self._can_admit(tokens):
+            self._admit(priority, tokens)
+            LLM_QUEUE_WAIT.observe(0.0, priority=priority.value)
+            return Lease(priority, tokens)
+        return None
+
+    def _release(self, reserved: int, used: int) -> None:
+        self._inflight -= 1
+        LLM_INFLIGHT.set(self._inflight)
+        if self.tokens_per_minute and used < reserved:
+            self._refill()
+            self._tokens = min(self.tokens_per_minute, self._tokens + reserved - used)
+        self._dispatch()
+
+    def release(self, lease: Lease) -> None:
+        """结束一次调用；未记录实际用量时按预留量计"""
+        used = lease.reserved if lease.used is None else lease.used
+        LLM_TOKENS_USED.inc(used, priority=lease.priority.value)
+        self._release(lease.reserved, used)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, user_id: Optional[str], tokens: int):
+        """async with 形式的 acquire / release；排队时间同时受请求截止时间约束"""
+        lease = await bounded("llm.queue", self.acquire(priority, user_id, tokens))
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+
+# 全局调度器：所有模型共用并发与 token 预算（同一个 API Key 的限额）
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,228 @@
+"""
+负载自适应降级
+根据事件循环延迟、LLM 调度队列深度与最近的上游首字耗时，逐级关闭对话链路上的非必要工作：
+
+    级别 0：全部开启（LLM 知识提炼、关键词节点、笔记检索）
+    级别 1：知识提炼改用本地规则（不调用 LLM）
+    级别 2：知识提炼推迟到负载恢复后进行，当下不创建关键词节点
+    级别 3：跳过知识提炼与笔记检索
+
+压力超过阈值时立即升级；压力回落后需持续 LOAD_SHED_RECOVERY_SECONDS 才降一级，避免来回抖动。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, NamedTuple, Optional
+
+from backend.agent.llm_client import recent_ttft
+from backend.agent.llm_scheduler import llm_scheduler
+from backend.config import settings
+from backend.core.deadline import no_deadline
+from backend.core.loop_monitor import loop_lag_monitor
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOAD_SHED_LEVEL = registry.gauge(
+    "load_shed_level", "当前降级级别（0 为不降级）"
+)
+LOAD_SHED_TRANSITIONS = registry.counter(
+    "load_shed_transitions_total", "降级级别变化次数（direction: up / down）"
+)
+DEFERRED_JOBS = registry.counter(
+    "load_shed_deferred_jobs_total", "推迟执行的工作（outcome: queued / done / failed / dropped）"
+)
+DEFERRED_QUEUED = registry.gauge(
+    "load_shed_deferred_queued", "等待负载恢复后执行的工作数"
+)
+
+
+class StagePlan(NamedTuple):
+    """某一降级级别下各可选阶段的做法"""
+    level: int
+    extraction: str  # llm / local / deferred / skipped
+    keywords: bool  # 是否创建关键词节点
+    retrieval: bool  # 是否检索用户笔记
+
+
+PLANS = (
+    StagePlan(0, "llm", True, True),
+    StagePlan(1, "local", True, True),
+    StagePlan(2, "deferred", False, True),
+    StagePlan(3, "skipped", False, False),
+)
+MAX_LEVEL = len(PLANS) - 1
+
+
+class LoadShedder:
+    """
+    降级控制器
+
+    不起后台任务：每次查询时按需重新评估（至多每 eval_interval 秒一次），只在事件循环线程中使用。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        loop_lag_ms: float = 100.0,
+        llm_queue_depth: int = 8,
+        llm_ttft_s: float = 8.0,
+        recovery_seconds: float = 15.0,
+        eval_interval: float = 0.5,
+    ):
+        """
+        Args:
+            enabled: 关闭时始终为级别 0
+            loop_lag_ms: 事件循环延迟（滑动平均）阈值
+            llm_queue_depth: LLM 调度队列深度阈值
+            llm_ttft_s: 最近上游首字耗时 p90 阈值
+            recovery_seconds: 压力回落后降一级前需要持续的秒数
+            eval_interval: 两次评估的最小间隔（秒）
+        """
+        self.enabled = enabled
+        self.thresholds = {
+            "loop_lag": loop_lag_ms / 1000,
+            "llm_queue": float(llm_queue_depth),
+            "llm_ttft": llm_ttft_s,
+        }
+        self.recovery_seconds = recovery_seconds
+        self.eval_interval = eval_interval
+        self._level = 0
+        self._evaluated_at = float("-inf")
+        self._calm_since: Optional[float] = None
+        self._signals: Dict[str, float] = {}
+
+    def _read_signals(self) -> Dict[str, float]:
+        return {
+            "loop_lag": loop_lag_monitor.smoothed_lag,
+            "llm_queue": float(llm_scheduler.queue_depth()),
+            "llm_ttft": recent_ttft(0.9) or 0.0,
+        }
+
+    @staticmethod
+    def _target_level(pressure: float) -> int:
+        # 压力 = 各信号与阈值之比的最大值
+        if pressure < 1.0:
+            return 0
+        if pressure < 1.5:
+            return 1
+        if pressure < 2.0:
+            return 2
+        return 3
+
+    def _set_level(self, level: int, pressure: float) -> None:
+        direction = "up" if level > self._level else "down"
+        logger.log(
+            logging.WARNING if direction == "up" else logging.INFO,
+            "负载降级级别 %d -> %d（压力 %.2f，信号 %s）",
+            self._level, level, pressure,
+            ", ".join(f"{k}={v:.3g}" for k, v in self._signals.items()),
+        )
+        LOAD_SHED_TRANSITIONS.inc(direction=direction)
+        self._level = level
+        LOAD_SHED_LEVEL.set(level)
+
+    def level(self) -> int:
+        """当前降级级别（必要时重新评估）"""
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        if now - self._evaluated_at < self.eval_interval:
+            return self._level
+        self._evaluated_at = now
+        self._signals = self._read_signals()
+        pressure = max(value / self.thresholds[name] for name, value in self._signals.items())
+        target = self._target_level(pressure)
+        if target > self._level:
+            self._calm_since = None
+            self._set_level(target, pressure)
+        elif target < self._level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.recovery_seconds:
+                # 一次只降一级，下一级同样要等满恢复时间
+                self._calm_since = now
+                self._set_level(self._level - 1, pressure)
+        else:
+            self._calm_since = None
+        return self._level
+
+    def plan(self) -> StagePlan:
+        """当前级别下各可选阶段的做法"""
+        return PLANS[self.level()]
+
+    def status(self) -> Dict:
+        """当前级别与各信号（供 /ready 报告）"""
+        plan = self.plan()
+        return {
+            **plan._asdict(),
+            "signals": {name: round(value, 4) for name, value in self._signals.items()},
+            "thresholds": self.thresholds,
+            "deferred": deferred_work.pending,
+        }
+
+
+class DeferredWork:
+    """
+    推迟执行的可选工作
+
+    有界队列，满了丢弃最旧的；后台任务在降级级别回到 0 后逐个执行（执行本身仍走 LLM 调度器的后台优先级）。
+    """
+
+    def __init__(self, shedder: LoadShedder, max_items: int = 256, poll_interval: float = 1.0):
+        self.shedder = shedder
+        self.poll_interval = poll_interval
+        self._jobs: Deque[Callable[[], Awaitable]] = deque(maxlen=max_items)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, job: Callable[[], Awaitable]) -> None:
+        """加入一项工作（job 为无参的协程函数）"""
+        if len(self._jobs) == self._jobs.maxlen:
+            DEFERRED_JOBS.inc(outcome="dropped")
+        self._jobs.append(job)
+        DEFERRED_JOBS.inc(outcome="queued")
+        DEFERRED_QUEUED.set(len(self._jobs))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while self._jobs:
+            if self.shedder.level() > 0:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            job = self._jobs.popleft()
+            DEFERRED_QUEUED.set(len(self._jobs))
+            try:
+                # 后台任务创建时复制了提交者的上下文，不应继承那次请求的截止时间
+                with no_deadline():
+                    await job()
+                DEFERRED_JOBS.inc(outcome="done")
+            except Exception as e:
+                DEFERRED_JOBS.inc(outcome="failed")
+                logger.warning("推迟的工作执行失败: %s", e)
+
+    async def stop(self) -> None:
+        """停止后台任务（未执行的工作丢弃）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局控制器
+load_shedder = LoadShedder(
+    enabled=settings.LOAD_SHED_ENABLED,
+    loop_lag_ms=settings.LOAD_SHED_LOOP_LAG_MS,
+    llm_queue_depth=settings.LOAD_SHED_LLM_QUEUE_DEPTH,
+    llm_ttft_s=settings.LOAD_SHED_LLM_TTFT_SECONDS,
+    recovery_seconds=settings.LOAD_SHED_RECOVERY_SECONDS,
+)
+deferred_work = DeferredWork(load_shedder, max_items=settings.LOAD_SHED_DEFERRED_MAX)
@@ -2,22 +2,71 @@
 Agent 编排器
 使用自定义 LLM 客户端编排对话流程
 """
+import asyncio
+import functools
+import re
 import uuid
 import logging
 import json
-from typing import AsyncGenerator, Optional
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
 from backend.agent.llm_client import ModelScopeLLMClient
+from backend.agent.load_shedder import deferred_work, load_shedder
+from backend.agent.llm_scheduler import Priority
 from backend.agent.intent_router import IntentRouter, IntentType
 from backend.agent.strategies import DerivationStrategy, CodeStrategy, ConceptStrategy
 from backend.agent.prompts.system_prompts import RECURSIVE_PROMPT
 from backend.api.schemas.response import AgentResponse
+from backend.core.deadline import DeadlineExceeded, deadline_scope, remaining
+from backend.core.metrics import registry
 from backend.data.neo4j_client import neo4j_client
+from backend.data.sqlite_db import get_db_connection, record_session_activity
+from backend.data.vector_store import vector_store_manager
 from backend.config import settings
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+CHAT_STAGE_SECONDS = registry.histogram(
+    "chat_stage_seconds",
+    "对话各阶段耗时（stage: intent_route / graph_context / retrieval / retrieval_wait / prepare / "
+    "first_token / generation / extraction / graph_write）",
+)
+RETRIEVAL_PREFETCH = registry.counter(
+    "chat_retrieval_prefetch_total", "对话检索预取结果（outcome: hit / empty / late / error / not_ready / shed）"
+)
+
+
+# 回答中的加粗术语与小标题，作为本地提炼的关键词候选
+_EMPHASIS = re.compile(r"\*\*([^*\n]{1,20})\*\*|^#{1,6}\s*([^\n]{1,20})$", re.MULTILINE)
+
+
+def _local_concepts(query: str, answer: str, max_children: int = 5) -> Tuple[str, List[str]]:
+    """
+    不调用 LLM 的知识提炼（负载降级时使用）
+
+    核心概念取问题本身（截断），子概念取回答中的加粗术语与小标题。
+    """
+    root_label = query.strip()[:10]
+    children: List[str] = []
+    for match in _EMPHASIS.finditer(answer):
+        term = (match.group(1) or match.group(2)).strip(" ：:，,。")
+        if term and term != root_label and term not in children:
+            children.append(term)
+            if len(children) >= max_children:
+                break
+    return root_label, children
+
+
+async def _timed(stage: str, awaitable):
+    """等待 awaitable 并记录该阶段耗时"""
+    t0 = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - t0, stage=stage)
+
 
 class AgentOrchestrator:
     """
@@ -59,6 +108,198 @@ class AgentOrchestrator:
         }
         logger.info("Orchestrator 初始化完成")
 
+    # ==============================
+    # 上下文准备：意图识别、对话上下文、笔记检索并发进行
+    # ==============================
+
+    async def _prepare(
+        self,
+        user_id: str,
+        query: str,
+        parent_id: Optional[str],
+    ) -> Tuple[IntentType, Dict]:
+        """
+        并发执行意图识别、父对话查询和知识库检索，返回意图与策略上下文
+
+        检索只等到 RETRIEVAL_PREFETCH_BUDGET_MS（从进入本方法起算）为止，
+        超出预算的检索直接取消，本次回答不带笔记，不拖慢首字时间。
+        请求剩余时间不足预算时按剩余时间等待。
+        """
+        started = time.perf_counter()
+        budget = settings.RETRIEVAL_PREFETCH_BUDGET_MS / 1000
+        left = remaining()
+        deadline = started + (budget if left is None else min(budget, max(left, 0)))
+        retrieval = self._start_retrieval(user_id, query)
+        try:
+            intent, history = await asyncio.gather(
+                _timed("intent_route", self.intent_router.route(query)),
+                _timed("graph_context", self._fetch_history(user_id, parent_id)),
+            )
+        except BaseException:
+            if retrieval is not None:
+                retrieval.cancel()
+            raise
+        notes = await self._collect_notes(retrieval, deadline)
+        logger.info(
+            "上下文准备完成: %.0f ms, history=%d, notes=%d",
+            (time.perf_counter() - started) * 1000, len(history), len(notes),
+        )
+        context = {
+            "user_id": user_id,
+            "parent_id": parent_id,
+            "history": history,
+            "notes": notes,
+        }
+        return intent, context
+
+    async def _fetch_history(self, user_id: str, parent_id: Optional[str]) -> List[Dict]:
+        """追问时读取父对话节点；Neo4j 不可用时降级为无上下文"""
+        if not parent_id:
+            return []
+        try:
+            return await neo4j_client.get_dialogue_context(parent_id, user_id)
+        except Exception as e:
+            logger.warning("读取对话上下文失败（已降级处理）: %s", str(e))
+            return []
+
+    def _start_retrieval(self, user_id: str, query: str) -> Optional[asyncio.Task]:
+        """在后台开始检索用户笔记；知识库尚未就绪时不等待预热"""
+        if not settings.RETRIEVAL_PREFETCH_ENABLED:
+            return None
+        if not load_shedder.plan().retrieval:
+            RETRIEVAL_PREFETCH.inc(outcome="shed")
+            return None
+        if vector_store_manager.state != "ready":
+            # 懒加载模式下顺便触发预热，后续请求即可使用
+            vector_store_manager.start()
+            RETRIEVAL_PREFETCH.inc(outcome="not_ready")
+            return None
+        return asyncio.create_task(self._retrieve(user_id, query))
+
+    async def _retrieve(self, user_id: str, query: str) -> List[Dict]:
+        t0 = time.perf_counter()
+        notes = await vector_store_manager.search_context(
+            query, top_k=settings.RETRIEVAL_PREFETCH_TOP_K, user_id=user_id
+        )
+        # 只记录完成的检索；被取消的检索没有完整耗时
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - t0, stage="retrieval")
+        return notes
+
+    async def _collect_notes(self, task: Optional[asyncio.Task], deadline: float) -> List[Dict]:
+        """在预算内取检索结果，超时则取消检索并返回空列表"""
+        if task is None:
+            return []
+        t0 = time.perf_counter()
+        if not task.done():
+            await asyncio.wait({task}, timeout=max(deadline - t0, 0))
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - t0, stage="retrieval_wait")
+        if not task.done():
+            task.cancel()
+            RETRIEVAL_PREFETCH.inc(outcome="late")
+            logger.info("笔记检索超出 %d ms 预算，已丢弃", settings.RETRIEVAL_PREFETCH_BUDGET_MS)
+            return []
+        if task.cancelled() or task.exception() is not None:
+            RETRIEVAL_PREFETCH.inc(outcome="error")
+            logger.warning("笔记检索失败（已降级处理）: %s", "cancelled" if task.cancelled() else task.exception())
+            return []
+        notes = task.result()
+        RETRIEVAL_PREFETCH.inc(outcome="hit" if notes else "empty")
+        return notes
+
+    async def _record_session(
+        self,
+        user_id: str,
+        session_id: Optional[str],
+        conversation_id: str,
+        root_node_id: str,
+        title: Optional[str],
+        node_count: int,
+    ) -> None:
+        """对话节点写入 Neo4j 后更新 SQLite 会话索引（降级：失败只记录日志）"""
+        if not session_id:
+            return
+        try:
+            async with get_db_connection() as db:
+                await record_session_activity(
+                    db, user_id, session_id, conversation_id, root_node_id, title, node_count
+                )
+        except Exception as e:
+            logger.warning("更新会话索引失败（已降级处理）: %s", e)
+
+    async def _extract_concepts(self, user_id: str, query: str, answer: str) -> Tuple[str, List[str]]:
+        """用 LLM 从问答中提炼核心概念与 3-5 个关键子概念"""
+        extraction_prompt = f"""
+            基于以下问答，提炼出一个核心概念节点和3-5个关键子概念节点。
+            
+            问题: {query}
+            回答: {answer}
+            
+            请严格只返回 JSON 格式，不要包含 Markdown 标记。格式如下：
+            {{
+                "root": "核心概念(简短名词)",
+                "children": ["子概念1", "子概念2", "子概念3"]
+            }}
+            """
+        
+        # 知识提炼在回答结束后进行，优先级低于正在等首字的请求
+        summary_res = await _timed(
+            "extraction",
+            self.llm.acomplete(extraction_prompt, priority=Priority.BACKGROUND, user_id=user_id),
+        )
+        summary_text = summary_res.text if hasattr(summary_res, 'text') else str(summary_res)
+        
+        # 清理 JSON 字符串
+        summary_text = summary_text.replace("```json", "").replace("```", "").strip()
+        
+        # 解析 JSON
+        try:
+            structure = json.loads(summary_text)
+            return structure.get("root", "核心概念"), structure.get("children", [])
+        except json.JSONDecodeError:
+            logger.warning("知识提炼 JSON 解析失败，使用默认值")
+            return query[:10], []
+
+    async def _save_keywords(self, user_id: str, root_id: str, children: List[str]) -> None:
+        """在 Root 节点下创建关键词节点（后处理时间用完时跳过剩余的）"""
+        for i, child_concept in enumerate(children):
+            child_id = str(uuid.uuid4())
+            
+            # 使用 query 方法直接创建子节点和连线
+            try:
+                await neo4j_client.query(
+                    """
+                    MATCH (root:DialogueNode {node_id: $root_id})
+                    CREATE (child:DialogueNode {
+                        node_id: $child_id,
+                        user_id: $user_id,
+                        content: $name,
+                        title: $name,
+                        type: 'keyword',
+                        timestamp: datetime()
+                    })
+                    CREATE (root)-[:HAS_KEYWORD]->(child)
+                    """,
+                    {
+                        "root_id": root_id,
+                        "child_id": child_id,
+                        "user_id": user_id,
+                        "name": child_concept
+                    }
+                )
+            except DeadlineExceeded:
+                logger.warning("后处理时间用完，跳过 %d 个关键词节点", len(children) - i)
+                return
+
+    async def _refine_concepts(self, user_id: str, root_id: str, query: str, answer: str) -> None:
+        """推迟的知识提炼：负载恢复后用 LLM 重新提炼，更新 Root 标题并补建关键词节点"""
+        root_label, children = await self._extract_concepts(user_id, query, answer)
+        await neo4j_client.query(
+            "MATCH (root:DialogueNode {node_id: $root_id, user_id: $user_id}) SET root.title = $title",
+            {"root_id": root_id, "user_id": user_id, "title": root_label},
+        )
+        await self._save_keywords(user_id, root_id, children)
+        logger.info("推迟的知识提炼完成: root=%s, children=%d", root_id, len(children))
+
     async def process_query(
         self,
         user_id: str,
@@ -70,9 +311,9 @@ class AgentOrchestrator:
         处理用户查询（非流式路径，保留以兼容旧逻辑）
         """
         logger.info(f"开始处理查询: query={query[:50]}...")
-        # 识别意图
+        # 识别意图（同时预取对话上下文与知识库笔记）
         logger.info("识别意图...")
-        intent = await self.intent_router.route(query)
+        intent, context = await self._prepare(user_id, query, parent_id)
         logger.info(f"识别结果: {intent.value}")
 
         # 选择策略
@@ -81,10 +322,6 @@ class AgentOrchestrator:
 
         # 处理查询
         logger.info("调用策略处理查询...")
-        context = {
-            "user_id": user_id,
-            "parent_id": parent_id,
-        }
         response = await strategy.process(query, context)
         logger.info("策略处理完成")
 
@@ -131,6 +368,9 @@ class AgentOrchestrator:
                     child_node_id=user_node_id,
                 )
             logger.info("Neo4j 保存成功")
+            await self._record_session(
+                user_id, session_id, conversation_id, user_node_id, query[:10], 2
+            )
         except Exception as e:
             # 降级：只记录错误，不中断主流程
             logger.warning(
@@ -145,51 +385,63 @@ class AgentOrchestrator:
         query: str,
         parent_id: Optional[str] = None,
         session_id: Optional[str] = None,
+        deadline: Optional[float] = None,
     ) -> AsyncGenerator[str, None]:
         """
         处理用户查询（流式输出 + 知识提炼）
+
+        Args:
+            deadline: 回答的截止时间（time.monotonic() 时间点），由入口在收到请求时设定；
+                到点后尚未完成的 LLM / Neo4j / 检索调用直接失败。回答结束后的后处理另有 CHAT_POSTPROCESS_SECONDS 预算。
         """
         logger.info(f"[stream] 开始处理查询: query={query[:50]}...")
-        
-        # 1. 意图识别
-        intent = await self.intent_router.route(query)
-        logger.info(f"[stream] 识别结果: {intent.value}")
+        started = time.perf_counter()
+        answer_parts = []
 
-        strategy = self.strategies[intent]
-        context = {
-            "user_id": user_id,
-            "parent_id": parent_id,
-        }
+        with deadline_scope(None if deadline is None else deadline - time.monotonic()):
+            # 1. 意图识别（同时预取对话上下文与知识库笔记）
+            intent, context = await _timed("prepare", self._prepare(user_id, query, parent_id))
+            logger.info(f"[stream] 识别结果: {intent.value}")
 
-        # 生成对话 ID
-        conversation_id = str(uuid.uuid4())
-        
-        answer_parts = [] 
-       
-        # 发送 Meta 信息
-        yield json.dumps({"type": "meta", "conversation_id": conversation_id}, ensure_ascii=False) + "\n"
+            strategy = self.strategies[intent]
 
-        try:
-            # 2. 流式生成回答
-            async for delta in strategy.process_stream(query, context):
-                if not delta:
-                    continue
+            # 生成对话 ID
+            conversation_id = str(uuid.uuid4())
+
+            # 发送 Meta 信息
+            yield json.dumps({"type": "meta", "conversation_id": conversation_id}, ensure_ascii=False) + "\n"
+
+            try:
+                # 2. 流式生成回答
+                generation_started = time.perf_counter()
+                async for delta in strategy.process_stream(query, context):
+                    if not delta:
+                        continue
+                    if not answer_parts:
+                        # 从收到请求到首个片段（含上下文准备与模型首字）
+                        CHAT_STAGE_SECONDS.observe(time.perf_counter() - started, stage="first_token")
                 
-                # 收集回答片段
-                answer_parts.append(delta)
+                    # 收集回答片段
+                    answer_parts.append(delta)
                 
-                # 发送给前端
-                payload = {"type": "delta", "text": delta}
-                yield json.dumps(payload, ensure_ascii=False) + "\n"
+                    # 发送给前端
+                    payload = {"type": "delta", "text": delta}
+                    yield json.dumps(payload, ensure_ascii=False) + "\n"
                 
-        except Exception as e:
-            logger.error("[stream] LLM 流式生成失败: %s", str(e), exc_info=True)
-            yield json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False) + "\n"
-            return # 出错就直接结束，不进行后续提炼
+            except DeadlineExceeded as e:
+                logger.warning("[stream] 回答超出请求截止时间: %s", e)
+                yield json.dumps({"type": "error", "message": "回答超时，请稍后重试"}, ensure_ascii=False) + "\n"
+                return
+            except Exception as e:
+                logger.error("[stream] LLM 流式生成失败: %s", str(e), exc_info=True)
+                yield json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+                return # 出错就直接结束，不进行后续提炼
+            else:
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - generation_started, stage="generation")
             
-        finally:
-            # 发送结束标记
-            yield json.dumps({"type": "end"}, ensure_ascii=False) + "\n"
+            finally:
+                # 发送结束标记
+                yield json.dumps({"type": "end"}, ensure_ascii=False) + "\n"
 
         # ==========================================
         # 3. 后处理：AI 知识提炼 (Concept Extraction)
@@ -199,43 +451,44 @@ class AgentOrchestrator:
         if not full_answer:
             return
 
-        logger.info("[stream] 回答结束，开始进行知识提炼...")
+        # 回答已经交付，后处理不再受回答的截止时间约束，单独计时
+        with deadline_scope(settings.CHAT_POSTPROCESS_SECONDS):
+            await self._postprocess(user_id, session_id, conversation_id, query, full_answer)
+
+    async def _postprocess(
+        self,
+        user_id: str,
+        session_id: Optional[str],
+        conversation_id: str,
+        query: str,
+        full_answer: str,
+    ) -> None:
+        """回答结束后：知识提炼 + 写入知识图谱 + 更新会话索引"""
+        # 负载高时逐级降级：本地规则提炼 -> 推迟提炼 -> 跳过
+        plan = load_shedder.plan()
+        logger.info("[stream] 回答结束，开始进行知识提炼（方式: %s，降级级别: %d）...", plan.extraction, plan.level)
 
         try:
-            # A. 调用 LLM 总结结构
-            extraction_prompt = f"""
-            基于以下问答，提炼出一个核心概念节点和3-5个关键子概念节点。
-            
-            问题: {query}
-            回答: {full_answer}
-            
-            请严格只返回 JSON 格式，不要包含 Markdown 标记。格式如下：
-            {{
-                "root": "核心概念(简短名词)",
-                "children": ["子概念1", "子概念2", "子概念3"]
-            }}
-            """
-            
-            summary_res = await self.llm.acomplete(extraction_prompt)
-            summary_text = summary_res.text if hasattr(summary_res, 'text') else str(summary_res)
-            
-            # 清理 JSON 字符串
-            summary_text = summary_text.replace("```json", "").replace("```", "").strip()
-            
-            # 解析 JSON
-            try:
-                structure = json.loads(summary_text)
-                root_label = structure.get("root", "核心概念")
-                children = structure.get("children", [])
-            except json.JSONDecodeError:
-                logger.warning("知识提炼 JSON 解析失败，使用默认值")
-                root_label = query[:10]
+            # A. 提炼核心概念与关键子概念
+            if plan.extraction == "llm":
+                try:
+                    root_label, children = await self._extract_concepts(user_id, query, full_answer)
+                except DeadlineExceeded:
+                    logger.warning("知识提炼超时，改用本地规则")
+                    root_label, children = _local_concepts(query, full_answer)
+            elif plan.extraction == "skipped":
+                # 最高降级：不做任何提炼，只存问答对，标题取问题开头
+                root_label, children = query[:10], []
+            else:
+                root_label, children = _local_concepts(query, full_answer)
+            if not plan.keywords:
                 children = []
 
             logger.info(f"提炼成功: Root={root_label}, Children={children}")
 
             # B. 存 Root 节点 (问题 + 回答 + Root Title)
             user_node_id = f"{conversation_id}_root"
+            graph_started = time.perf_counter()
             
             # 存 Root (Title = 核心概念, Type = root)
             await neo4j_client.save_dialogue_node(
@@ -261,32 +514,19 @@ class AgentOrchestrator:
             await neo4j_client.link_dialogue_nodes(user_node_id, ai_node_id)
             
             # D. 存关键子概念 (Keywords)
-            for child_concept in children:
-                child_id = str(uuid.uuid4())
-                
-                # 使用 query 方法直接创建子节点和连线
-                await neo4j_client.query(
-                    """
-                    MATCH (root:DialogueNode {node_id: $root_id})
-                    CREATE (child:DialogueNode {
-                        node_id: $child_id,
-                        user_id: $user_id,
-                        content: $name,
-                        title: $name,
-                        type: 'keyword',
-                        timestamp: datetime()
-                    })
-                    CREATE (root)-[:HAS_KEYWORD]->(child)
-                    """,
-                    {
-                        "root_id": user_node_id,
-                        "child_id": child_id,
-                        "user_id": user_id,
-                        "name": child_concept
-                    }
-                )
+            if children:
+                await self._save_keywords(user_id, user_node_id, children)
 
+            CHAT_STAGE_SECONDS.observe(time.perf_counter() - graph_started, stage="graph_write")
             logger.info("[stream] 知识图谱构建完成")
+            await self._record_session(
+                user_id, session_id, conversation_id, user_node_id, root_label, 2 + len(children)
+            )
+            if plan.extraction == "deferred":
+                # 负载恢复后再用 LLM 提炼，补上标题与关键词节点
+                deferred_work.submit(
+                    functools.partial(self._refine_concepts, user_id, user_node_id, query, full_answer)
+                )
 
         except Exception as e:
             logger.error(f"知识提炼失败: {e}", exc_info=True)
@@ -295,6 +535,9 @@ class AgentOrchestrator:
                 await neo4j_client.save_dialogue_node(f"{conversation_id}_user", user_id, "user", query, title="问题")
                 await neo4j_client.save_dialogue_node(conversation_id, user_id, "assistant", full_answer, title="回答")
                 await neo4j_client.link_dialogue_nodes(f"{conversation_id}_user", conversation_id)
+                await self._record_session(
+                    user_id, session_id, conversation_id, f"{conversation_id}_user", query[:10], 2
+                )
             except Exception as e2:
                  logger.error(f"降级保存也失败了: {e2}")
 
@@ -314,7 +557,7 @@ class AgentOrchestrator:
         # 使用递归提示词
         prompt = f"{RECURSIVE_PROMPT}\n\n用户追问: {query}\n\n请针对性地回答："
 
-        response_text = await self.llm.acomplete(prompt)
+        response_text = await self.llm.acomplete(prompt, user_id=user_id)
         answer = response_text.text if hasattr(response_text, "text") else str(
             response_text
         )
@@ -25,3 +25,27 @@ class BaseStrategy(ABC):
             Agent 响应
         """
         pass
+
+    @staticmethod
+    def format_context(context: dict | None) -> str:
+        """
+        把编排器预取的上下文拼成提示词片段
+
+        Args:
+            context: 上下文信息，可包含 history（父对话节点）与 notes（知识库检索结果）
+
+        Returns:
+            以空行结尾的提示词片段；没有可用上下文时返回空字符串
+        """
+        if not context:
+            return ""
+        sections = []
+        history = context.get("history") or []
+        if history:
+            lines = [f"{'用户' if turn.get('role') == 'user' else '助手'}: {turn.get('content', '')}" for turn in history]
+            sections.append("之前的对话:\n" + "\n".join(lines))
+        notes = context.get("notes") or []
+        if notes:
+            lines = [f"[{i}] ({note.get('source') or '笔记'}) {note.get('text', '')}" for i, note in enumerate(notes, 1)]
+            sections.append("用户笔记中的相关内容（仅在相关时参考）:\n" + "\n".join(lines))
+        return "".join(section + "\n\n" for section in sections)
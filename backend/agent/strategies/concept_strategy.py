@@ -27,9 +27,9 @@ class ConceptStrategy(BaseStrategy):
         """
         处理概念型问题（非流式）
         """
-        prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释这个概念："
+        prompt = f"{self.system_prompt}\n\n{self.format_context(context)}问题: {query}\n\n请详细解释这个概念："
 
-        response_text = await self.llm.acomplete(prompt)
+        response_text = await self.llm.acomplete(prompt, user_id=context.get("user_id") if context else None)
         answer = response_text.text if hasattr(response_text, "text") else str(
             response_text
         )
@@ -52,6 +52,6 @@ class ConceptStrategy(BaseStrategy):
         
         返回一个异步生成器，逐步产生回答文本。
         """
-        prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释这个概念："
-        async for delta in self.llm.astream(prompt):  # type: ignore[attr-defined]
+        prompt = f"{self.system_prompt}\n\n{self.format_context(context)}问题: {query}\n\n请详细解释这个概念："
+        async for delta in self.llm.astream(prompt, user_id=context.get("user_id") if context else None):  # type: ignore[attr-defined]
             yield delta
@@ -36,9 +36,9 @@ class DerivationStrategy(BaseStrategy):
         """
         # TODO: 实现推导型问题的处理逻辑
         # 这里先返回占位响应
-        prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释推导过程："
+        prompt = f"{self.system_prompt}\n\n{self.format_context(context)}问题: {query}\n\n请详细解释推导过程："
         
-        response_text = await self.llm.acomplete(prompt)
+        response_text = await self.llm.acomplete(prompt, user_id=context.get("user_id") if context else None)
         answer = response_text.text if hasattr(response_text, 'text') else str(response_text)
         
         return AgentResponse(
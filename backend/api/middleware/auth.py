@@ -1,16 +1,120 @@
 """
 JWT 认证中间件
+
+验证通过的 token 以 SHA-256 摘要为键缓存，后续请求不再解码验签；
+注销（单个 token）与强制下线（某用户此前签发的全部 token）写入 SQLite 吊销表，跨 worker 共享、重启后保留。
+缓存未命中时查一次吊销表，结果同步到进程内的吊销表副本，缓存命中时只查副本；
+缓存条目最长保留 AUTH_REVOCATION_RECHECK_SECONDS，其他 worker 上的注销最迟在这段时间后生效。
 """
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 from backend.config import settings
+from backend.core.metrics import registry
+from backend.data.sqlite_db import get_db_connection, get_token_revocation, revoke_token_digest, set_user_not_before
 
 
 security = HTTPBearer()
 
+AUTH_SECONDS = registry.histogram(
+    "auth_verify_seconds",
+    "每个请求的 token 验证耗时（path: cached / decoded）",
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005),
+)
+TOKEN_CACHE_REQUESTS = registry.counter(
+    "auth_token_cache_requests_total", "已验证 token 缓存查询次数（result: hit / miss）"
+)
+TOKEN_REJECTED = registry.counter(
+    "auth_token_rejected_total", "被拒绝的 token 数（reason: invalid / expired / revoked）"
+)
+
+
+def token_digest(token: str) -> bytes:
+    """token 的 SHA-256 摘要（缓存与吊销表不保存 token 原文）"""
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenCache:
+    """
+    已验证 token 缓存 + 吊销表的进程内副本（持久化的吊销表在 SQLite 中）
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(self, max_entries: int = 10_000, recheck_seconds: float = 60.0):
+        """
+        Args:
+            max_entries: 最多缓存的 token 数，超出后淘汰最久未使用的
+            recheck_seconds: 缓存条目最长保留秒数，到期后重新解码并查询吊销表
+        """
+        self.max_entries = max_entries
+        self.recheck_seconds = recheck_seconds
+        self._verified: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        # 已注销的 token 摘要 -> exp（过期后即可删除）
+        self._revoked: Dict[bytes, float] = {}
+        # 用户 ID -> 强制下线时间：iat 早于该时间的 token 一律拒绝
+        self._not_before: Dict[str, float] = {}
+
+    def get(self, digest: bytes, now: float) -> Optional[dict]:
+        """命中且未过期时返回 payload"""
+        entry = self._verified.get(digest)
+        if entry is None:
+            return None
+        payload, exp = entry
+        if now >= exp:
+            del self._verified[digest]
+            return None
+        self._verified.move_to_end(digest)
+        return payload
+
+    def put(self, digest: bytes, payload: dict, now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._verified[digest] = (payload, min(float(payload.get("exp", 0)), now + self.recheck_seconds))
+        self._verified.move_to_end(digest)
+        while len(self._verified) > self.max_entries:
+            self._verified.popitem(last=False)
+
+    def is_revoked(self, digest: bytes, payload: dict) -> bool:
+        if digest in self._revoked:
+            return True
+        cutoff = self._not_before.get(str(payload.get("sub")))
+        # iat 为带小数的秒（旧 token 为整数秒，向下取整后只会更早，同样被拒绝）
+        return cutoff is not None and float(payload.get("iat", 0)) < cutoff
+
+    def revoke(self, digest: bytes, exp: float) -> None:
+        """注销单个 token"""
+        now = time.time()
+        self._revoked = {d: e for d, e in self._revoked.items() if e > now}
+        self._revoked[digest] = exp
+        self._verified.pop(digest, None)
+
+    def revoke_user(self, user_id: str, not_before: float) -> None:
+        """强制下线：该用户 iat 早于 not_before 的 token 全部失效"""
+        horizon = time.time() - settings.JWT_EXPIRATION_HOURS * 3600
+        # 早于一个有效期的下线记录对应的 token 都已过期，可以删除
+        self._not_before = {u: t for u, t in self._not_before.items() if t > horizon}
+        user_id = str(user_id)
+        self._not_before[user_id] = max(not_before, self._not_before.get(user_id, not_before))
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_REVOCATION_RECHECK_SECONDS)
+
+
+def _unauthorized(detail: str, reason: str) -> HTTPException:
+    TOKEN_REJECTED.inc(reason=reason)
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -29,7 +133,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(hours=settings.JWT_EXPIRATION_HOURS)
     
-    to_encode.update({"exp": expire})
+    # iat 保留小数秒：强制下线前后同一秒内签发的 token 也能区分先后；jti 使同一时刻签发的 token 各不相同
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(
         to_encode, 
         settings.JWT_SECRET_KEY, 
@@ -38,9 +143,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """
-    验证 JWT token
+    验证 JWT token（先查已验证缓存，未命中再解码验签）
+
+    异步依赖直接在事件循环上运行，不占用线程池；缓存命中只需一次哈希和字典查找。
     
     Args:
         credentials: HTTP Bearer 凭证
@@ -49,33 +156,70 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         解码后的 token 数据
         
     Raises:
-        HTTPException: token 无效或过期
+        HTTPException: token 无效、过期或已吊销
     """
+    started = time.perf_counter()
     token = credentials.credentials
-    
-    try:
-        payload = jwt.decode(
-            token, 
-            settings.JWT_SECRET_KEY, 
-            algorithms=[settings.JWT_ALGORITHM]
-        )
+    digest = token_digest(token)
+
+    payload = token_cache.get(digest, time.time())
+    path = "cached"
+    if payload is None:
+        TOKEN_CACHE_REQUESTS.inc(result="miss")
+        path = "decoded"
+        try:
+            payload = jwt.decode(
+                token, 
+                settings.JWT_SECRET_KEY, 
+                algorithms=[settings.JWT_ALGORITHM]
+            )
+        except ExpiredSignatureError:
+            raise _unauthorized("Token 已过期", "expired")
+        except JWTError:
+            raise _unauthorized("Token 已过期", "invalid")
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token 无效",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return payload
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token 已过期",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+            raise _unauthorized("Token 无效", "invalid")
+        # 其他 worker 或重启前的注销 / 强制下线记录：同步到进程内副本，之后的缓存命中直接生效
+        async with get_db_connection() as db:
+            revoked, not_before = await get_token_revocation(db, digest, str(user_id))
+        if revoked:
+            token_cache.revoke(digest, float(payload.get("exp", 0)))
+        if not_before is not None:
+            token_cache.revoke_user(user_id, not_before)
+        token_cache.put(digest, payload, time.time())
+    else:
+        TOKEN_CACHE_REQUESTS.inc(result="hit")
+
+    # 吊销检查在缓存之后进行：注销后的 token 即使仍在缓存中也会被拒绝
+    if token_cache.is_revoked(digest, payload):
+        raise _unauthorized("Token 已失效，请重新登录", "revoked")
+    AUTH_SECONDS.observe(time.perf_counter() - started, path=path)
+    return payload
+
+
+async def revoke_token(credentials: HTTPAuthorizationCredentials, all_sessions: bool = False) -> None:
+    """
+    吊销当前请求携带的 token（注销）；all_sessions 为 True 时同时让该用户此前签发的全部 token 失效
+
+    Args:
+        credentials: HTTP Bearer 凭证
+        all_sessions: 是否强制下线该用户的所有会话
+    """
+    payload = await verify_token(credentials)
+    digest = token_digest(credentials.credentials)
+    exp = float(payload.get("exp", 0))
+    now = time.time()
+    token_cache.revoke(digest, exp)
+    if all_sessions:
+        token_cache.revoke_user(payload["sub"], now)
+    async with get_db_connection() as db:
+        await revoke_token_digest(db, digest, exp)
+        if all_sessions:
+            await set_user_not_before(db, str(payload["sub"]), now)
 
 
-def get_current_user_id(token_data: dict = Depends(verify_token)) -> str:
+async def get_current_user_id(token_data: dict = Depends(verify_token)) -> str:
     """
     获取当前用户 ID
     
@@ -0,0 +1,127 @@
+"""
+请求级性能剖析中间件
+
+携带正确 X-Profile-Token 的请求可以用 X-Profile: 1 请求头或 ?profile=1 开启本次请求的 cProfile 剖析，
+也可以按 PROFILER_SAMPLE_RATE 随机采样。剖析覆盖整个请求（含流式响应的全部输出），
+结果写入 ProfileStore，剖析 ID 通过 X-Profile-Id 响应头返回。
+
+cProfile 按线程剖析：同一时刻只剖析一个请求，期间事件循环上其他协程的耗时也会计入；
+执行器线程中的计算（向量化、bcrypt 等）不在结果中。
+PROFILER_TOKEN 为空且采样率为 0 时 main.py 不安装本中间件，请求路径上没有任何开销。
+"""
+import asyncio
+import cProfile
+import hmac
+import logging
+import random
+import time
+from typing import Optional, Sequence
+from urllib.parse import parse_qs
+
+from backend.core.metrics import registry
+from backend.core.profiler import ProfileStore, new_profile_id
+
+logger = logging.getLogger(__name__)
+
+PROFILES = registry.counter(
+    "profiler_profiles_total", "已保存的请求剖析数（trigger: flag / sample）"
+)
+PROFILES_SKIPPED = registry.counter(
+    "profiler_skipped_total", "请求了剖析但未执行的次数（reason: unauthorized / busy）"
+)
+
+
+def token_matches(expected: str, provided: Optional[str]) -> bool:
+    """常数时间比较剖析口令；未配置口令时一律不通过"""
+    return bool(expected) and provided is not None and hmac.compare_digest(expected, provided)
+
+
+class ProfilerMiddleware:
+    """ASGI 中间件：按请求开启 cProfile"""
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        token: str = "",
+        sample_rate: float = 0.0,
+        paths: Sequence[str] = (),
+    ):
+        """
+        Args:
+            app: 下游 ASGI 应用
+            store: 剖析结果存储
+            token: 按请求开启剖析所需的口令，空表示只按采样率剖析
+            sample_rate: 随机采样比例（0~1）
+            paths: 允许剖析的路径前缀
+        """
+        self.app = app
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.paths = tuple(paths)
+        # cProfile 同一线程只能有一个生效的剖析器
+        self._active = False
+
+    def _trigger(self, scope) -> Optional[str]:
+        """本次请求是否剖析：返回 flag / sample，不剖析时返回 None"""
+        if not scope["path"].startswith(self.paths):
+            return None
+        headers = dict(scope["headers"])
+        flag = headers.get(b"x-profile") == b"1"
+        if not flag and b"profile=" in scope["query_string"]:
+            flag = parse_qs(scope["query_string"].decode("latin-1")).get("profile") == ["1"]
+        if flag:
+            provided = headers.get(b"x-profile-token")
+            if token_matches(self.token, provided.decode("latin-1") if provided else None):
+                return "flag"
+            PROFILES_SKIPPED.inc(reason="unauthorized")
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        if self._active:
+            PROFILES_SKIPPED.inc(reason="busy")
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+        status_code = 0
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())],
+                }
+            await send(message)
+
+        profile = cProfile.Profile()
+        self._active = True
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.disable()
+            self._active = False
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "trigger": trigger,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+            try:
+                # 响应已全部发出，落盘不影响本次请求的延迟
+                await asyncio.to_thread(self.store.save, profile_id, profile, meta)
+                PROFILES.inc(trigger=trigger)
+            except Exception as e:
+                logger.warning("保存请求剖析失败: %s", e)
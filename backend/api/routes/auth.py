@@ -1,11 +1,17 @@
 """
 认证相关路由
 """
+import logging
+import sqlite3
+
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.security import HTTPAuthorizationCredentials
 from passlib.context import CryptContext
+from backend.config import settings
+from backend.core.executor import BoundedExecutor, ExecutorBusyError
 from backend.api.schemas.request import UserCreate, UserLogin
 from backend.api.schemas.response import AuthResponse, ErrorResponse
-from backend.api.middleware.auth import create_access_token
+from backend.api.middleware.auth import create_access_token, revoke_token, security
 from backend.data.sqlite_db import (
     get_db_connection,
     create_user,
@@ -14,18 +20,38 @@ from backend.data.sqlite_db import (
 )
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/auth", tags=["auth"])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt 每次要消耗数十到上百毫秒 CPU：放到独立的有界线程池（bcrypt 计算时释放 GIL），
+# 登录高峰时在事件循环上排队，不阻塞对话流；排队过多或过久直接返回 503
+password_executor = BoundedExecutor(
+    "password",
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在密码执行器中运行）"""
+    return await password_executor.run(pwd_context.verify, plain_password, hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def get_password_hash(password: str) -> str:
+    """生成密码哈希（在密码执行器中运行）"""
+    return await password_executor.run(pwd_context.hash, password)
 
-def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
-    return pwd_context.hash(password)
+
+def _busy(e: ExecutorBusyError) -> HTTPException:
+    logger.warning("密码计算繁忙，拒绝请求: %s", e)
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="登录人数过多，请稍后重试",
+        headers={"Retry-After": "1"},
+    )
 
 
 @router.post("/register", response_model=AuthResponse)
@@ -55,25 +81,37 @@ async def register(user_data: UserCreate):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="邮箱已被注册"
             )
-        
-        # 创建用户
-        hashed_password = get_password_hash(user_data.password)
-        user_id = await create_user(
-            db,
-            username=user_data.username,
-            email=user_data.email,
-            hashed_password=hashed_password
-        )
-        
-        # 生成 token
-        access_token = create_access_token(data={"sub": str(user_id)})
-        
-        return AuthResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user_id=str(user_id),
-            username=user_data.username
-        )
+
+    # 计算哈希期间不占用数据库连接
+    try:
+        hashed_password = await get_password_hash(user_data.password)
+    except ExecutorBusyError as e:
+        raise _busy(e)
+
+    # 创建用户（查重之后的并发注册由唯一约束兜底）
+    async with get_db_connection() as db:
+        try:
+            user_id = await create_user(
+                db,
+                username=user_data.username,
+                email=user_data.email,
+                hashed_password=hashed_password
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="用户名或邮箱已被注册"
+            )
+
+    # 生成 token
+    access_token = create_access_token(data={"sub": str(user_id)})
+
+    return AuthResponse(
+        access_token=access_token,
+        token_type="bearer",
+        user_id=str(user_id),
+        username=user_data.username
+    )
 
 
 @router.post("/login", response_model=AuthResponse)
@@ -95,20 +133,40 @@ async def login(user_data: UserLogin):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="用户名或密码错误"
             )
-        
-        # 验证密码
-        if not verify_password(user_data.password, user["hashed_password"]):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="用户名或密码错误"
-            )
-        
-        # 生成 token
-        access_token = create_access_token(data={"sub": str(user["id"])})
-        
-        return AuthResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user_id=str(user["id"]),
-            username=user["username"]
+
+    # 验证密码（不占用数据库连接）
+    try:
+        verified = await verify_password(user_data.password, user["hashed_password"])
+    except ExecutorBusyError as e:
+        raise _busy(e)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用户名或密码错误"
         )
+
+    # 生成 token
+    access_token = create_access_token(data={"sub": str(user["id"])})
+
+    return AuthResponse(
+        access_token=access_token,
+        token_type="bearer",
+        user_id=str(user["id"]),
+        username=user["username"]
+    )
+
+
+@router.post("/logout")
+async def logout(
+    all_sessions: bool = False,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """
+    注销：当前 token 立即失效
+
+    Args:
+        all_sessions: 为 True 时强制下线该用户在所有设备上的会话（此前签发的全部 token 失效）
+        credentials: HTTP Bearer 凭证
+    """
+    await revoke_token(credentials, all_sessions=all_sessions)
+    return {"status": "success"}
@@ -1,16 +1,24 @@
 """
 聊天相关路由
 """
+import base64
+import binascii
+import json
 import logging
+import time
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
 
 from backend.api.schemas.request import ChatRequest
-from backend.api.schemas.response import DialogueNodeBase
+from backend.api.schemas.response import DialogueNodeBase, SessionConversation, SessionPage, SessionSummary
 from backend.api.middleware.auth import get_current_user_id
 from backend.agent.orchestrator import AgentOrchestrator
+from backend.config import settings
+from backend.core.deadline import DeadlineExceeded, deadline_scope
 from backend.data.neo4j_client import neo4j_client
+from backend.data.sqlite_db import get_db_connection, get_session_conversations, list_sessions
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -39,6 +47,8 @@ async def chat(
         request.session_id,
     )
 
+    # 截止时间从收到请求起算
+    deadline = time.monotonic() + settings.CHAT_DEADLINE_SECONDS
     try:
         logger.info("初始化 Orchestrator...")
         orchestrator = AgentOrchestrator()
@@ -47,12 +57,13 @@ async def chat(
         # 暂时对普通提问走流式，对划词追问走非流式一次性返回
         if request.ref_fragment_id:
             logger.info("处理划词追问（非流式）...")
-            response = await orchestrator.process_recursive_query(
-                user_id=user_id,
-                parent_id=request.parent_id or "",
-                fragment_id=request.ref_fragment_id,
-                query=request.query,
-            )
+            with deadline_scope(deadline - time.monotonic()):
+                response = await orchestrator.process_recursive_query(
+                    user_id=user_id,
+                    parent_id=request.parent_id or "",
+                    fragment_id=request.ref_fragment_id,
+                    query=request.query,
+                )
             logger.info("递归追问处理完成，conversation_id=%s", response.conversation_id)
             # 为兼容前端流式消费，这里也返回单条 JSON 行
             async def single_chunk():
@@ -74,11 +85,18 @@ async def chat(
             query=request.query,
             parent_id=request.parent_id,
             session_id=request.session_id,
+            deadline=deadline,
         )
 
         return StreamingResponse(token_stream, media_type="application/json")
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        logger.warning("请求超出截止时间: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="回答超时，请稍后重试",
+        )
     except Exception as e:
         logger.error("处理请求时出错: %s", str(e), exc_info=True)
         raise HTTPException(
@@ -87,6 +105,78 @@ async def chat(
         )
 
 
+def _encode_cursor(last_activity: str, session_id: str) -> str:
+    """把分页位置编码为不透明游标"""
+    raw = json.dumps([last_activity, session_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        last_activity, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(last_activity), str(session_id)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+@router.get("/sessions", response_model=SessionPage)
+async def get_sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    列出会话（按最近活动时间倒序，键集分页）
+
+    Args:
+        limit: 每页条数
+        cursor: 上一页返回的 next_cursor，为空表示第一页
+        user_id: 当前用户 ID
+
+    Returns:
+        会话列表与下一页游标
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    async with get_db_connection() as db:
+        # 多取一条判断是否还有下一页
+        rows = await list_sessions(db, user_id, limit=limit + 1, after=after)
+
+    sessions = [SessionSummary(**row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = sessions[-1]
+        next_cursor = _encode_cursor(last.last_activity, last.session_id)
+    return SessionPage(sessions=sessions, next_cursor=next_cursor)
+
+
+@router.get("/sessions/{session_id}", response_model=List[SessionConversation])
+async def get_session(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    获取会话下的根对话列表
+
+    Args:
+        session_id: 会话 ID
+        user_id: 当前用户 ID
+
+    Returns:
+        对话列表（conversation_id 可用于获取对话树）
+    """
+    async with get_db_connection() as db:
+        rows = await get_session_conversations(db, user_id, session_id)
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会话不存在"
+        )
+    return [SessionConversation(**row) for row in rows]
+
+
 @router.get("/conversation/{conversation_id}", response_model=DialogueNodeBase)
 async def get_conversation(
     conversation_id: str,
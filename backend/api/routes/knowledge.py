@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import logging
 
 # 引入你的 RAG 核心引擎
-from backend.data.vector_store import vector_store_manager
+from backend.api.middleware.auth import get_current_user_id
+from backend.core.executor import ExecutorBusyError
+from backend.data.ingestion import PDF_SUFFIXES, TEXT_SUFFIXES, ingestion_pipeline
+from backend.data.vector_store import VectorStoreNotReadyError, vector_store_manager
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -16,17 +19,22 @@ router = APIRouter(prefix="/knowledge", tags=["Knowledge Base"])
 class MemoCreate(BaseModel):
     content: str
     source: Optional[str] = "user_note"
+    course: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = {}
 
 class SearchQuery(BaseModel):
     query: str
     top_k: int = 3
+    course: Optional[str] = None  # 只检索该课程
+    filters: Optional[Dict[str, Any]] = None  # 元数据过滤，如 {"type": "memo"}
+    include_shared: bool = False  # 是否同时检索共享知识库
+    mode: Optional[str] = None  # lexical / vector / hybrid，默认按配置
 
 # --- 1. 快速记笔记 (文本存入) ---
 @router.post("/memo")
-async def add_memo(memo: MemoCreate):
+async def add_memo(memo: MemoCreate, user_id: str = Depends(get_current_user_id)):
     """
-    接收一段纯文本笔记，存入向量知识库。
+    接收一段纯文本笔记，存入当前用户的向量知识库。
     """
     if not memo.content.strip():
         raise HTTPException(status_code=400, detail="Content cannot be empty")
@@ -38,67 +46,147 @@ async def add_memo(memo: MemoCreate):
         meta["type"] = "memo"
 
         # 调用向量库
-        await vector_store_manager.add_document(text=memo.content, metadata=meta)
+        report = await vector_store_manager.add_document(
+            text=memo.content, metadata=meta, user_id=user_id, course=memo.course
+        )
         
         logger.info(f"已存入笔记，长度: {len(memo.content)}")
-        return {"status": "success", "message": "笔记已存入大脑"}
+        return {"status": "success", "message": "笔记已存入大脑", "dedup": report}
+    except (ExecutorBusyError, VectorStoreNotReadyError) as e:
+        logger.warning(f"存入笔记被拒绝: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"存入笔记失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- 2. 知识检索 (RAG 测试) ---
 @router.post("/search")
-async def search_knowledge(search_req: SearchQuery):
+async def search_knowledge(search_req: SearchQuery, user_id: str = Depends(get_current_user_id)):
     """
-    输入问题，返回最相关的知识片段 (RAG)。
+    输入问题，返回当前用户知识库中最相关的知识片段 (RAG)。
     """
     try:
         logger.info(f"正在搜索: {search_req.query}")
         results = await vector_store_manager.search_context(
             query=search_req.query, 
-            top_k=search_req.top_k
+            top_k=search_req.top_k,
+            user_id=user_id,
+            course=search_req.course,
+            filters=search_req.filters,
+            include_shared=search_req.include_shared,
+            mode=search_req.mode,
         )
         return {"count": len(results), "results": results}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (ExecutorBusyError, VectorStoreNotReadyError) as e:
+        logger.warning(f"搜索被拒绝: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"搜索失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# --- 3. 文件上传 (支持 .md, .txt) ---
+# --- 3. 文件上传 (支持 .md, .txt, .pdf) ---
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    course: Optional[str] = Form(None),
+    user_id: str = Depends(get_current_user_id),
+):
     """
     上传文件，自动读取内容并存入向量库。
-    目前完美支持: .md, .txt
-    (PDF 支持预留位)
+    支持: .md, .txt, .pdf
+    (与批量导入共用流水线：文本按块增量解码、PDF 在进程池中按页解析，边解析边入库)
     """
     filename = file.filename
     logger.info(f"收到文件上传: {filename}")
 
-    try:
-        # 读取文件内容 (二进制)
-        content_bytes = await file.read()
-        
-        text_content = ""
-        
-        # 简单判断文件类型
-        if filename.endswith(".md") or filename.endswith(".txt"):
-            # 尝试解码为字符串
-            text_content = content_bytes.decode("utf-8")
-        elif filename.endswith(".pdf"):
-            # TODO: 这里需要安装 pypdf 才能解析 PDF
-            # 如果你想支持PDF，告诉我，我教你加几行代码
-            return {"status": "warning", "message": "PDF解析功能暂未开启，请上传txt或md"}
-        else:
-            return {"status": "error", "message": "暂不支持该文件格式"}
+    if not filename.lower().endswith(TEXT_SUFFIXES + PDF_SUFFIXES):
+        return {"status": "error", "message": "暂不支持该文件格式"}
 
-        if text_content:
-            # 存入向量库
-            await vector_store_manager.add_document(
-                text=text_content, 
-                metadata={"source": filename, "type": "file"}
-            )
-            return {"status": "success", "message": f"文件 {filename} 已读入知识库"}
-            
+    try:
+        # 复用批量导入流水线，等待完成后返回
+        job = await ingestion_pipeline.wait(
+            await ingestion_pipeline.submit(user_id, course, [file])
+        )
+        if job.status != "completed" or job.files_done + job.files_partial == 0:
+            raise HTTPException(status_code=422, detail="; ".join(job.errors) or "文件解析失败")
+        partial = job.files_partial > 0
+        return {
+            "status": "success",
+            "message": f"文件 {filename} 已部分读入知识库" if partial else f"文件 {filename} 已读入知识库",
+            # 部分导入：已入库的内容不会回滚，客户端不应整份重传
+            "partial": partial,
+            "warnings": job.errors,
+            "pages": job.pages_extracted,
+            "chunks": job.chunks_indexed,
+            "duplicates": job.chunks_deduplicated,
+            "dedup": {
+                "chunks": job.chunks_indexed + job.chunks_deduplicated,
+                "indexed": job.chunks_indexed,
+                "duplicates": job.chunks_deduplicated,
+                "skipped": job.chunks_skipped,
+                "linked": job.chunks_linked,
+            },
+        }
+    except HTTPException:
+        raise
+    except (ExecutorBusyError, VectorStoreNotReadyError) as e:
+        logger.warning(f"文件处理被拒绝: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"文件处理失败: {e}")
-        raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
+
+# --- 4. 批量导入 (多个文件或 .zip 压缩包) ---
+@router.post("/bulk", status_code=202)
+async def bulk_upload(
+    files: List[UploadFile] = File(...),
+    course: Optional[str] = Form(None),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    批量上传文件（.md, .txt, .pdf, 或包含它们的 .zip），后台流水线导入。
+    立即返回任务 ID，用 GET /knowledge/jobs/{job_id} 查询进度。
+    """
+    logger.info(f"收到批量导入: {len(files)} 个文件")
+    try:
+        job = await ingestion_pipeline.submit(user_id, course, files)
+        return job.to_dict()
+    except (ExecutorBusyError, VectorStoreNotReadyError) as e:
+        logger.warning(f"批量导入被拒绝: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量导入失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量导入失败: {str(e)}")
+
+@router.get("/jobs")
+async def list_jobs(user_id: str = Depends(get_current_user_id)):
+    """当前用户的批量导入任务（最近的在前）"""
+    return {"jobs": [job.to_dict() for job in ingestion_pipeline.list_jobs(user_id)]}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(get_current_user_id)):
+    """批量导入任务的进度与吞吐"""
+    job = ingestion_pipeline.get_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+@router.get("/dedup")
+async def dedup_report(user_id: str = Depends(get_current_user_id)):
+    """当前用户各分区的近似重复去重统计"""
+    try:
+        await vector_store_manager.wait_ready()
+        partitions = await vector_store_manager.index_executor.run(
+            vector_store_manager.dedup_report, user_id
+        )
+    except (ExecutorBusyError, VectorStoreNotReadyError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "mode": vector_store_manager.near_dup_mode,
+        "checked": sum(p["checked"] for p in partitions),
+        "skipped": sum(p["skipped"] for p in partitions),
+        "linked": sum(p["linked"] for p in partitions),
+        "partitions": partitions,
+    }
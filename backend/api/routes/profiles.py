@@ -0,0 +1,64 @@
+"""
+请求剖析结果查询路由
+需要 X-Profile-Token 请求头；未配置 PROFILER_TOKEN 时所有接口返回 404。
+"""
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from backend.api.middleware.profiler import token_matches
+from backend.config import settings
+from backend.core.profiler import SORT_KEYS, ProfileStore
+
+router = APIRouter(prefix="/debug/profiles", tags=["profiles"])
+
+profile_store = ProfileStore(settings.PROFILER_DIR, max_profiles=settings.PROFILER_MAX_PROFILES)
+
+
+async def require_profiler_token(x_profile_token: Optional[str] = Header(None)) -> None:
+    if not settings.PROFILER_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not token_matches(settings.PROFILER_TOKEN, x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="剖析口令无效")
+
+
+@router.get("", dependencies=[Depends(require_profiler_token)])
+async def list_profiles():
+    """
+    列出磁盘上保留的剖析结果（新的在前）
+    """
+    return {"profiles": profile_store.list()}
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profiler_token)])
+async def get_profile(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|pstats)$"),
+    sort: str = Query("cumulative"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    获取一个剖析结果
+
+    Args:
+        profile_id: 剖析 ID（X-Profile-Id 响应头）
+        format: text 返回 pstats 文本报告，pstats 返回原始 .prof 文件（可用 snakeviz 等工具打开）
+        sort: 文本报告的排序方式：cumulative / tottime / calls
+        limit: 文本报告列出的函数数
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"未知的排序方式: {sort}，可选: {', '.join(SORT_KEYS)}"
+        )
+    if format == "pstats":
+        path = profile_store.stats_path(profile_id)
+        if path is not None:
+            return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    else:
+        report = await asyncio.to_thread(profile_store.render_text, profile_id, sort, limit)
+        if report is not None:
+            return PlainTextResponse(report)
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="剖析结果不存在或已被淘汰")
@@ -67,6 +67,30 @@ class DialogueNodeBase(BaseModel):
 ConversationNode = DialogueNodeBase
 
 
+class SessionSummary(BaseModel):
+    """会话列表项（侧边栏）"""
+    session_id: str
+    title: Optional[str] = Field(None, description="会话标题：首轮对话提炼出的核心概念")
+    created_at: str
+    last_activity: str
+    node_count: int = Field(0, description="会话中写入的对话节点数")
+    conversation_count: int = Field(0, description="会话中的根对话数")
+
+
+class SessionPage(BaseModel):
+    """会话列表分页"""
+    sessions: List[SessionSummary] = Field(default_factory=list)
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多")
+
+
+class SessionConversation(BaseModel):
+    """会话下的一轮对话"""
+    conversation_id: str = Field(..., description="对话 ID（AI 节点 ID），可用于获取对话树")
+    root_node_id: str
+    title: Optional[str] = None
+    created_at: str
+
+
 class ErrorResponse(BaseModel):
     """错误响应"""
     status: str = "error"
@@ -0,0 +1,4 @@
+"""
+性能基准脚本
+使用方式: python -m backend.benchmarks.<脚本名> --help
+"""
@@ -0,0 +1,91 @@
+"""
+认证开销基准：每个请求验证 JWT 的耗时，解码验签（旧实现） vs 已验证缓存命中
+
+同时给出经由 ASGI 调用一个只做认证的接口的端到端耗时，对比缓存开启 / 关闭。
+
+Usage:
+    python -m backend.benchmarks.bench_auth --iterations 20000 --tokens 1000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+def report(label: str, samples):
+    us = np.asarray(samples) * 1e6
+    print(f"{label:>28} | {np.percentile(us, 50):>8.1f} | {np.percentile(us, 99):>8.1f} | {us.mean():>8.1f}")
+
+
+async def main_async(args):
+    from fastapi import Depends, FastAPI
+    from fastapi.security import HTTPAuthorizationCredentials
+    from httpx import ASGITransport, AsyncClient
+    from jose import jwt
+
+    from backend.api.middleware import auth
+    from backend.config import settings
+    from backend.data.sqlite_db import close_db, init_db
+
+    # 缓存未命中时查询 SQLite 吊销表
+    await init_db()
+
+    tokens = [auth.create_access_token({"sub": str(i)}) for i in range(args.tokens)]
+    credentials = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=t) for t in tokens]
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, args.tokens, args.iterations)
+
+    print(f"iterations={args.iterations}, distinct tokens={args.tokens}, algorithm={settings.JWT_ALGORITHM}")
+    print(f"{'path':>28} | {'p50 us':>8} | {'p99 us':>8} | {'mean us':>8}")
+
+    samples = []
+    for i in picks:
+        t0 = time.perf_counter()
+        jwt.decode(tokens[i], settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        samples.append(time.perf_counter() - t0)
+    report("jwt.decode (before)", samples)
+
+    for c in credentials:
+        await auth.verify_token(c)
+    samples = []
+    for i in picks:
+        t0 = time.perf_counter()
+        await auth.verify_token(credentials[i])
+        samples.append(time.perf_counter() - t0)
+    report("verify_token (cache hit)", samples)
+
+    app = FastAPI()
+
+    @app.get("/whoami")
+    async def whoami(user_id: str = Depends(auth.get_current_user_id)):
+        return {"user_id": user_id}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for label, cache_size in (("request, cache off", 0), ("request, cache on", args.tokens)):
+            auth.token_cache = auth.TokenCache(cache_size)
+            samples = []
+            for i in picks[: args.requests]:
+                t0 = time.perf_counter()
+                await client.get("/whoami", headers={"Authorization": f"Bearer {tokens[i]}"})
+                samples.append(time.perf_counter() - t0)
+            report(label, samples)
+    await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=3000, help="端到端请求数")
+    args = parser.parse_args()
+    os.environ.setdefault("NEO4J_PASSWORD", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_auth_"), "bench.db"))
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+向量化微批基准：并发短问题下，逐条前向 vs EmbeddingService 微批的吞吐与延迟
+
+默认加载真实模型（需要 torch）；--synthetic 使用 NumPy 模拟的前向计算，
+保留「单次调用固定开销 + 批量矩阵运算」的代价结构，便于在无模型环境下对比。
+
+Usage:
+    python -m backend.benchmarks.bench_embedding_batching --clients 32 --requests 20
+    python -m backend.benchmarks.bench_embedding_batching --synthetic
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from backend.config import settings
+from backend.core.executor import BoundedExecutor
+from backend.data.embedding_service import BATCH_SIZE, EmbeddingService
+from backend.data.embedding_worker import embed_queries
+
+_SEQ_LEN = 32
+_HIDDEN = 512
+_LAYERS = 4
+_weights = np.random.default_rng(0).standard_normal((_HIDDEN, _HIDDEN), dtype=np.float32) / np.sqrt(_HIDDEN)
+
+
+def synthetic_embed(model_name, texts):
+    """模拟前向：每次调用 2ms 固定开销 + 每条 SEQ_LEN 个 token 的多层矩阵运算"""
+    time.sleep(0.002)
+    x = np.ones((len(texts) * _SEQ_LEN, _HIDDEN), dtype=np.float32)
+    for _ in range(_LAYERS):
+        x = np.tanh(x @ _weights)
+    return x.reshape(len(texts), _SEQ_LEN, _HIDDEN).mean(axis=1)
+
+
+async def _drive(embed_one, clients: int, requests: int):
+    latencies = []
+
+    async def client(cid: int):
+        for i in range(requests):
+            t0 = time.perf_counter()
+            await embed_one(f"什么是第 {cid}-{i} 个概念的定义？")
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    elapsed = time.perf_counter() - t0
+    lat = np.asarray(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+async def main_async(args):
+    func = synthetic_embed if args.synthetic else embed_queries
+    model_name = settings.EMBED_MODEL_NAME
+    executor = BoundedExecutor("bench-embed", max_workers=args.workers, queue_timeout=None)
+
+    # 预热（加载模型）
+    await executor.run(func, model_name, ["warmup"])
+
+    async def unbatched(q):
+        return (await executor.run(func, model_name, [q]))[0]
+
+    service = EmbeddingService(
+        model_name, executor,
+        max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms,
+        batch_funcs={"query": func},
+    )
+
+    for name, embed_one in (("unbatched", unbatched), ("micro-batched", service.embed_query)):
+        qps, p50, p99 = await _drive(embed_one, args.clients, args.requests)
+        print(f"{name:>14} | {qps:>8.1f} q/s | p50 {p50:>7.1f} ms | p99 {p99:>7.1f} ms")
+
+    batches = BATCH_SIZE.count(kind="query")
+    if batches:
+        print(f"平均批大小: {args.clients * args.requests / batches:.1f} ({batches} 批)")
+    executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=20, help="每个客户端的请求数")
+    parser.add_argument("--workers", type=int, default=settings.VECTOR_EXECUTOR_WORKERS)
+    parser.add_argument("--max-batch", type=int, default=settings.EMBED_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=settings.EMBED_BATCH_MAX_WAIT_MS)
+    parser.add_argument("--synthetic", action="store_true", help="使用模拟前向，不加载真实模型")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+启动开销基准：导入应用入口（uvicorn 能开始监听之前）的耗时，以及向量子系统的预热耗时
+
+导入阶段在子进程中用 `python -X importtime` 统计，列出累计耗时最高的模块；
+--warmup 额外在子进程中测量模型与向量存储的后台预热时间（需要真实模型）。
+
+Usage:
+    python -m backend.benchmarks.bench_import_time
+    python -m backend.benchmarks.bench_import_time --top 30 --warmup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+_WARMUP_SCRIPT = """
+import asyncio, time
+from backend.data.vector_store import vector_store_manager
+async def main():
+    t0 = time.perf_counter()
+    await vector_store_manager.wait_ready(timeout=3600)
+    print(f"{time.perf_counter() - t0:.3f}")
+asyncio.run(main())
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    # 只做导入，不连接数据库；必填配置给占位值即可
+    env.setdefault("NEO4J_PASSWORD", "bench")
+    env.setdefault("JWT_SECRET_KEY", "bench")
+    return env
+
+
+def profile_import(module: str):
+    """返回 (子进程墙钟秒数, [(累计微秒, 自身微秒, 模块名)])"""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(),
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # 模块名前的缩进表示嵌套层级，顶层模块只有一个空格
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main", help="要导入的模块")
+    parser.add_argument("--top", type=int, default=20, help="列出累计耗时最高的模块数")
+    parser.add_argument("--warmup", action="store_true", help="同时测量向量子系统预热耗时")
+    args = parser.parse_args()
+
+    elapsed, rows = profile_import(args.module)
+    top_level = [r for r in rows if not r[2].startswith(" ")]
+    print(f"import {args.module}: 进程墙钟 {elapsed * 1000:.0f} ms，"
+          f"顶层模块累计 {sum(r[0] for r in top_level) / 1000:.0f} ms")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+
+    heavy = [name.strip() for _, _, name in rows if name.strip().split(".")[0] in ("torch", "transformers", "llama_index")]
+    print(f"\n导入阶段加载的 torch / transformers / llama_index 模块数: {len(heavy)}")
+
+    if args.warmup:
+        proc = subprocess.run(
+            [sys.executable, "-c", _WARMUP_SCRIPT], env=_env(), capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"预热失败:\n{proc.stderr[-2000:]}")
+        print(f"向量子系统预热（后台进行，不阻塞监听）: {float(proc.stdout.strip().splitlines()[-1]) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+LLM 对冲请求基准：上游首字耗时长尾时，对冲请求对首字耗时分布的影响
+
+模拟上游：大多数请求 --fast-ms 出首字，--tail-rate 比例的请求 --slow-ms 才出首字，
+用 ModelScopeLLMClient 的真实调用路径（调度器、重试预算、对冲）发起 --requests 次流式调用，
+对比关闭与开启对冲时的首字耗时分位数与额外上游请求数。
+
+Usage:
+    python -m backend.benchmarks.bench_llm_hedging --requests 400 --tail-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class _FakeStream:
+    def __init__(self, ttft: float, chunks: int = 3):
+        self.ttft = ttft
+        self.left = chunks
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.ttft:
+            await asyncio.sleep(self.ttft)
+            self.ttft = 0
+        if not self.left:
+            raise StopAsyncIteration
+        self.left -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="x"))])
+
+    async def close(self):
+        pass
+
+
+class _FakeCompletions:
+    """首字耗时长尾的模拟上游"""
+
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        slow = self.rng.random() < self.args.tail_rate
+        return _FakeStream((self.args.slow_ms if slow else self.args.fast_ms) / 1000)
+
+
+async def run(args, hedge: bool):
+    """返回 (首字耗时列表（毫秒）, 上游请求数)"""
+    from backend.agent import llm_client
+    from backend.agent.llm_client import ModelScopeLLMClient
+    from backend.agent.llm_scheduler import LLMScheduler
+    from backend.config import settings
+
+    settings.LLM_HEDGE_ENABLED = hedge
+    settings.LLM_HEDGE_MIN_DELAY = args.min_delay_ms / 1000
+    llm_client._TTFT_WINDOWS.clear()
+    upstream = _FakeCompletions(args, random.Random(args.seed))
+    scheduler = LLMScheduler(args.concurrency * 2, queue_timeout=None)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # 复用一个客户端：逐次创建 AsyncOpenAI 的开销会混进首字耗时
+    client = ModelScopeLLMClient("bench", "bench", "http://bench", scheduler=scheduler)
+    client.client.chat.completions = upstream
+    ttfts = []
+
+    async def call(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            first = True
+            async for _ in client.astream("问题", user_id=f"user{i}"):
+                if first:
+                    ttfts.append((time.perf_counter() - t0) * 1000)
+                    first = False
+
+    await asyncio.gather(*(call(i) for i in range(args.requests)))
+    return ttfts, upstream.calls
+
+
+async def main_async(args):
+    print(f"requests={args.requests}, concurrency={args.concurrency}, fast={args.fast_ms} ms, "
+          f"slow={args.slow_ms} ms, tail rate={args.tail_rate}")
+    print(f"{'mode':>8} | {'p50':>6} | {'p95':>6} | {'p99':>6} | {'max':>6} | {'upstream calls':>14} (ms TTFT)")
+    for label, hedge in (("off", False), ("hedged", True)):
+        ttfts, calls = await run(args, hedge)
+        p50, p95, p99 = np.percentile(ttfts, [50, 95, 99])
+        print(f"{label:>8} | {p50:>6.0f} | {p95:>6.0f} | {p99:>6.0f} | {max(ttfts):>6.0f} | {calls:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fast-ms", type=int, default=100)
+    parser.add_argument("--slow-ms", type=int, default=3000)
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="首字耗时落在长尾的请求比例")
+    parser.add_argument("--min-delay-ms", type=int, default=150, help="对冲延迟下限（LLM_HEDGE_MIN_DELAY）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.environ.setdefault("NEO4J_PASSWORD", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
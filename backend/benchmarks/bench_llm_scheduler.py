@@ -0,0 +1,74 @@
+"""
+LLM 调度基准：后台提炼占满上游并发时，交互请求的排队等待
+
+模拟上游（每次调用固定耗时，最多 --concurrency 个同时进行），一批后台调用持续占用名额，
+同时多名用户发起交互调用（其中一名用户一次发起大量请求），对比：
+先到先得（只有上游并发上限，相当于直接撞上服务商限流）与优先级 + 按用户公平调度。
+
+Usage:
+    python -m backend.benchmarks.bench_llm_scheduler --concurrency 4 --background 40 --users 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+
+async def run(acquire_release, args):
+    """返回 (普通用户交互等待列表, 刷请求用户交互等待列表)，单位毫秒"""
+    waits = {"normal": [], "heavy": []}
+
+    async def call(priority, user, bucket):
+        t0 = time.perf_counter()
+        async with acquire_release(priority, user):
+            if bucket is not None:
+                waits[bucket].append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(args.call_ms / 1000)
+
+    tasks = [asyncio.create_task(call("background", f"bg{i}", None)) for i in range(args.background)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call("interactive", "heavy", "heavy")) for _ in range(args.heavy)]
+    tasks += [asyncio.create_task(call("interactive", f"user{i}", "normal")) for i in range(args.users)]
+    await asyncio.gather(*tasks)
+    return waits["normal"], waits["heavy"]
+
+
+async def main_async(args):
+    from backend.agent.llm_scheduler import LLMScheduler, Priority
+
+    print(f"upstream concurrency={args.concurrency}, call={args.call_ms} ms, background={args.background}, "
+          f"users={args.users}, heavy user requests={args.heavy}")
+    print(f"{'mode':>12} | {'user p50':>8} | {'user max':>8} | {'heavy p50':>9} (ms queue wait)")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    def fifo(priority, user):
+        return semaphore
+
+    scheduler = LLMScheduler(args.concurrency, queue_timeout=None)
+
+    def scheduled(priority, user):
+        return scheduler.slot(Priority(priority), user, 1)
+
+    for label, acquire_release in (("fifo", fifo), ("scheduler", scheduled)):
+        normal, heavy = await run(acquire_release, args)
+        print(f"{label:>12} | {np.percentile(normal, 50):>8.0f} | {max(normal):>8.0f} | {np.percentile(heavy, 50):>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--call-ms", type=int, default=50)
+    parser.add_argument("--background", type=int, default=40)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--heavy", type=int, default=20, help="同一用户一次发起的交互请求数")
+    args = parser.parse_args()
+    os.environ.setdefault("NEO4J_PASSWORD", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+登录风暴基准：大量并发登录时，同一事件循环上对话流的 token 间隔
+
+模拟一路流式回答（每 10 ms 产出一个 token），同时通过 ASGI 直接调用 /api/auth/login 发起并发登录，
+对比三种情况下 token 间隔的分布：无登录、bcrypt 在事件循环上计算（旧实现）、bcrypt 在密码执行器中计算。
+
+Usage:
+    python -m backend.benchmarks.bench_login_storm --users 50 --logins 400 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+TOKEN_INTERVAL = 0.01
+
+
+async def stream_probe(stop: asyncio.Event):
+    """按固定间隔产出 token，返回实际间隔（毫秒）"""
+    gaps = []
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(TOKEN_INTERVAL)
+        now = time.perf_counter()
+        gaps.append((now - last) * 1000)
+        last = now
+    return gaps
+
+
+async def login_storm(client, users: int, logins: int, concurrency: int):
+    """返回 (登录/秒, 登录延迟列表, 非 200 响应数)"""
+    queue = list(range(logins))
+    latencies, failures = [], 0
+
+    async def worker():
+        nonlocal failures
+        while queue:
+            i = queue.pop()
+            t0 = time.perf_counter()
+            resp = await client.post("/api/auth/login", json={"username": f"storm{i % users}", "password": "password123"})
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if resp.status_code != 200:
+                failures += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return logins / (time.perf_counter() - t0), latencies, failures
+
+
+async def run_case(client, label: str, users: int, logins: int, concurrency: int):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(stream_probe(stop))
+    if logins:
+        qps, latencies, failures = await login_storm(client, users, logins, concurrency)
+    else:
+        await asyncio.sleep(1.0)
+        qps, latencies, failures = 0.0, [0.0], 0
+    stop.set()
+    gaps = await probe
+    print(
+        f"{label:>18} | {qps:>8.0f} | {np.percentile(latencies, 99):>9.0f} | {failures:>5} | "
+        f"{np.percentile(gaps, 50):>7.1f} | {np.percentile(gaps, 99):>7.1f} | {max(gaps):>7.1f}"
+    )
+
+
+async def main_async(args):
+    from httpx import ASGITransport, AsyncClient
+
+    from backend.api.routes import auth
+    from backend.data.sqlite_db import close_db, init_db
+    from backend.main import app
+
+    await init_db()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(args.users):
+            await client.post(
+                "/api/auth/register",
+                json={"username": f"storm{i}", "email": f"storm{i}@x.com", "password": "password123"},
+            )
+
+        print(f"users={args.users}, logins={args.logins}, concurrency={args.concurrency}, "
+              f"password workers={auth.password_executor.max_workers}")
+        print(f"{'case':>18} | {'logins/s':>8} | {'login p99':>9} | {'fail':>5} | "
+              f"{'gap p50':>7} | {'gap p99':>7} | {'gap max':>7}  (ms)")
+        await run_case(client, "no logins", args.users, 0, args.concurrency)
+
+        original_run = auth.password_executor.run
+
+        async def inline(fn, *fn_args):
+            return fn(*fn_args)
+
+        auth.password_executor.run = inline
+        try:
+            await run_case(client, "bcrypt on loop", args.users, args.logins, args.concurrency)
+        finally:
+            auth.password_executor.run = original_run
+        await run_case(client, "bcrypt executor", args.users, args.logins, args.concurrency)
+    await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_login_")
+    # 导入配置之前指定临时数据库，必填配置给占位值
+    os.environ["SQLITE_DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ.setdefault("NEO4J_PASSWORD", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+量化存储基准：float32 / float16 / int8 扫描精度下的内存、QPS 与 recall@k
+
+内存按「检索扫描需要常驻的字节数」折算到每百万片段（float32 为原始矩阵，
+量化模式为量化副本；float32 原始向量只在精排时按候选行读取）。
+recall@k 以 float32 精确检索为基准，量化模式分别给出不同精排倍数下的结果（x1 即不精排）。
+
+Usage:
+    python -m backend.benchmarks.bench_quantization --rows 200000 --rerank-factor 1 4
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from backend.benchmarks.bench_ann_index import clustered_vectors
+from backend.data.mmap_vector_store import MmapVectorStore
+
+
+def run_queries(store, queries, top_k):
+    results = []
+    t0 = time.perf_counter()
+    for q in queries:
+        results.append([row for row, _ in store.search(q, top_k)])
+    return results, len(queries) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.15)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = clustered_vectors(args.rows, args.dim, args.clusters, args.noise, rng)
+    picks = rng.integers(0, args.rows, args.queries)
+    queries = matrix[picks] + 0.3 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    records = [{"doc_id": str(i), "text": "", "metadata": {}} for i in range(args.rows)]
+
+    workdirs = []
+    try:
+        exact = None
+        print(f"rows={args.rows}, dim={args.dim}, top_k={args.top_k}")
+        print(f"{'precision':>14} | {'MB / 1M chunks':>14} | {'QPS':>8} | recall@{args.top_k}")
+        for precision in ("float32", "float16", "int8"):
+            workdir = tempfile.mkdtemp(prefix=f"bench_q_{precision}_")
+            workdirs.append(workdir)
+            writer = MmapVectorStore(workdir, dim=args.dim, precision=precision)
+            for start in range(0, args.rows, 50_000):
+                writer.add(matrix[start:start + 50_000], records[start:start + 50_000])
+
+            store = MmapVectorStore(workdir, precision=precision)
+            scan_bytes = store.quantized.nbytes if store.quantized is not None else store.matrix().nbytes
+            mb_per_million = scan_bytes / args.rows * 1_000_000 / 2**20
+            factors = [1] if precision == "float32" else args.rerank_factor
+            for factor in factors:
+                store.rerank_factor = factor
+                run_queries(store, queries[:5], args.top_k)  # 预热页缓存
+                results, qps = run_queries(store, queries, args.top_k)
+                if exact is None:
+                    exact = results
+                recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(results, exact)])
+                label = precision if precision == "float32" else f"{precision}/x{factor}"
+                print(f"{label:>14} | {mb_per_million:>14.0f} | {qps:>8.1f} | {recall:.3f}")
+    finally:
+        for workdir in workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
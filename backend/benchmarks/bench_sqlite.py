@@ -0,0 +1,156 @@
+"""
+SQLite 访问基准：注册 / 登录路径的数据库吞吐，对比每次请求新建连接（旧实现）与连接池
+
+注册 = 按用户名查重 + 按邮箱查重 + 插入提交，登录 = 按用户名查询；
+不含 bcrypt 计算，只衡量数据库访问本身。两种方式各用一个新的数据库文件
+（journal_mode 持久化在文件中，旧实现保持默认的回滚日志模式）。
+
+Usage:
+    python -m backend.benchmarks.bench_sqlite --users 2000 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import aiosqlite
+
+from backend.config import settings
+from backend.data.sqlite_db import SQLitePool, create_user, get_user_by_email, get_user_by_username
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        hashed_password TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+"""
+
+
+class LegacyAccess:
+    """旧实现：每次请求检查目录、新建连接（含工作线程），用完关闭"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def setup(self):
+        async with self.connection() as db:
+            await db.execute(_SCHEMA)
+            await db.commit()
+
+    @asynccontextmanager
+    async def connection(self):
+        db_dir = os.path.dirname(self.path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        db = await aiosqlite.connect(self.path)
+        db.row_factory = aiosqlite.Row
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    async def fetch_user(self, db, column: str, value: str):
+        cursor = await db.execute(f"SELECT * FROM users WHERE {column} = ?", (value,))
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+    async def register(self, name: str):
+        async with self.connection() as db:
+            if await self.fetch_user(db, "username", name) or await self.fetch_user(db, "email", f"{name}@x.com"):
+                return
+            await db.execute(
+                "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)",
+                (name, f"{name}@x.com", "hash", datetime.utcnow().isoformat()),
+            )
+            await db.commit()
+
+    async def login(self, name: str):
+        async with self.connection() as db:
+            return await self.fetch_user(db, "username", name)
+
+    async def close(self):
+        pass
+
+
+class PooledAccess:
+    """新实现：连接池 + sqlite_db 中的查询函数"""
+
+    def __init__(self, path: str, size: int):
+        self.pool = SQLitePool(path, size=size)
+
+    async def setup(self):
+        await self.pool.open()
+        async with self.pool.acquire() as db:
+            await db.execute(_SCHEMA)
+            await db.commit()
+
+    async def register(self, name: str):
+        async with self.pool.acquire() as db:
+            if await get_user_by_username(db, name) or await get_user_by_email(db, f"{name}@x.com"):
+                return
+            await create_user(db, name, f"{name}@x.com", "hash")
+
+    async def login(self, name: str):
+        async with self.pool.acquire() as db:
+            return await get_user_by_username(db, name)
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def run_phase(op, names, concurrency: int) -> float:
+    queue = list(names)
+
+    async def worker():
+        while queue:
+            await op(queue.pop())
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(names) / (time.perf_counter() - t0)
+
+
+async def bench(access, users: int, concurrency: int):
+    await access.setup()
+    try:
+        names = [f"user{i}" for i in range(users)]
+        register_qps = await run_phase(access.register, names, concurrency)
+        login_qps = await run_phase(access.login, names, concurrency)
+        return register_qps, login_qps
+    finally:
+        await access.close()
+
+
+async def main_async(args):
+    print(f"users={args.users}, pool_size={args.pool_size}（不含 bcrypt）")
+    print(f"{'access':>10} | {'concurrency':>11} | {'register/s':>10} | {'login/s':>8}")
+    workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    try:
+        for concurrency in args.concurrency:
+            for label in ("legacy", "pooled"):
+                path = os.path.join(workdir, f"{label}_{concurrency}.db")
+                access = LegacyAccess(path) if label == "legacy" else PooledAccess(path, args.pool_size)
+                register_qps, login_qps = await bench(access, args.users, concurrency)
+                print(f"{label:>10} | {concurrency:>11} | {register_qps:>10.0f} | {login_qps:>8.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--pool-size", type=int, default=settings.SQLITE_POOL_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
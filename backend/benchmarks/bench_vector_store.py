@@ -0,0 +1,89 @@
+"""
+向量存储基准：追加写入、冷启动映射、top-k 检索
+并与旧版「每次插入整库 JSON 重写」的持久化开销对比
+
+Usage:
+    python -m backend.benchmarks.bench_vector_store --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from backend.data.mmap_vector_store import MmapVectorStore
+
+
+def _percentile(samples, q):
+    return float(np.percentile(np.asarray(samples), q)) * 1000
+
+
+def bench_size(n: int, dim: int, batch: int, queries: int, top_k: int, json_baseline_max: int):
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    try:
+        store = MmapVectorStore(workdir, dim=dim)
+
+        # 1. 追加写入
+        t0 = time.perf_counter()
+        for start in range(0, n, batch):
+            size = min(batch, n - start)
+            vectors = rng.standard_normal((size, dim), dtype=np.float32)
+            records = [{"doc_id": str(start + i), "text": f"chunk {start + i}", "metadata": {}} for i in range(size)]
+            store.add(vectors, records)
+        ingest_s = time.perf_counter() - t0
+
+        # 2. 冷启动：重新打开并映射
+        t0 = time.perf_counter()
+        reopened = MmapVectorStore(workdir)
+        reopened.matrix()
+        open_s = time.perf_counter() - t0
+
+        # 3. 检索
+        latencies = []
+        for _ in range(queries):
+            q = rng.standard_normal(dim, dtype=np.float32)
+            t0 = time.perf_counter()
+            reopened.search(q, top_k)
+            latencies.append(time.perf_counter() - t0)
+
+        # 4. 对照：旧版每次插入都要序列化整个 embedding_dict
+        json_persist_ms = None
+        if n <= json_baseline_max:
+            embedding_dict = {str(i): row.tolist() for i, row in enumerate(reopened.matrix())}
+            t0 = time.perf_counter()
+            with open(os.path.join(workdir, "legacy.json"), "w") as f:
+                json.dump({"embedding_dict": embedding_dict}, f)
+            json_persist_ms = (time.perf_counter() - t0) * 1000
+
+        print(
+            f"n={n:>9,d} | ingest {n / ingest_s:>10,.0f} rows/s"
+            f" | open {open_s * 1000:>8.1f} ms"
+            f" | search p50 {_percentile(latencies, 50):>7.2f} ms p99 {_percentile(latencies, 99):>7.2f} ms"
+            f" | legacy persist/insert "
+            + (f"{json_persist_ms:>9.1f} ms" if json_persist_ms is not None else "      n/a")
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=512, help="bge-small-zh-v1.5 为 512 维")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--json-baseline-max", type=int, default=100_000,
+                        help="超过该规模时跳过 JSON 重写对照（过于耗时）")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        bench_size(n, args.dim, args.batch, args.queries, args.top_k, args.json_baseline_max)
+
+
+if __name__ == "__main__":
+    main()
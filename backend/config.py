@@ -21,17 +21,139 @@ class Settings(BaseSettings):
     NEO4J_URI: str = "bolt://localhost:7687"
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str
+    NEO4J_QUERY_TIMEOUT: float = 10.0  # 单次调用上限（秒），同时受请求截止时间约束
     
     # JWT 配置
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000  # 已验证 token 缓存条数，0 表示关闭
+    AUTH_REVOCATION_RECHECK_SECONDS: float = 60.0  # 缓存的 token 最长多久重新查询吊销表（其他 worker 上的注销最迟这么久后生效）
+    
+    # 密码哈希执行器（bcrypt）
+    PASSWORD_HASH_WORKERS: int = 2  # 并发计算的线程数
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # 最多排队的请求数，超出立即返回 503
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 5.0  # 排队超时（秒）
     
     # SQLite 数据库
     SQLITE_DB_PATH: str = "backend/storage/deepstudy.db"
+    SQLITE_POOL_SIZE: int = 4  # 连接池大小
+    SQLITE_MMAP_SIZE: int = 64 * 1024 * 1024  # PRAGMA mmap_size（字节）
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 写锁忙等待超时（毫秒）
+    SQLITE_CACHED_STATEMENTS: int = 128  # 每个连接缓存的预编译语句数
     
     # 向量存储
     VECTOR_STORE_PATH: str = "backend/storage/vector_store"
+    EMBED_MODEL_NAME: str = "BAAI/bge-small-zh-v1.5"
+    # 检索问题的指令前缀（BGE 中文模型的官方检索指令），文档片段不加；更换模型时需一并修改，空字符串表示不加
+    EMBED_QUERY_INSTRUCTION: str = "为这个句子生成表示以用于检索相关文章："
+    
+    # 向量子系统预热：background（启动后后台加载）或 lazy（首次使用时加载）
+    VECTOR_WARMUP: str = "background"
+    VECTOR_READY_TIMEOUT: float = 30.0  # 请求等待预热完成的最长秒数，超时返回 503
+    VECTOR_WARMUP_RETRIES: int = 5  # 预热失败后自动重试次数，用完后 /ready 返回 503
+    VECTOR_WARMUP_RETRY_SECONDS: float = 5.0  # 首次重试等待秒数，之后每次翻倍
+    VECTOR_WARMUP_RETRY_MAX_SECONDS: float = 300.0  # 重试等待上限
+    
+    # 向量索引：exact（精确）或 ivf（倒排近似检索）
+    VECTOR_INDEX: str = "ivf"
+    IVF_NLIST: int = 0  # 簇数，0 表示 sqrt(行数)
+    IVF_NPROBE: int = 16  # 检索时扫描的簇数
+    IVF_TRAIN_MIN_ROWS: int = 10_000  # 行数少于此值时使用精确检索
+    
+    # 检索扫描精度：float32 / float16 / int8（量化后用 float32 精排）
+    VECTOR_PRECISION: str = "float32"
+    VECTOR_RERANK_FACTOR: int = 4  # 量化扫描取 top_k 的多少倍候选精排
+    
+    # 检索方式：lexical / vector / hybrid（BM25 + 向量 RRF 融合，需显式开启：score 含义随之改变）
+    SEARCH_MODE: str = "vector"
+    HYBRID_CANDIDATES: int = 200  # 每一路的候选数
+    HYBRID_PRUNE: bool = True  # 关键词命中足够时，向量只对关键词候选打分
+    HYBRID_RRF_K: int = 60
+    BM25_K1: float = 1.5
+    BM25_B: float = 0.75
+    LEXICAL_MAX_DF: float = 0.5  # 文档频率超过该比例的查询词视为停用词
+    
+    # 检索结果缓存（按用户写入代数失效），0 表示关闭
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 2048
+    
+    # 预写日志：写入先追加到按组 fsync 的日志，检查点时再把主存储文件落盘
+    WAL_ENABLED: bool = True
+    WAL_GROUP_COMMIT_MS: float = 0.0  # 组提交额外等待并发写入的毫秒数（fsync 较慢的磁盘可调大）
+    WAL_CHECKPOINT_INTERVAL: float = 60.0  # 后台检查点间隔（秒）
+    WAL_CHECKPOINT_BYTES: int = 64 * 1024 * 1024  # 日志超过该大小时写入后立即做检查点
+    
+    # 向量化 / 索引执行器（thread 或 process）
+    VECTOR_EXECUTOR_KIND: str = "thread"
+    VECTOR_EXECUTOR_WORKERS: int = 2
+    VECTOR_EXECUTOR_QUEUE_TIMEOUT: float = 30.0  # 排队超时（秒）
+    
+    # 向量化微批
+    EMBED_BATCH_MAX_SIZE: int = 32
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # 片段向量缓存（按模型 + 内容哈希）
+    EMBED_CACHE_PATH: str = "backend/storage/embedding_cache.db"
+    EMBED_CACHE_MAX_ENTRIES: int = 200_000
+    
+    # 近似重复检测（MinHash + LSH）：skip / link / off
+    NEAR_DUP_MODE: str = "link"
+    NEAR_DUP_THRESHOLD: float = 0.85  # 估计 Jaccard 相似度阈值
+    NEAR_DUP_NUM_PERM: int = 64  # 签名长度
+    NEAR_DUP_BANDS: int = 16  # LSH band 数，须整除签名长度
+    NEAR_DUP_SHINGLE_SIZE: int = 3  # 字符 shingle 长度
+    
+    # 批量导入流水线
+    INGEST_STAGING_DIR: str = "backend/storage/ingest"  # 上传文件暂存目录
+    INGEST_READ_CHUNK_BYTES: int = 1024 * 1024  # 每次读取的字节数
+    INGEST_SEGMENT_CHARS: int = 8000  # 送入切片的段长度（字符）
+    INGEST_QUEUE_SIZE: int = 8  # 各级之间的队列长度
+    INGEST_EMBED_WORKERS: int = 2  # 并行向量化的协程数
+    INGEST_MAX_JOBS: int = 200  # 保留的已结束任务数
+    
+    # PDF 抽取（进程池）
+    PDF_EXECUTOR_WORKERS: int = 2
+    PDF_EXTRACT_TIMEOUT: float = 300.0  # 单个文档的解析时限（秒）
+    PDF_PAGES_PER_BATCH: int = 8  # 每次提交给子进程的页数
+    
+    # LLM 调度：所有模型调用共用的并发上限与每分钟 token 预算，交互请求优先于后台提炼，同优先级按用户轮转
+    LLM_MAX_CONCURRENCY: int = 16  # 同时进行的上游调用数
+    LLM_TOKENS_PER_MINUTE: int = 0  # 每分钟 token 预算（按服务商限额配置），0 表示不限
+    LLM_QUEUE_TIMEOUT: float = 30.0  # 排队超时（秒）
+    LLM_REQUEST_TIMEOUT: float = 60.0  # 非流式调用上限（秒）
+    LLM_STREAM_IDLE_TIMEOUT: float = 30.0  # 流式调用等待首个 / 下一个片段的上限（秒）
+    
+    # LLM 容错（按模型）：首字迟迟不来时发对冲请求，先出首字的胜出；连续失败后熔断，快速失败
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_QUANTILE: float = 0.95  # 对冲延迟取最近首字耗时的该分位
+    LLM_HEDGE_MIN_DELAY: float = 1.0  # 对冲延迟下限（秒）
+    LLM_RETRY_BUDGET_RATIO: float = 0.1  # 重试与对冲请求占正常调用的比例上限
+    LLM_BREAKER_FAILURES: int = 5  # 连续失败多少次后熔断
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # 熔断持续时间（秒），之后放行一个探测调用
+    
+    # 请求截止时间：在 /api/chat 入口设定，LLM / Neo4j / 向量检索按剩余时间限时
+    CHAT_DEADLINE_SECONDS: float = 120.0  # 回答阶段（上下文准备 + 流式生成）
+    CHAT_POSTPROCESS_SECONDS: float = 60.0  # 回答结束后的知识提炼与保存（回答已发出，单独计时）
+    
+    # 负载自适应降级：任一信号超过阈值即逐级关闭可选阶段（本地提炼 -> 推迟提炼 -> 跳过提炼与检索）
+    LOAD_SHED_ENABLED: bool = True
+    LOAD_SHED_LOOP_LAG_MS: float = 100.0  # 事件循环延迟（滑动平均）阈值
+    LOAD_SHED_LLM_QUEUE_DEPTH: int = 8  # LLM 调度队列深度阈值
+    LOAD_SHED_LLM_TTFT_SECONDS: float = 8.0  # 最近上游首字耗时 p90 阈值
+    LOAD_SHED_RECOVERY_SECONDS: float = 15.0  # 压力回落后持续多久降一级
+    LOAD_SHED_DEFERRED_MAX: int = 256  # 推迟的知识提炼最多保留条数
+    
+    # 对话检索预取：与意图识别、对话上下文查询并发检索用户笔记，超出预算的结果直接丢弃
+    RETRIEVAL_PREFETCH_ENABLED: bool = True
+    RETRIEVAL_PREFETCH_BUDGET_MS: int = 300  # 从收到问题起算的预算（毫秒）
+    RETRIEVAL_PREFETCH_TOP_K: int = 3  # 注入提示词的笔记片段数
+    
+    # 请求级性能剖析（cProfile）：口令为空且采样率为 0 时不安装剖析中间件
+    PROFILER_TOKEN: str = ""  # 携带 X-Profile-Token 的请求可用 X-Profile: 1 或 ?profile=1 开启剖析
+    PROFILER_SAMPLE_RATE: float = 0.0  # 随机采样比例（0~1）
+    PROFILER_PATHS: str = '["/api/chat","/api/mindmap"]'  # 允许剖析的路径前缀（JSON 字符串格式）
+    PROFILER_DIR: str = "backend/storage/profiles"
+    PROFILER_MAX_PROFILES: int = 50  # 磁盘上保留的剖析结果数
     
     # CORS
     CORS_ORIGINS: str = '["http://localhost:5173","http://localhost:3000"]'  # JSON 字符串格式
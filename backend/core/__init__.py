@@ -0,0 +1,4 @@
+"""
+Core 模块
+跨层共用的运行时基础设施（执行器、指标等）
+"""
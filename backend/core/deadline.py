@@ -0,0 +1,114 @@
+"""
+请求截止时间
+在请求入口设定一个截止时间（contextvars 传递，不需要逐层改函数签名），
+下游 LLM / Neo4j / 向量检索调用按剩余时间（再与各自的单次上限取小）设置超时，时间用完立即失败。
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Optional, TypeVar
+
+from backend.core.metrics import registry
+
+T = TypeVar("T")
+
+DEADLINE_EXCEEDED = registry.counter(
+    "deadline_exceeded_total", "因请求截止时间用完而失败或跳过的调用（stage）"
+)
+
+_current: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求截止时间已到"""
+
+
+def remaining() -> Optional[float]:
+    """当前请求剩余的秒数（可能为负）；没有设定截止时间时返回 None"""
+    deadline = _current.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """请求截止时间是否已到（用于区分超时是截止时间用完还是单次上限触发）"""
+    left = remaining()
+    # 事件循环的定时器可能提前一个时钟精度触发，留 1 毫秒余量
+    return left is not None and left <= 0.001
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    在本作用域内设定截止时间；已有更早的截止时间时保留更早的
+
+    Args:
+        seconds: 从现在起的秒数，None 表示不额外限制
+    """
+    deadline = _current.get()
+    if seconds is not None:
+        candidate = time.monotonic() + seconds
+        deadline = candidate if deadline is None else min(deadline, candidate)
+    token = _current.set(deadline)
+    try:
+        yield
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 包着 yield 的异步生成器可能在另一个上下文中被关闭（客户端断开后由事件循环回收），此时无需恢复
+            pass
+
+
+@contextmanager
+def no_deadline():
+    """在本作用域内清除截止时间（后台任务不继承创建它的请求的截止时间）"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass
+
+
+def timeout_for(stage: str, cap: Optional[float] = None) -> Optional[float]:
+    """
+    某次调用可用的超时：剩余时间与单次上限 cap 取小
+
+    Raises:
+        DeadlineExceeded: 剩余时间已用完（调用不必发出）
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded(f"{stage}: 请求截止时间已到")
+    return left if cap is None else min(left, cap)
+
+
+async def bounded(stage: str, awaitable: Awaitable[T], cap: Optional[float] = None) -> T:
+    """
+    在剩余时间（与 cap）内等待 awaitable，超时则取消并抛出 DeadlineExceeded
+
+    没有截止时间也没有 cap 时直接等待，不额外创建任务。
+    """
+    try:
+        timeout = timeout_for(stage, cap)
+    except DeadlineExceeded:
+        # 不再等待，关闭未启动的协程以免告警
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except DeadlineExceeded:
+        # 内层调用已经按截止时间失败
+        raise
+    except asyncio.TimeoutError:
+        DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded(f"{stage}: 超过 {timeout:.1f} 秒未完成") from None
@@ -0,0 +1,137 @@
+"""
+有界执行器
+把阻塞的 CPU / IO 工作（向量化、索引读写等）移出事件循环，
+并限制并发数与排队时间，避免单个大请求拖垮所有流式响应
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_QUEUE_WAIT = registry.histogram(
+    "executor_queue_wait_seconds", "任务在执行器前排队等待的时间"
+)
+EXECUTOR_RUN_TIME = registry.histogram(
+    "executor_run_seconds", "任务在执行器中的运行时间"
+)
+EXECUTOR_INFLIGHT = registry.gauge(
+    "executor_inflight", "执行器中正在运行的任务数"
+)
+EXECUTOR_REJECTED = registry.counter(
+    "executor_rejected_total", "因排队超时或队列已满被拒绝的任务数"
+)
+EXECUTOR_QUEUED = registry.gauge(
+    "executor_queued", "在执行器前排队等待的任务数"
+)
+
+
+class ExecutorBusyError(RuntimeError):
+    """执行器繁忙：排队等待超过 queue_timeout，或排队数已达 max_queue"""
+
+
+class BoundedExecutor:
+    """
+    有界执行器
+
+    对线程池 / 进程池做一层异步包装：同一时刻最多 max_workers 个任务在跑，
+    其余调用方在事件循环上等待空位，超过 queue_timeout 或排队数已达 max_queue 时抛出 ExecutorBusyError。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        kind: str = "thread",
+        queue_timeout: Optional[float] = 30.0,
+        max_queue: Optional[int] = None,
+    ):
+        """
+        初始化执行器
+
+        Args:
+            name: 执行器名称（用于线程名与指标标签）
+            max_workers: 最大并发任务数
+            kind: "thread" 或 "process"
+            queue_timeout: 排队超时（秒），None 表示无限等待
+            max_queue: 最多排队的任务数，超出时立即拒绝；None 表示不限
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"未知的执行器类型: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._waiting = 0
+        self._slots = asyncio.Semaphore(max_workers)
+        self._pool: Optional[Executor] = None
+
+    def _get_pool(self) -> Executor:
+        # 延迟创建：进程池启动较慢，且只有真正用到时才需要
+        if self._pool is None:
+            if self.kind == "process":
+                # spawn：避免 fork 已加载 torch 的父进程导致死锁
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                )
+            logger.info("执行器 %s 已创建: kind=%s, workers=%d", self.name, self.kind, self.max_workers)
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在执行器中运行阻塞函数
+
+        Args:
+            fn: 阻塞函数（进程池模式下必须可 pickle，即模块级函数）
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数返回值
+
+        Raises:
+            ExecutorBusyError: 排队超时或队列已满
+        """
+        if self.max_queue is not None and self._slots.locked() and self._waiting >= self.max_queue:
+            EXECUTOR_REJECTED.inc(executor=self.name)
+            raise ExecutorBusyError(f"执行器 {self.name} 繁忙，排队任务已达 {self.max_queue}")
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        EXECUTOR_QUEUED.inc(executor=self.name)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            EXECUTOR_REJECTED.inc(executor=self.name)
+            raise ExecutorBusyError(f"执行器 {self.name} 繁忙，排队超过 {self.queue_timeout}s")
+        finally:
+            self._waiting -= 1
+            EXECUTOR_QUEUED.dec(executor=self.name)
+
+        started_at = time.perf_counter()
+        EXECUTOR_QUEUE_WAIT.observe(started_at - queued_at, executor=self.name)
+        EXECUTOR_INFLIGHT.inc(executor=self.name)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+        finally:
+            EXECUTOR_INFLIGHT.dec(executor=self.name)
+            EXECUTOR_RUN_TIME.observe(time.perf_counter() - started_at, executor=self.name)
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭底层线程池 / 进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
@@ -0,0 +1,49 @@
+"""
+最近延迟样本窗口
+保留最近若干个、且不超过 max_age 秒的样本，按需计算分位数；供负载降级与对冲请求参考上游延迟。
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+class LatencyWindow:
+    """有界的延迟样本窗口（线程安全）"""
+
+    def __init__(self, max_samples: int = 256, max_age: float = 120.0):
+        """
+        Args:
+            max_samples: 最多保留的样本数
+            max_age: 样本有效期（秒），过期样本不参与计算，流量停止后窗口自然清空
+        """
+        self.max_age = max_age
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), value))
+
+    def _fresh(self):
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return [value for _, value in self._samples]
+
+    def __len__(self) -> int:
+        return len(self._fresh())
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        第 q 分位（0~1）的延迟
+
+        Returns:
+            有效样本少于 min_samples 时返回 None
+        """
+        values = self._fresh()
+        if len(values) < min_samples:
+            return None
+        values.sort()
+        return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,67 @@
+"""
+事件循环延迟监控
+周期性地 sleep 固定间隔，实际唤醒时间与预期之差即为事件循环被阻塞的时长
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_LAG_CURRENT = registry.gauge(
+    "event_loop_lag_current_seconds", "最近一次采样的事件循环调度延迟"
+)
+
+
+class EventLoopLagMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(self, interval: float = 0.1, warn_threshold: float = 0.5):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            warn_threshold: 超过该延迟时记录警告日志（秒）
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.last_lag = 0.0
+        # 指数滑动平均（约最近 1 秒），供负载降级判断，避免单次抖动触发
+        self.smoothed_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.last_lag = lag
+            self.smoothed_lag += 0.2 * (lag - self.smoothed_lag)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_CURRENT.set(lag)
+            if lag > self.warn_threshold:
+                logger.warning("事件循环被阻塞 %.0f ms", lag * 1000)
+
+
+# 全局监控器
+loop_lag_monitor = EventLoopLagMonitor()
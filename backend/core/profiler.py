@@ -0,0 +1,104 @@
+"""
+请求级性能剖析结果的存储
+每个剖析结果保存为 <id>.prof（pstats 格式）+ <id>.json（请求信息），目录中只保留最近的若干个。
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 剖析 ID：时间戳 + 随机后缀，按名字排序即按时间排序
+_PROFILE_ID = re.compile(r"^\d{8}T\d{12}_[0-9a-f]{8}$")
+
+SORT_KEYS = ("cumulative", "tottime", "calls")
+
+
+def new_profile_id() -> str:
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{uuid.uuid4().hex[:8]}"
+
+
+class ProfileStore:
+    """
+    磁盘上的剖析结果环形缓冲
+
+    写入在线程池中进行，淘汰与写入由同一把锁串行化。
+    """
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        """
+        Args:
+            directory: 存放目录
+            max_profiles: 最多保留的剖析结果数，超出后删除最旧的
+        """
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def _paths(self, profile_id: str):
+        base = os.path.join(self.directory, profile_id)
+        return base + ".prof", base + ".json"
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def save(self, profile_id: str, profile: cProfile.Profile, meta: Dict) -> None:
+        """写入一个剖析结果并淘汰超出上限的旧结果"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            prof_path, meta_path = self._paths(profile_id)
+            profile.dump_stats(prof_path)
+            # 元数据最后写入：列表只认有 .json 的结果，半写的 .prof 不会被读到
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"id": profile_id, **meta}, f, ensure_ascii=False)
+            ids = self._ids()
+            for stale in ids[: max(0, len(ids) - self.max_profiles)]:
+                for path in self._paths(stale):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> List[Dict]:
+        """最近的剖析结果（新的在前）"""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._paths(profile_id)[1], encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # 读取期间被淘汰
+                continue
+        return profiles
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        """剖析结果的 .prof 文件路径；ID 非法或已被淘汰时返回 None"""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        prof_path, meta_path = self._paths(profile_id)
+        if not (os.path.exists(prof_path) and os.path.exists(meta_path)):
+            return None
+        return prof_path
+
+    def render_text(self, profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        """pstats 文本报告（按 sort 排序的前 limit 个函数）"""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        try:
+            stats = pstats.Stats(path, stream=out)
+        except FileNotFoundError:
+            return None
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,350 @@
+"""
+向量检索索引（可插拔）
+- ExactIndex: 全量矩阵点积，结果精确
+- IVFIndex: 倒排文件索引（球面 k-means 聚类），只扫描最近的 nprobe 个簇，
+  以可调的召回率换取亚线性的检索延迟
+
+索引文件与向量文件放在同一目录，随 add 增量更新。
+"""
+import functools
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """从得分数组中选出 top-k（argpartition 为 O(n)，只对 k 个结果排序）"""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return []
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return [(int(i), float(scores[i])) for i in idx]
+
+
+class VectorIndex(ABC):
+    """向量索引接口：决定检索时对哪些行打分"""
+
+    def load(self, matrix: np.ndarray) -> None:
+        """打开存储时加载索引（matrix 为已有的全部向量）"""
+
+    @abstractmethod
+    def add(self, start_row: int, vectors: np.ndarray, matrix: np.ndarray) -> None:
+        """
+        登记新写入的行
+
+        Args:
+            start_row: 第一条新向量的行号
+            vectors: 新向量（已归一化）
+            matrix: 写入后的全部向量
+        """
+
+    @abstractmethod
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """
+        检索
+
+        Args:
+            matrix: 全部向量
+            query: 已归一化的查询向量
+            top_k: 返回条数
+
+        Returns:
+            按得分降序的 (行号, 得分) 列表
+        """
+
+
+class ExactIndex(VectorIndex):
+    """精确检索：对全部行打分"""
+
+    def add(self, start_row: int, vectors: np.ndarray, matrix: np.ndarray) -> None:
+        pass
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        return top_k_rows(matrix @ query, top_k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    倒排文件 (IVF) 索引
+
+    行数达到 train_min_rows 前退化为精确检索；之后训练 nlist 个簇心，
+    每条新向量追加到最近簇的倒排表。语料规模增长到上次训练时的 retrain_factor 倍时重新训练，
+    保持各簇大小均衡。
+
+    配置了 background 时，写入触发的训练在后台进行：对写入时的矩阵快照做 k-means 与全量分配，
+    期间写入照常按旧簇心（或精确检索）登记；训练完成后短暂持有写入锁，
+    只为训练期间新增的行分配簇并替换索引。
+
+    目录结构:
+        ivf.json          训练信息（簇数、训练时行数）
+        ivf_centroids.npy 簇心矩阵
+        ivf_assign.i32    每行所属簇编号（追加写入，与向量行号对齐）
+    """
+
+    META_FILE = "ivf.json"
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    ASSIGN_FILE = "ivf_assign.i32"
+
+    def __init__(
+        self,
+        path: str,
+        nlist: int = 0,
+        nprobe: int = 16,
+        train_min_rows: int = 10_000,
+        retrain_factor: float = 4.0,
+        kmeans_iters: int = 10,
+        background: Optional[Callable[[Callable[[], None]], None]] = None,
+    ):
+        """
+        Args:
+            path: 索引目录（与向量文件同目录）
+            nlist: 簇数，0 表示训练时取 sqrt(行数)
+            nprobe: 检索时扫描的簇数，越大召回越高、延迟越大
+            train_min_rows: 开始使用 IVF 的最小行数
+            retrain_factor: 行数增长到上次训练时的多少倍后重新训练
+            kmeans_iters: k-means 迭代次数
+            background: 提交后台任务的函数（参数为无参函数），None 时在写入调用中同步训练
+        """
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min_rows = train_min_rows
+        self.retrain_factor = retrain_factor
+        self.kmeans_iters = kmeans_iters
+        self.background = background
+
+        self._meta_path = os.path.join(path, self.META_FILE)
+        self._centroids_path = os.path.join(path, self.CENTROIDS_FILE)
+        self._assign_path = os.path.join(path, self.ASSIGN_FILE)
+
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_rows = 0
+        self._indexed_rows = 0
+        self._lists: List[np.ndarray] = []
+        self._pending: List[List[int]] = []
+        # 保护倒排表：检索线程会合并 pending，写入线程会追加 pending
+        self._lock = threading.Lock()
+        # 串行化增量登记与后台训练结果的替换
+        self._write_lock = threading.Lock()
+        self._training = False
+        self._latest: Optional[np.ndarray] = None  # 最近一次 add 时的全部向量
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # ==============================
+    # 加载与持久化
+    # ==============================
+
+    def load(self, matrix: np.ndarray) -> None:
+        """加载索引文件，并补齐 / 截断与向量文件不一致的尾部"""
+        if not (os.path.exists(self._meta_path) and os.path.exists(self._centroids_path)):
+            if len(matrix) >= self.train_min_rows:
+                self._train(matrix)
+            return
+
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            self.trained_rows = int(json.load(f)["trained_rows"])
+        centroids = np.load(self._centroids_path)
+        assign = np.fromfile(self._assign_path, dtype=np.int32) if os.path.exists(self._assign_path) else np.empty(0, np.int32)
+
+        if len(assign) > len(matrix):
+            assign = assign[:len(matrix)]
+            with open(self._assign_path, "r+b") as f:
+                f.truncate(len(assign) * 4)
+        self._build_lists(assign, centroids)
+        if self._indexed_rows < len(matrix):
+            self.add(self._indexed_rows, matrix[self._indexed_rows:], matrix)
+        logger.info("IVF 索引已加载: lists=%d, rows=%d", len(self.centroids), self._indexed_rows)
+
+    @staticmethod
+    def _make_lists(assign: np.ndarray, nlist: int) -> List[np.ndarray]:
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+
+    def _build_lists(self, assign: np.ndarray, centroids: np.ndarray) -> None:
+        lists = self._make_lists(assign, len(centroids))
+        with self._lock:
+            self.centroids = centroids
+            self._lists = lists
+            self._pending = [[] for _ in range(len(centroids))]
+            self._indexed_rows = len(assign)
+
+    def _save_training(self, assign: np.ndarray, centroids: np.ndarray) -> None:
+        assign.astype(np.int32).tofile(self._assign_path + ".tmp")
+        self._commit_training(centroids)
+
+    def _commit_training(self, centroids: np.ndarray) -> None:
+        """替换簇心与训练信息，并把已写好的 ivf_assign.i32.tmp 换上"""
+        np.save(self._centroids_path + ".tmp.npy", centroids)
+        os.replace(self._centroids_path + ".tmp.npy", self._centroids_path)
+        os.replace(self._assign_path + ".tmp", self._assign_path)
+        with open(self._meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"nlist": len(centroids), "trained_rows": self.trained_rows}, f)
+        os.replace(self._meta_path + ".tmp", self._meta_path)
+
+    # ==============================
+    # 训练与增量写入
+    # ==============================
+
+    def _kmeans(self, matrix: np.ndarray) -> np.ndarray:
+        """在抽样上训练簇心（不访问索引状态，可在任意线程中运行）"""
+        n = len(matrix)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample_size = min(n, nlist * 64)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))])
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            # 按簇求和：排序后分段 reduceat，比 np.add.at 快一个数量级
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # 空簇重新随机取点
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def _train(self, matrix: np.ndarray) -> None:
+        """同步训练（加载时，或未配置 background 时）"""
+        centroids = self._kmeans(matrix)
+        self.trained_rows = len(matrix)
+        assign = self._assign(matrix, centroids)
+        self._save_training(assign, centroids)
+        self._build_lists(assign, centroids)
+        logger.info("IVF 索引训练完成: rows=%d, lists=%d", len(matrix), len(centroids))
+
+    def _train_in_background(self, snapshot: np.ndarray) -> None:
+        """后台训练：耗时部分不持锁，完成后在写入锁内补齐训练期间新增的行并替换"""
+        try:
+            n = len(snapshot)
+            centroids = self._kmeans(snapshot)
+            assign = self._assign(snapshot, centroids)
+            lists = self._make_lists(assign, len(centroids))
+            assign.tofile(self._assign_path + ".tmp")
+            with self._write_lock:
+                latest = self._latest
+                tail = self._assign(latest[n:], centroids)
+                with open(self._assign_path + ".tmp", "ab") as f:
+                    f.write(tail.tobytes())
+                self.trained_rows = n
+                self._commit_training(centroids)
+                with self._lock:
+                    self.centroids = centroids
+                    self._lists = lists
+                    self._pending = [[] for _ in range(len(centroids))]
+                    for offset, list_id in enumerate(tail):
+                        self._pending[list_id].append(n + offset)
+                    self._indexed_rows = len(latest)
+            logger.info("IVF 索引后台训练完成: rows=%d, lists=%d, 训练期间新增 %d 行", n, len(centroids), len(tail))
+        except Exception as e:
+            logger.error("IVF 索引后台训练失败（继续使用原索引）: %s", e, exc_info=True)
+        finally:
+            self._training = False
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block):
+            out[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        return out
+
+    def _needs_training(self, total: int) -> bool:
+        if not self.trained:
+            return total >= self.train_min_rows
+        return total >= self.trained_rows * self.retrain_factor
+
+    def add(self, start_row: int, vectors: np.ndarray, matrix: np.ndarray) -> None:
+        total = start_row + len(vectors)
+        with self._write_lock:
+            self._latest = matrix
+            if self._needs_training(total) and not self._training:
+                if self.background is None:
+                    self._train(matrix)
+                    return
+                # matrix 是写入时的只读映射，行数固定，可作为训练快照
+                self._training = True
+                try:
+                    self.background(functools.partial(self._train_in_background, matrix))
+                except Exception:
+                    self._training = False
+                    raise
+            if not self.trained:
+                return
+
+            assign = self._assign(vectors, self.centroids)
+            with open(self._assign_path, "ab") as f:
+                f.write(assign.tobytes())
+            with self._lock:
+                for offset, list_id in enumerate(assign):
+                    self._pending[list_id].append(start_row + offset)
+                self._indexed_rows = total
+
+    # ==============================
+    # 检索
+    # ==============================
+
+    def _list_rows(self, list_id: int) -> np.ndarray:
+        # 调用方需持有 self._lock
+        if self._pending[list_id]:
+            self._lists[list_id] = np.concatenate(
+                [self._lists[list_id], np.asarray(self._pending[list_id], dtype=np.int64)]
+            )
+            self._pending[list_id] = []
+        return self._lists[list_id]
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """返回最近 nprobe 个簇内的全部行号"""
+        with self._lock:
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            centroid_scores = self.centroids @ query
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            rows = [self._list_rows(int(i)) for i in probe]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if not self.trained:
+            return top_k_rows(matrix @ query, top_k)
+        rows = self.candidates(query)
+        # 检索开始后新写入的行不在 matrix 快照内
+        rows = np.sort(rows[rows < len(matrix)])  # 排序后顺序读取内存映射
+        if len(rows) == 0:
+            return []
+        scores = matrix[rows] @ query
+        return [(int(rows[i]), score) for i, score in top_k_rows(scores, top_k)]
+
+
+def create_index(kind: str, path: str, **params) -> VectorIndex:
+    """
+    按名称创建索引
+
+    Args:
+        kind: "exact" 或 "ivf"
+        path: 索引目录
+        **params: 索引参数（IVF: nlist / nprobe / train_min_rows / background）
+    """
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex(path, **params)
+    raise ValueError(f"未知的向量索引类型: {kind}")
@@ -0,0 +1,170 @@
+"""
+片段向量缓存
+以 (Embedding 模型 ID, 片段文本 SHA-256) 为键持久化向量，重复上传的笔记/讲义无需再次计算。
+容量有上限，按最近使用时间 (LRU) 淘汰；模型变化时整体失效。
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = registry.counter(
+    "embedding_cache_requests_total", "片段向量缓存查询次数（按命中 / 未命中）"
+)
+CACHE_EVICTIONS = registry.counter(
+    "embedding_cache_evictions_total", "片段向量缓存淘汰条数"
+)
+
+
+def text_hash(text: str) -> bytes:
+    """片段文本的内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    持久化 LRU 向量缓存（SQLite）
+
+    所有方法都是阻塞调用，应在执行器中运行。
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        """
+        Args:
+            path: SQLite 文件路径
+            max_entries: 最大缓存条数，超出后淘汰最久未使用的 10%
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.model_id: Optional[str] = None
+
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_id, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+        """)
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def bind_model(self, model_id: str) -> None:
+        """
+        绑定当前 Embedding 模型；与缓存中记录的模型不同则清空缓存
+
+        Args:
+            model_id: 模型标识（模型名等）
+        """
+        if model_id == self.model_id:
+            return
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'model_id'"
+            ).fetchone()
+            if row is not None and row[0] != model_id:
+                logger.info("Embedding 模型已从 %s 变为 %s，清空向量缓存", row[0], model_id)
+                self._conn.execute("DELETE FROM embeddings")
+                self._count = 0
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('model_id', ?)",
+                (model_id,),
+            )
+            self._conn.commit()
+            self.model_id = model_id
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存
+
+        Returns:
+            与 texts 一一对应的向量，未命中为 None
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(hashes), 900):
+                chunk = hashes[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    (self.model_id, *chunk),
+                ).fetchall()
+                found.update((bytes(h), v) for h, v in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND text_hash = ?",
+                    [(now, self.model_id, h) for h in found],
+                )
+                self._conn.commit()
+
+        results = []
+        for h in hashes:
+            blob = found.get(h)
+            results.append(np.frombuffer(blob, dtype=np.float32).copy() if blob is not None else None)
+        hits = sum(1 for r in results if r is not None)
+        CACHE_REQUESTS.inc(hits, result="hit")
+        CACHE_REQUESTS.inc(len(results) - hits, result="miss")
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """批量写入缓存，必要时按 LRU 淘汰"""
+        now = time.time()
+        rows = [
+            (self.model_id, text_hash(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model_id, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        target = int(self.max_entries * 0.9)
+        excess = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._count = target
+        CACHE_EVICTIONS.inc(excess)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
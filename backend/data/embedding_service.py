@@ -0,0 +1,138 @@
+"""
+向量化微批服务
+把并发到达的短请求（检索问题、小段笔记）攒成一批，
+在 max_wait_ms 内或凑满 max_batch_size 后做一次批量前向计算，再分发给各调用方。
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend.core.executor import BoundedExecutor
+from backend.core.metrics import registry
+from backend.data.embedding_worker import embed_queries, embed_texts
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = registry.histogram(
+    "embedding_batch_size",
+    "每次批量前向计算处理的条数",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+BATCH_WAIT = registry.histogram(
+    "embedding_batch_wait_seconds",
+    "请求从入队到所在批次开始计算的等待时间",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+BATCH_RUN = registry.histogram(
+    "embedding_batch_run_seconds", "一次批量前向计算的耗时"
+)
+
+# 两条通道分别对应不同的前向函数：问题需要加检索指令，文档片段不需要
+_BATCH_FUNCS = {
+    "query": embed_queries,
+    "text": embed_texts,
+}
+
+_Pending = Tuple[str, asyncio.Future, float]
+
+
+class EmbeddingService:
+    """
+    向量化微批服务
+
+    调用方只看到单条 / 多条的异步接口；服务内部按通道排队，
+    到达批大小上限立即发车，否则等待 max_wait_ms 后把已到达的请求一起发车。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        executor: BoundedExecutor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        batch_funcs: Optional[Dict[str, Callable]] = None,
+    ):
+        """
+        Args:
+            model_name: Embedding 模型名
+            executor: 执行批量前向计算的执行器
+            max_batch_size: 单批最大条数
+            max_wait_ms: 凑批最长等待时间（毫秒）
+            batch_funcs: 各通道的批量前向函数，默认使用 embedding_worker 中的实现
+        """
+        self.model_name = model_name
+        self.batch_funcs = batch_funcs or _BATCH_FUNCS
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: Dict[str, List[_Pending]] = {kind: [] for kind in self.batch_funcs}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # 持有批次任务的引用，防止被垃圾回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """向量化一条检索问题"""
+        return (await self._submit("query", [query]))[0]
+
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """向量化多条文档片段，返回形状为 (n, dim) 的矩阵"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack(await self._submit("text", texts))
+
+    async def _submit(self, kind: str, texts: List[str]) -> List[np.ndarray]:
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        futures = [loop.create_future() for _ in texts]
+        pending = self._pending[kind]
+        pending.extend((text, fut, now) for text, fut in zip(texts, futures))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(kind)
+        elif kind not in self._timers:
+            self._timers[kind] = loop.call_later(self.max_wait, self._flush, kind)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self, kind: str) -> None:
+        """发车：每 max_batch_size 条为一批提交到执行器"""
+        timer = self._timers.pop(kind, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self._pending[kind]
+        while pending:
+            batch = pending[:self.max_batch_size]
+            del pending[:self.max_batch_size]
+            task = asyncio.get_running_loop().create_task(self._run_batch(kind, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, kind: str, batch: List[_Pending]) -> None:
+        # 调用方已取消（如客户端断开）的请求不再计算
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        started_at = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            BATCH_WAIT.observe(started_at - enqueued_at, kind=kind)
+        BATCH_SIZE.observe(len(batch), kind=kind)
+
+        try:
+            vectors = await self.executor.run(
+                self.batch_funcs[kind], self.model_name, [text for text, _, _ in batch]
+            )
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            BATCH_RUN.observe(time.perf_counter() - started_at, kind=kind)
+
+        for (_, fut, _), vector in zip(batch, vectors):
+            if not fut.done():
+                fut.set_result(vector)
@@ -0,0 +1,65 @@
+"""
+向量化工作函数
+均为模块级函数：既可在线程池中调用，也可被 pickle 到 spawn 进程池中执行。
+每个进程按模型名缓存一份 HuggingFace 模型。
+"""
+import logging
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+_fallback_warned = False
+
+
+def get_embed_model(model_name: str):
+    """获取（并缓存）当前进程内的 Embedding 模型"""
+    model = _models.get(model_name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(model_name)
+            if model is None:
+                os.environ.setdefault("HF_ENDPOINT", "https://hf-mirror.com")
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+                # 显式指定检索指令，单条 get_query_embedding 与批量路径的结果一致
+                model = _models[model_name] = HuggingFaceEmbedding(
+                    model_name=model_name,
+                    query_instruction=settings.EMBED_QUERY_INSTRUCTION,
+                    text_instruction="",
+                )
+    return model
+
+
+def embed_texts(model_name: str, texts: List[str]) -> np.ndarray:
+    """批量向量化文档片段"""
+    embeddings = get_embed_model(model_name).get_text_embedding_batch(texts)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def embed_queries(model_name: str, queries: List[str]) -> np.ndarray:
+    """
+    批量向量化检索问题
+
+    HuggingFaceEmbedding 只提供单条 get_query_embedding，这里按 EMBED_QUERY_INSTRUCTION 加上检索指令前缀
+    （与模型构造时的 query_instruction 相同）后走批量文本接口，使一次前向计算即可处理多条问题。
+    """
+    global _fallback_warned
+    model = get_embed_model(model_name)
+    if not hasattr(model, "get_text_embedding_batch"):
+        # 不支持批量接口的模型：逐条计算，指令由模型自己添加
+        if not _fallback_warned:
+            _fallback_warned = True
+            logger.warning("Embedding 模型 %s 不支持批量接口，检索问题改为逐条向量化", model_name)
+        return np.asarray([model.get_query_embedding(q) for q in queries], dtype=np.float32)
+
+    instruction = settings.EMBED_QUERY_INSTRUCTION
+    formatted = [f"{instruction}{q}" for q in queries] if instruction else list(queries)
+    return np.asarray(model.get_text_embedding_batch(formatted), dtype=np.float32)
@@ -0,0 +1,512 @@
+"""
+批量文档导入流水线
+上传文件按块落盘后立即返回任务 ID，后台按「解码 -> 切片 -> 向量化 -> 写索引」四级流水线处理：
+各级之间是有界队列（反压，内存占用与文件大小无关），向量化级可并行。
+PDF 在进程池中按页批抽取，每批页面抽出后立即进入切片，大部头教材不必等整本解析完就可检索。
+"""
+import asyncio
+import codecs
+import logging
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from backend.config import settings
+from backend.core.executor import BoundedExecutor
+from backend.core.metrics import registry
+from backend.data.pdf_worker import count_pages, extract_pages
+from backend.data.vector_store import vector_store_manager
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNKS = registry.counter(
+    "ingest_chunks_indexed_total", "批量导入写入索引的片段数"
+)
+INGEST_BYTES = registry.counter(
+    "ingest_bytes_decoded_total", "批量导入解码的字节数"
+)
+PDF_PAGES = registry.counter(
+    "pdf_pages_extracted_total", "抽取的 PDF 页数"
+)
+PDF_TIMEOUTS = registry.counter(
+    "pdf_extract_timeouts_total", "超过单文档时限的 PDF 数"
+)
+
+# 支持直接解码的文本格式
+TEXT_SUFFIXES = (".md", ".txt")
+PDF_SUFFIXES = (".pdf",)
+ARCHIVE_SUFFIXES = (".zip",)
+
+# 流水线结束标记
+_DONE = object()
+
+
+class IngestionJob:
+    """批量导入任务（进度与吞吐）"""
+
+    def __init__(self, user_id: str, course: Optional[str]):
+        self.job_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.course = course
+        self.status = "queued"  # queued / running / completed / failed
+        self.files_total = 0
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_partial = 0  # 中途失败但已有部分内容入库的文件（如超时的 PDF）
+        self.bytes_total = 0
+        self.bytes_read = 0
+        self.pages_extracted = 0
+        self.chunks_embedded = 0
+        self.chunks_indexed = 0
+        self.chunks_deduplicated = 0  # 近似重复、未写入向量的片段（= skipped + linked）
+        self.chunks_skipped = 0
+        self.chunks_linked = 0
+        self.errors: List[str] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def count_duplicates(self, count: int, mode: str) -> None:
+        """累计近似重复片段：skip 模式计入丢弃数，link 模式计入合并为来源链接的片段数"""
+        if not count:
+            return
+        self.chunks_deduplicated += count
+        if mode == "link":
+            self.chunks_linked += count
+        else:
+            self.chunks_skipped += count
+
+    def to_dict(self) -> Dict:
+        """任务状态（供 API 返回）"""
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "course": self.course,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_skipped": self.files_skipped,
+            "files_partial": self.files_partial,
+            "bytes_total": self.bytes_total,
+            "bytes_read": self.bytes_read,
+            "pages_extracted": self.pages_extracted,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_indexed": self.chunks_indexed,
+            "chunks_deduplicated": self.chunks_deduplicated,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_linked": self.chunks_linked,
+            "progress": round(self.bytes_read / self.bytes_total, 4) if self.bytes_total else 0.0,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput": {
+                "chunks_per_second": round(self.chunks_indexed / elapsed, 2) if elapsed else 0.0,
+                "mb_per_second": round(self.bytes_read / elapsed / 1e6, 3) if elapsed else 0.0,
+            },
+            "errors": self.errors,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat(),
+        }
+
+
+class _StagedSource:
+    """一个待解码的文本源（落盘文件或压缩包成员）"""
+
+    def __init__(self, name: str, path: str, member: Optional[str] = None, size: int = 0):
+        self.name = name
+        self.path = path
+        self.member = member
+        self.size = size
+        self.doc_id = str(uuid.uuid4())
+
+    def open(self):
+        if self.member is None:
+            return open(self.path, "rb")
+        archive = zipfile.ZipFile(self.path)
+        return _ArchiveMember(archive, archive.open(self.member))
+
+    def materialize(self, staging_dir: str) -> str:
+        """返回可按路径打开的文件（压缩包成员先解压到暂存目录）"""
+        if self.member is None:
+            return self.path
+        target = os.path.join(staging_dir, self.doc_id + os.path.splitext(self.member)[1])
+        with zipfile.ZipFile(self.path) as archive, archive.open(self.member) as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return target
+
+
+class _ArchiveMember:
+    """压缩包成员流：关闭时一并关闭压缩包"""
+
+    def __init__(self, archive: zipfile.ZipFile, stream):
+        self._archive = archive
+        self._stream = stream
+
+    def read(self, n: int) -> bytes:
+        return self._stream.read(n)
+
+    def close(self) -> None:
+        self._stream.close()
+        self._archive.close()
+
+
+class IngestionPipeline:
+    """批量导入流水线与任务登记"""
+
+    def __init__(self, vector_store_manager):
+        """
+        Args:
+            vector_store_manager: 向量知识库管理器（提供 split_text / embed_chunks / index_chunks）
+        """
+        self.vsm = vector_store_manager
+        self.staging_dir = settings.INGEST_STAGING_DIR
+        self.read_chunk_bytes = settings.INGEST_READ_CHUNK_BYTES
+        self.segment_chars = settings.INGEST_SEGMENT_CHARS
+        self.queue_size = settings.INGEST_QUEUE_SIZE
+        self.embed_workers = settings.INGEST_EMBED_WORKERS
+        self.max_jobs = settings.INGEST_MAX_JOBS
+        self.pdf_timeout = settings.PDF_EXTRACT_TIMEOUT
+        self.pdf_pages_per_batch = settings.PDF_PAGES_PER_BATCH
+        # 落盘与读盘：小块阻塞 IO，独立于向量执行器
+        self.io_executor = BoundedExecutor("ingest-io", max_workers=4, queue_timeout=None)
+        # PDF 解析是纯 Python 的 CPU 密集任务，放进独立进程避免占用 GIL
+        self.pdf_executor = BoundedExecutor(
+            "pdf", max_workers=settings.PDF_EXECUTOR_WORKERS, kind="process", queue_timeout=None
+        )
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    # ==============================
+    # 任务登记
+    # ==============================
+
+    def get_job(self, job_id: str, user_id: str) -> Optional[IngestionJob]:
+        """获取任务（只能查看自己的任务）"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def list_jobs(self, user_id: str) -> List[IngestionJob]:
+        return [job for job in reversed(self._jobs.values()) if job.user_id == user_id]
+
+    def _register(self, job: IngestionJob) -> None:
+        self._jobs[job.job_id] = job
+        # 只保留最近 max_jobs 个任务，跳过仍在运行的
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].status in ("completed", "failed"):
+                del self._jobs[job_id]
+
+    # ==============================
+    # 提交：按块落盘
+    # ==============================
+
+    async def submit(self, user_id: str, course: Optional[str], uploads: List[UploadFile]) -> IngestionJob:
+        """
+        接收上传文件并启动后台导入
+
+        上传内容按 read_chunk_bytes 分块读取并写入暂存目录，不会整文件读入内存。
+
+        Args:
+            user_id: 所属用户
+            course: 所属课程
+            uploads: 上传文件（.md / .txt / .pdf / .zip）
+
+        Returns:
+            已登记的任务
+        """
+        job = IngestionJob(user_id, course)
+        job_dir = os.path.join(self.staging_dir, job.job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        sources: List[_StagedSource] = []
+        for index, upload in enumerate(uploads):
+            filename = upload.filename or f"upload_{index}"
+            lower = filename.lower()
+            if not lower.endswith(self.supported_suffixes()):
+                job.files_skipped += 1
+                job.errors.append(f"{filename}: 暂不支持该文件格式")
+                continue
+
+            path = os.path.join(job_dir, f"{index}_{os.path.basename(filename)}")
+            size = await self._spool(upload, path)
+            if lower.endswith(ARCHIVE_SUFFIXES):
+                try:
+                    members = await self.io_executor.run(self._list_archive, path)
+                except zipfile.BadZipFile:
+                    job.files_skipped += 1
+                    job.errors.append(f"{filename}: 压缩包已损坏")
+                    continue
+                for member, member_size in members:
+                    sources.append(_StagedSource(f"{filename}/{member}", path, member, member_size))
+            else:
+                sources.append(_StagedSource(filename, path, size=size))
+
+        job.files_total = len(sources)
+        job.bytes_total = sum(source.size for source in sources)
+        self._register(job)
+        self._tasks[job.job_id] = asyncio.get_running_loop().create_task(self._run(job, sources, job_dir))
+        logger.info("批量导入任务已提交: job_id=%s, files=%d, bytes=%d", job.job_id, job.files_total, job.bytes_total)
+        return job
+
+    def supported_suffixes(self) -> Tuple[str, ...]:
+        return TEXT_SUFFIXES + PDF_SUFFIXES + ARCHIVE_SUFFIXES
+
+    async def wait(self, job: IngestionJob) -> IngestionJob:
+        """等待任务结束"""
+        task = self._tasks.get(job.job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return job
+
+    async def _spool(self, upload: UploadFile, path: str) -> int:
+        size = 0
+        f = await self.io_executor.run(open, path, "wb")
+        try:
+            while True:
+                block = await upload.read(self.read_chunk_bytes)
+                if not block:
+                    break
+                size += len(block)
+                await self.io_executor.run(f.write, block)
+        finally:
+            await self.io_executor.run(f.close)
+        return size
+
+    def _list_archive(self, path: str) -> List[Tuple[str, int]]:
+        with zipfile.ZipFile(path) as archive:
+            return [
+                (info.filename, info.file_size)
+                for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(TEXT_SUFFIXES + PDF_SUFFIXES)
+            ]
+
+    # ==============================
+    # 流水线
+    # ==============================
+
+    async def _run(self, job: IngestionJob, sources: List[_StagedSource], job_dir: str) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        split_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embed_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        index_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+
+        stages = [
+            self._decode_stage(job, sources, split_q, job_dir),
+            self._split_stage(job, split_q, embed_q),
+            self._index_stage(job, index_q),
+        ]
+        embedders = [self._embed_stage(job, embed_q, index_q) for _ in range(self.embed_workers)]
+        tasks = [asyncio.ensure_future(stage) for stage in stages + embedders]
+        try:
+            # 任意一级异常即整体失败
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+            await asyncio.gather(*tasks)
+            job.status = "completed"
+        except Exception as e:
+            logger.error("批量导入任务失败: job_id=%s, %s", job.job_id, e, exc_info=True)
+            job.status = "failed"
+            job.errors.append(str(e))
+            for task in tasks:
+                task.cancel()
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.job_id, None)
+            await self.io_executor.run(shutil.rmtree, job_dir, True)
+            logger.info("批量导入任务结束: %s", job.to_dict())
+
+    async def _decode_stage(
+        self,
+        job: IngestionJob,
+        sources: List[_StagedSource],
+        out_q: asyncio.Queue,
+        job_dir: str,
+    ) -> None:
+        """解码：文本按块增量 UTF-8 解码、PDF 按页批抽取，切成段送入下一级"""
+        for source in sources:
+            sent = 0  # 已送入下一级的段数：中途失败时这些内容仍会入库
+            try:
+                if source.name.lower().endswith(PDF_SUFFIXES):
+                    segments = self._extract_pdf(job, source, job_dir)
+                else:
+                    # 先整体校验编码再开始产出，编码错误的文件不会只入库前半部分
+                    await self.io_executor.run(_check_utf8, source, self.read_chunk_bytes)
+                    segments = self._decode_source(job, source)
+                async for segment in segments:
+                    await out_q.put((source, segment))
+                    sent += 1
+                job.files_done += 1
+            except UnicodeDecodeError:
+                job.files_skipped += 1
+                job.errors.append(f"{source.name}: 不是有效的 UTF-8 文本")
+            except asyncio.TimeoutError:
+                # 已抽取的页面保留在知识库中
+                PDF_TIMEOUTS.inc()
+                self._count_failed(job, sent)
+                job.errors.append(
+                    f"{source.name}: PDF 解析超过 {self.pdf_timeout:g} 秒，剩余页面已跳过"
+                    + ("（已抽取的页面已入库）" if sent else "")
+                )
+            except Exception as e:
+                if not source.name.lower().endswith(PDF_SUFFIXES):
+                    raise
+                # 单个损坏 / 加密的 PDF 不影响同一任务的其他文件
+                logger.warning("PDF 解析失败: %s, %s", source.name, e)
+                self._count_failed(job, sent)
+                job.errors.append(f"{source.name}: PDF 解析失败: {e}" + ("（已抽取的页面已入库）" if sent else ""))
+        await out_q.put(_DONE)
+
+    @staticmethod
+    def _count_failed(job: IngestionJob, sent: int) -> None:
+        """中途失败的文件：已有内容送入下一级的算部分导入，否则算跳过"""
+        if sent:
+            job.files_partial += 1
+        else:
+            job.files_skipped += 1
+
+    async def _extract_pdf(self, job: IngestionJob, source: _StagedSource, job_dir: str):
+        """
+        在进程池中按页批抽取 PDF 文本，每批抽完立即产出
+
+        整个文档共用一个截止时间（含排队）；超时后正在运行的那一批仍会在子进程中跑完，
+        但结果被丢弃，批大小决定了这部分浪费的上限。
+        """
+        deadline = time.monotonic() + self.pdf_timeout
+
+        async def run(fn, *args):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(self.pdf_executor.run(fn, *args), remaining)
+
+        path = await self.io_executor.run(source.materialize, job_dir)
+        total = await run(count_pages, path)
+        bytes_counted = 0
+        for start in range(0, total, self.pdf_pages_per_batch):
+            end = min(start + self.pdf_pages_per_batch, total)
+            pages = await run(extract_pages, path, start, end)
+            job.pages_extracted += len(pages)
+            PDF_PAGES.inc(len(pages))
+            # PDF 无法按字节流式读取，进度按页数折算
+            counted = source.size * end // total
+            job.bytes_read += counted - bytes_counted
+            bytes_counted = counted
+            text = "\n\n".join(page for page in pages if page.strip())
+            if text:
+                yield text
+        job.bytes_read += source.size - bytes_counted
+
+    async def _decode_source(self, job: IngestionJob, source: _StagedSource):
+        stream = await self.io_executor.run(source.open)
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        buffer = ""
+        try:
+            while True:
+                block = await self.io_executor.run(stream.read, self.read_chunk_bytes)
+                job.bytes_read += len(block)
+                INGEST_BYTES.inc(len(block))
+                buffer += decoder.decode(block, final=not block)
+                while len(buffer) >= self.segment_chars:
+                    cut = _segment_boundary(buffer, self.segment_chars)
+                    yield buffer[:cut]
+                    buffer = buffer[cut:]
+                if not block:
+                    break
+        finally:
+            await self.io_executor.run(stream.close)
+        if buffer.strip():
+            yield buffer
+
+    async def _split_stage(self, job: IngestionJob, in_q: asyncio.Queue, out_q: asyncio.Queue) -> None:
+        """切片 + 近似重复预检：重复片段在向量化之前丢弃"""
+        while True:
+            item = await in_q.get()
+            if item is _DONE:
+                for _ in range(self.embed_workers):
+                    await out_q.put(_DONE)
+                return
+            source, segment = item
+            chunks = await self.vsm.split_text(segment)
+            kept, signatures = await self.vsm.dedupe_chunks(
+                chunks, {"source": source.name}, user_id=job.user_id, course=job.course
+            )
+            job.count_duplicates(len(chunks) - len(kept), self.vsm.near_dup_mode)
+            if kept:
+                await out_q.put((source, kept, signatures))
+
+    async def _embed_stage(self, job: IngestionJob, in_q: asyncio.Queue, out_q: asyncio.Queue) -> None:
+        while True:
+            item = await in_q.get()
+            if item is _DONE:
+                await out_q.put(_DONE)
+                return
+            source, chunks, signatures = item
+            embeddings = await self.vsm.embed_chunks(chunks)
+            job.chunks_embedded += len(chunks)
+            await out_q.put((source, chunks, embeddings, signatures))
+
+    async def _index_stage(self, job: IngestionJob, in_q: asyncio.Queue) -> None:
+        """写索引：单写者，按文档 ID 归并同一文件的各批片段"""
+        remaining = self.embed_workers
+        while remaining:
+            item = await in_q.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            source, chunks, embeddings, signatures = item
+            count = await self.vsm.index_chunks(
+                chunks,
+                embeddings,
+                metadata={"source": source.name, "type": "file"},
+                user_id=job.user_id,
+                course=job.course,
+                doc_id=source.doc_id,
+                signatures=signatures,
+            )
+            job.count_duplicates(len(chunks) - count, self.vsm.near_dup_mode)
+            job.chunks_indexed += count
+            INGEST_CHUNKS.inc(count)
+
+
+def _check_utf8(source: _StagedSource, block_size: int) -> None:
+    """
+    按块校验整个文本源是否为有效的 UTF-8（阻塞调用，在执行器中运行）
+
+    Raises:
+        UnicodeDecodeError: 编码无效
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    stream = source.open()
+    try:
+        while True:
+            block = stream.read(block_size)
+            decoder.decode(block, final=not block)
+            if not block:
+                return
+    finally:
+        stream.close()
+
+
+def _segment_boundary(text: str, target: int) -> int:
+    """在 target 附近找段落 / 行边界，找不到则硬切"""
+    for sep in ("\n\n", "\n", "。"):
+        cut = text.rfind(sep, target // 2, target)
+        if cut != -1:
+            return cut + len(sep)
+    return target
+
+
+# 全局单例
+ingestion_pipeline = IngestionPipeline(vector_store_manager)
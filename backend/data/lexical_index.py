@@ -0,0 +1,165 @@
+"""
+BM25 倒排索引（中文字二元组）
+汉字按相邻两字切成 bigram，英文 / 数字 / 下划线连续串整体作为一个词，
+不依赖分词器即可命中公式名、API 标识符等精确术语。
+随存储加载时由元数据侧表重建，写入时增量更新。
+"""
+import math
+import re
+import threading
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from backend.data.ann_index import top_k_rows
+
+_TOKEN = re.compile(r"[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """汉字二元组 + 英文数字整词"""
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        run = match.group()
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class CorpusStats(NamedTuple):
+    """BM25 语料统计：跨分区检索时合并各分区的统计后再打分，不同分区的得分才可比"""
+    docs: int
+    total_len: int
+    df: Dict[str, int]  # 查询词 -> 文档频率
+
+    def merge(self, other: "CorpusStats") -> "CorpusStats":
+        df = dict(self.df)
+        for term, count in other.df.items():
+            df[term] = df.get(term, 0) + count
+        return CorpusStats(self.docs + other.docs, self.total_len + other.total_len, df)
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引（内存）
+
+    倒排表用 array 紧凑存储（行号 uint32、词频 uint16），检索时把命中词的倒排表
+    拷成 NumPy 数组，用 bincount 一次累加出所有候选行的得分。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        """
+        Args:
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+            max_df: 文档频率超过该比例的查询词视为停用词跳过（查询词全部超过时不跳过）
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self._rows: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._doc_len = array("I")
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, start_row: int, texts: Iterable[str]) -> None:
+        """
+        登记新写入行的文本
+
+        Args:
+            start_row: 第一行的行号（须等于当前行数）
+            texts: 各行文本
+        """
+        with self._lock:
+            if start_row != len(self._doc_len):
+                raise ValueError(f"倒排索引行号不连续: 期望 {len(self._doc_len)}, 实际 {start_row}")
+            for offset, text in enumerate(texts):
+                row = start_row + offset
+                tokens = tokenize(text)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    rows = self._rows.get(token)
+                    if rows is None:
+                        rows = self._rows[token] = array("I")
+                        self._tfs[token] = array("H")
+                    rows.append(row)
+                    self._tfs[token].append(min(tf, 65535))
+                self._doc_len.append(len(tokens))
+                self._total_len += len(tokens)
+
+    def stats(self, text: str) -> CorpusStats:
+        """查询词在本索引中的语料统计"""
+        terms = set(tokenize(text))
+        with self._lock:
+            df = {t: len(self._rows[t]) for t in terms if t in self._rows}
+            return CorpusStats(len(self._doc_len), self._total_len, df)
+
+    def search(
+        self,
+        text: str,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        stats: Optional[CorpusStats] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        BM25 检索
+
+        Args:
+            text: 查询文本
+            top_k: 返回条数
+            rows: 只在这些行中检索（元数据过滤结果），None 表示全部
+            stats: 计算 IDF 与平均长度所用的语料统计（多个分区合并后的），None 使用本索引自身的
+
+        Returns:
+            按得分降序的 (行号, 得分) 列表，只包含至少命中一个词的行
+        """
+        terms = set(tokenize(text))
+        with self._lock:
+            n = len(self._doc_len)
+            if n == 0 or not terms:
+                return []
+            postings = [(t, self._rows[t], self._tfs[t]) for t in terms if t in self._rows]
+            if not postings:
+                return []
+            if stats is None:
+                stats = CorpusStats(n, self._total_len, {t: len(r) for t, r, _ in postings})
+            # 剪枝：跳过几乎每行都有的高频词，缩小候选集（是否全部超过按合并后的统计判断，各分区结论一致）
+            threshold = self.max_df * stats.docs
+            if any(df <= threshold for df in stats.df.values()):
+                postings = [p for p in postings if stats.df.get(p[0], len(p[1])) <= threshold]
+                if not postings:
+                    return []
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+            arrays = [
+                (stats.df.get(t, len(r)), np.frombuffer(r, dtype=np.uint32).astype(np.int64), np.frombuffer(f, dtype=np.uint16).astype(np.float32))
+                for t, r, f in postings
+            ]
+            n = stats.docs
+            avg_len = stats.total_len / n if stats.total_len else 1.0
+
+        all_rows, all_weights = [], []
+        for df, term_rows, tf in arrays:
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[term_rows] / avg_len)
+            all_rows.append(term_rows)
+            all_weights.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        hit_rows = np.concatenate(all_rows)
+        weights = np.concatenate(all_weights)
+        if rows is not None:
+            mask = np.isin(hit_rows, rows, assume_unique=False)
+            hit_rows, weights = hit_rows[mask], weights[mask]
+            if len(hit_rows) == 0:
+                return []
+
+        candidates, inverse = np.unique(hit_rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        return [(int(candidates[i]), score) for i, score in top_k_rows(scores, top_k)]
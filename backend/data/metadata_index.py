@@ -0,0 +1,71 @@
+"""
+元数据倒排索引
+(字段, 取值) -> 行号列表；检索前先按 source / type 等条件求出候选行，
+相似度只对候选行计算。
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 建立倒排的元数据字段
+INDEXED_FIELDS = ("source", "type", "course", "doc_id")
+
+
+class MetadataIndex:
+    """元数据倒排索引（内存），随存储加载时重建、写入时增量更新"""
+
+    def __init__(self, fields: Iterable[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self._postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in self.fields}
+        self._lock = threading.Lock()
+
+    def add(self, start_row: int, metadatas: List[Dict[str, Any]]) -> None:
+        """
+        登记新写入行的元数据
+
+        Args:
+            start_row: 第一行的行号
+            metadatas: 各行的元数据
+        """
+        with self._lock:
+            for offset, metadata in enumerate(metadatas):
+                for field in self.fields:
+                    value = metadata.get(field)
+                    if value is not None:
+                        self._postings[field].setdefault(str(value), []).append(start_row + offset)
+
+    def values(self, field: str) -> List[str]:
+        """某字段出现过的全部取值"""
+        return list(self._postings.get(field, {}))
+
+    def lookup(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        按条件求候选行：同一字段内多个取值为 OR，不同字段之间为 AND
+
+        Args:
+            filters: {字段: 取值 或 取值列表}
+
+        Returns:
+            升序行号数组；filters 为空时返回 None（表示不过滤）
+
+        Raises:
+            ValueError: 字段未建立索引
+        """
+        if not filters:
+            return None
+        result: Optional[np.ndarray] = None
+        with self._lock:
+            for field, wanted in filters.items():
+                if field not in self._postings:
+                    raise ValueError(f"元数据字段 {field} 不支持过滤，可用字段: {', '.join(self.fields)}")
+                values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+                rows = [
+                    np.asarray(self._postings[field].get(str(v), ()), dtype=np.int64)
+                    for v in values
+                ]
+                field_rows = np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+                result = field_rows if result is None else np.intersect1d(result, field_rows, assume_unique=True)
+                if len(result) == 0:
+                    break
+        return result
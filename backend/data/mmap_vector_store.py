@@ -0,0 +1,444 @@
+"""
+内存映射向量存储
+float32 向量按行追加写入二进制矩阵文件，元数据写入 JSONL 侧表。
+启动时只映射矩阵文件，不解析任何向量 JSON；检索由可插拔索引决定打分范围，
+对候选行做 NumPy 矩阵点积 + argpartition 取 top-k。
+同时维护 BM25 倒排索引，支持纯关键词检索及关键词 + 向量的混合检索（RRF 融合）。
+可选 float16 / int8 量化副本：扫描量化副本取候选，再用 float32 原始向量精排。
+可选预写日志：写入先追加到按组 fsync 的日志，检查点时再把主存储文件落盘。
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.data.ann_index import ExactIndex, VectorIndex, top_k_rows
+from backend.data.lexical_index import CorpusStats, LexicalIndex
+from backend.data.metadata_index import MetadataIndex
+from backend.data.quantization import QuantizedMatrix
+from backend.data.wal import WAL_REPLAYED_ROWS, WriteAheadLog, fsync_path
+
+logger = logging.getLogger(__name__)
+
+
+class MmapVectorStore:
+    """
+    追加写入的内存映射向量存储
+
+    目录结构:
+        header.json  维度等元信息
+        vectors.f32  行优先的 float32 矩阵（已归一化，点积即余弦相似度）
+        meta.jsonl   每行一条记录，行号即向量行号
+        wal.log      预写日志（开启时），检查点之后写入的行
+    """
+
+    HEADER_FILE = "header.json"
+    VECTORS_FILE = "vectors.f32"
+    META_FILE = "meta.jsonl"
+
+    def __init__(
+        self,
+        path: str,
+        dim: Optional[int] = None,
+        index: Optional[VectorIndex] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        precision: str = "float32",
+        rerank_factor: int = 4,
+        wal: bool = False,
+        commit_delay_ms: float = 0.0,
+        checkpoint_bytes: int = 64 * 1024 * 1024,
+    ):
+        """
+        打开（或创建）向量存储
+
+        Args:
+            path: 存储目录
+            dim: 向量维度；已有存储以 header 为准，新存储可在首次写入时确定
+            index: 检索索引，默认精确检索
+            lexical_index: 关键词倒排索引，默认 BM25 默认参数
+            precision: 检索扫描用的精度，float32 / float16 / int8
+            rerank_factor: 量化扫描取 top_k * rerank_factor 个候选交给 float32 精排
+            wal: 是否启用预写日志（写入返回前日志已落盘）
+            commit_delay_ms: 组提交等待并发写入的毫秒数
+            checkpoint_bytes: 日志超过该大小时由写入线程顺带做一次检查点
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, self.VECTORS_FILE)
+        self._meta_path = os.path.join(path, self.META_FILE)
+        self._header_path = os.path.join(path, self.HEADER_FILE)
+
+        self._lock = threading.Lock()
+        self._records: List[Dict] = []
+        self._count = 0
+        self._matrix: Optional[np.ndarray] = None
+
+        header_dim = self._load_header()
+        self._header_written = header_dim is not None
+        self.dim = header_dim or dim
+        self._load()
+        self.wal: Optional[WriteAheadLog] = None
+        self.checkpoint_bytes = checkpoint_bytes
+        self._checkpoint_lock = threading.Lock()
+        if wal:
+            self.wal = WriteAheadLog(path, commit_delay_ms)
+            self._replay()
+        self.rerank_factor = rerank_factor
+        self.quantized: Optional[QuantizedMatrix] = None
+        if precision != "float32":
+            self.quantized = QuantizedMatrix(path, precision, self.dim)
+            self.quantized.load(self.matrix())
+        self.index = index or ExactIndex()
+        self.index.load(self.matrix())
+        self.metadata_index = MetadataIndex()
+        self.metadata_index.add(0, [r.get("metadata") or {} for r in self._records])
+        self.lexical_index = lexical_index or LexicalIndex()
+        self.lexical_index.add(0, [r["text"] for r in self._records])
+
+    # ==============================
+    # 加载与恢复
+    # ==============================
+
+    def _load_header(self) -> Optional[int]:
+        if not os.path.exists(self._header_path):
+            return None
+        with open(self._header_path, "r", encoding="utf-8") as f:
+            return int(json.load(f)["dim"])
+
+    def _write_header(self) -> None:
+        tmp_path = self._header_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": "float32"}, f)
+        os.replace(tmp_path, self._header_path)
+
+    def _load(self) -> None:
+        """读取元数据侧表，并按两者中较短的一方对齐（丢弃崩溃时写了一半的尾部）"""
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 最后一行可能写了一半
+                        break
+
+        vector_rows = 0
+        if self.dim and os.path.exists(self._vectors_path):
+            vector_rows = os.path.getsize(self._vectors_path) // self._row_bytes
+
+        count = min(vector_rows, len(self._records))
+        if count < vector_rows or count < len(self._records):
+            logger.warning(
+                "向量存储 %s 尾部不一致 (vectors=%d, meta=%d)，截断至 %d 行",
+                self.path, vector_rows, len(self._records), count,
+            )
+            self._truncate(count)
+        self._count = count
+        logger.info("向量存储已映射: path=%s, rows=%d, dim=%s", self.path, count, self.dim)
+
+    def _truncate(self, count: int) -> None:
+        del self._records[count:]
+        if self.dim and os.path.exists(self._vectors_path):
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(count * self._row_bytes)
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            for record in self._records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _replay(self) -> None:
+        """重放主存储缺失的日志尾部（掉电时只进了页缓存的行），随后做一次检查点"""
+        replayed = 0
+        for start_row, vectors, records in self.wal.replay():
+            skip = self._count - start_row
+            if skip >= len(records):
+                continue
+            if skip < 0:
+                logger.warning("预写日志 %s 与主存储之间缺少行 %d-%d，停止重放", self.path, self._count, start_row)
+                break
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            if not self._header_written:
+                self._write_header()
+                self._header_written = True
+            self._append_files(vectors[skip:], records[skip:])
+            self._records.extend(records[skip:])
+            self._count += len(records) - skip
+            replayed += len(records) - skip
+        if replayed:
+            WAL_REPLAYED_ROWS.inc(replayed)
+            logger.info("向量存储 %s 从预写日志重放 %d 行", self.path, replayed)
+        self.checkpoint()
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(np.float32).itemsize
+
+    # ==============================
+    # 写入
+    # ==============================
+
+    def add(self, embeddings: np.ndarray, records: List[Dict], durable: bool = True) -> List[int]:
+        """
+        追加一批向量及其元数据
+
+        Args:
+            embeddings: 形状为 (n, dim) 的向量
+            records: 与向量一一对应的元数据记录
+            durable: 开启日志时是否等待日志落盘再返回；调用方持有外层锁时传 False，释放锁后调用 sync()
+
+        Returns:
+            新写入行的行号
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if len(vectors) != len(records):
+            raise ValueError("embeddings 与 records 数量不一致")
+        if len(vectors) == 0:
+            return []
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不匹配: 期望 {self.dim}, 实际 {vectors.shape[1]}")
+            if not self._header_written:
+                self._write_header()
+                self._header_written = True
+
+            vectors = _normalize(vectors)
+            start = self._count
+            seq = self.wal.append(start, vectors, records) if self.wal is not None else None
+            self._append_files(vectors, records)
+
+            if self.quantized is not None:
+                self.quantized.add(vectors)
+
+            self._records.extend(records)
+            self._count += len(records)
+            self.index.add(start, vectors, self.matrix())
+            self.metadata_index.add(start, [r.get("metadata") or {} for r in records])
+            self.lexical_index.add(start, [r["text"] for r in records])
+            rows = list(range(start, self._count))
+
+        # 在写锁外等待日志落盘，并发写入共享一次 fsync
+        if seq is not None and durable:
+            self.wal.sync(seq)
+            if self.wal.size() >= self.checkpoint_bytes:
+                self.checkpoint()
+        return rows
+
+    def _append_files(self, vectors: np.ndarray, records: List[Dict]) -> None:
+        # 先写向量再写元数据：崩溃时只会多出向量，加载时按元数据截断
+        with open(self._vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._meta_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sync(self) -> None:
+        """等待此前全部写入的日志落盘（配合 add(durable=False) 在外层锁释放后调用）"""
+        if self.wal is not None:
+            self.wal.sync(self.wal.appended)
+
+    def checkpoint(self) -> bool:
+        """
+        检查点：主存储文件 fsync 后截掉已落入其中的日志
+
+        Returns:
+            是否截掉了日志（未开启日志、日志为空或另一个检查点正在进行时为 False）
+        """
+        if self.wal is None or not self._checkpoint_lock.acquire(blocking=False):
+            return False
+        try:
+            # 写锁内追加日志与写主存储是一起完成的，此时日志中的记录都已写入主存储文件
+            with self._lock:
+                offset = self.wal.size()
+            if offset == 0:
+                return False
+            fsync_path(self._vectors_path)
+            fsync_path(self._meta_path)
+            fsync_path(self._header_path)
+            self.wal.compact(offset)
+            return True
+        finally:
+            self._checkpoint_lock.release()
+
+    def close(self) -> None:
+        """做最后一次检查点并关闭日志"""
+        if self.wal is not None:
+            self.checkpoint()
+            self.wal.close()
+
+    # ==============================
+    # 读取与检索
+    # ==============================
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, row: int) -> Dict:
+        """按行号获取元数据记录"""
+        return self._records[row]
+
+    def matrix(self) -> np.ndarray:
+        """返回当前全部行的只读内存映射（行数增长时重新映射）"""
+        count = self._count
+        if count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._matrix is None or len(self._matrix) < count:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim)
+            )
+        return self._matrix[:count]
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        检索：有元数据条件时先用倒排求出候选行，只对候选行打分；否则由索引决定候选行
+
+        Args:
+            query: 查询向量
+            top_k: 返回条数
+            filters: 元数据过滤条件，见 MetadataIndex.lookup
+
+        Returns:
+            按得分降序排列的 (行号, 得分) 列表
+        """
+        matrix = self.matrix()
+        if len(matrix) == 0 or top_k <= 0:
+            return []
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+
+        # 量化模式：扫描量化副本多取一些候选，再用 float32 精排
+        scan = self._scan_matrix(len(matrix))
+        k = top_k * self.rerank_factor if self.quantized is not None else top_k
+        rows = self.metadata_index.lookup(filters)
+        if rows is None:
+            hits = self.index.search(scan, q, k)
+        else:
+            hits = self._score_rows(scan, rows, q, k)
+        return self._rerank(matrix, hits, q, top_k)
+
+    def _scan_matrix(self, rows: int):
+        """检索扫描用的矩阵：量化副本（反量化按块进行）或 float32 原始矩阵"""
+        if self.quantized is None:
+            return self.matrix()
+        return self.quantized.snapshot(rows)
+
+    def _rerank(self, matrix: np.ndarray, hits: List[Tuple[int, float]], q: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if self.quantized is None or not hits:
+            return hits[:top_k]
+        rows = np.sort(np.fromiter((row for row, _ in hits), dtype=np.int64, count=len(hits)))
+        return self._score_rows(matrix, rows, q, top_k)
+
+    def _score_rows(self, matrix: np.ndarray, rows: np.ndarray, q: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        rows = rows[rows < len(matrix)]
+        if len(rows) == 0:
+            return []
+        scores = matrix[rows] @ q
+        return [(int(rows[i]), score) for i, score in top_k_rows(scores, top_k)]
+
+    def lexical_stats(self, text: str) -> CorpusStats:
+        """查询词的 BM25 语料统计（跨分区检索时合并后传回 lexical_search）"""
+        return self.lexical_index.stats(text)
+
+    def lexical_search(
+        self,
+        text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        stats: Optional[CorpusStats] = None,
+    ) -> List[Tuple[int, float]]:
+        """BM25 关键词检索，不需要查询向量；stats 为多个分区合并后的语料统计"""
+        if self._count == 0 or top_k <= 0:
+            return []
+        return self.lexical_index.search(text, top_k, rows=self.metadata_index.lookup(filters), stats=stats)
+
+    def hybrid_search(
+        self,
+        query: np.ndarray,
+        text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        candidates: int = 200,
+        prune: bool = True,
+        rrf_k: int = 60,
+    ) -> List[Tuple[int, float]]:
+        """
+        混合检索：关键词与向量两路结果按倒数排名融合 (RRF)
+
+        prune 为 True 且关键词命中不少于 top_k 行时，向量只对关键词候选行打分，
+        不再扫描索引；命中太少（纯语义问题）时退回完整的向量检索。
+
+        Args:
+            query: 查询向量
+            text: 查询文本
+            top_k: 返回条数
+            filters: 元数据过滤条件
+            candidates: 每一路取的候选数
+            prune: 是否用关键词候选剪枝向量打分范围
+            rrf_k: RRF 平滑常数
+
+        Returns:
+            按 RRF 得分降序排列的 (行号, 得分) 列表
+        """
+        if top_k <= 0:
+            return []
+        lexical, vector = self.hybrid_candidates(query, text, top_k, filters, candidates, prune)
+        return rrf_fuse((lexical, vector), top_k, rrf_k)
+
+    def hybrid_candidates(
+        self,
+        query: np.ndarray,
+        text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        candidates: int = 200,
+        prune: bool = True,
+        stats: Optional[CorpusStats] = None,
+    ) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        """
+        混合检索的两路候选：(BM25 候选, 向量候选)，各自按得分降序
+
+        跨分区检索时各分区的候选按原始得分合并成两个列表后统一做一次 RRF，
+        不能直接比较各分区各自融合后的 RRF 得分（每个分区的第一名得分都相同）。
+        """
+        matrix = self.matrix()
+        if len(matrix) == 0:
+            return [], []
+        rows = self.metadata_index.lookup(filters)
+        lexical = self.lexical_index.search(text, candidates, rows=rows, stats=stats)
+        if prune and len(lexical) >= top_k:
+            q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+            lexical_rows = np.sort(np.fromiter((row for row, _ in lexical), dtype=np.int64, count=len(lexical)))
+            vector = self._score_rows(matrix, lexical_rows, q, candidates)
+        else:
+            vector = self.search(query, candidates, filters=filters)
+        return lexical, vector
+
+
+def rrf_fuse(
+    ranked_lists: Sequence[Sequence[Tuple[Hashable, float]]],
+    top_k: int,
+    rrf_k: int = 60,
+) -> List[Tuple[Hashable, float]]:
+    """倒排名融合：各列表按名次贡献 1 / (rrf_k + 名次)，返回得分最高的 top_k 个 (键, 得分)"""
+    fused: Dict[Hashable, float] = {}
+    for ranked in ranked_lists:
+        for rank, (key, _) in enumerate(ranked):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
@@ -1,3 +1,4 @@
+import functools
 import logging
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -9,11 +10,32 @@ from neo4j.exceptions import (
     Neo4jError
 )
 from backend.config import settings
+from backend.core.deadline import bounded
+from backend.core.metrics import registry, timed
 
 # 配置日志
 logger = logging.getLogger("neo4j_client")
 logging.basicConfig(level=logging.INFO)
 
+NEO4J_CALL_SECONDS = registry.histogram(
+    "neo4j_call_seconds", "Neo4jClient 各方法调用耗时（op: 方法名）"
+)
+NEO4J_CALL_ERRORS = registry.counter(
+    "neo4j_call_errors_total", "Neo4jClient 各方法调用失败次数（op: 方法名）"
+)
+
+
+def _traced(op: str):
+    """按方法名记录 Neo4j 调用耗时与失败次数，并按请求剩余时间（不超过 NEO4J_QUERY_TIMEOUT）限时"""
+    def decorator(fn):
+        @timed(NEO4J_CALL_SECONDS, NEO4J_CALL_ERRORS, op=op)
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await bounded(f"neo4j.{op}", fn(*args, **kwargs), cap=settings.NEO4J_QUERY_TIMEOUT)
+        return wrapper
+    return decorator
+
+
 class Neo4jClient:
     """Neo4j 客户端（整合版：包含基础功能、学习路径及对话记忆）"""
     
@@ -34,6 +56,7 @@ class Neo4jClient:
             logger.error(f"Failed to initialize Neo4j driver: {e}")
             raise e
 
+    @_traced("verify_connectivity")
     async def verify_connectivity(self):
         """验证数据库连接是否可用"""
         try:
@@ -52,6 +75,7 @@ class Neo4jClient:
     # ==============================
     # 核心功能：通用查询 
     # ==============================
+    @_traced("query")
     async def query(self, cypher: str, parameters: dict = None):
         """
         执行通用 Cypher 查询 (支持返回列表)
@@ -73,6 +97,7 @@ class Neo4jClient:
     # 对话记忆与图谱构建 (MindMap 核心)
     # ==============================
 
+    @_traced("save_dialogue_node")
     async def save_dialogue_node(
         self, 
         node_id: str, 
@@ -117,6 +142,7 @@ class Neo4jClient:
                 type=type
             )
     
+    @_traced("link_dialogue_nodes")
     async def link_dialogue_nodes(self, parent_node_id: str, child_node_id: str, fragment_id: Optional[str] = None) -> None:
         """创建对话节点之间的父子关系"""
         async with self.driver.session() as session:
@@ -129,6 +155,29 @@ class Neo4jClient:
             """
             await session.run(query, parent_node_id=parent_node_id, child_node_id=child_node_id, fragment_id=fragment_id)
 
+    @_traced("get_dialogue_context")
+    async def get_dialogue_context(self, node_id: str, user_id: str) -> List[Dict]:
+        """获取节点及其父节点（追问时的对话上下文），按先后顺序返回 role / content"""
+        async with self.driver.session() as session:
+            result = await session.run(
+                """
+                MATCH (n:DialogueNode {node_id: $node_id, user_id: $user_id})
+                OPTIONAL MATCH (p:DialogueNode)-[:HAS_CHILD]->(n)
+                RETURN p.role AS parent_role, p.content AS parent_content, n.role AS role, n.content AS content
+                LIMIT 1
+                """,
+                node_id=node_id, user_id=user_id
+            )
+            record = await result.single()
+            if not record:
+                return []
+            turns = []
+            if record["parent_content"]:
+                turns.append({"role": record["parent_role"], "content": record["parent_content"]})
+            turns.append({"role": record["role"], "content": record["content"] or ""})
+            return turns
+
+    @_traced("get_dialogue_tree")
     async def get_dialogue_tree(self, root_node_id: str, user_id: str, max_depth: int = 10) -> Optional[Dict]:
         """获取对话树（递归查询）"""
         async with self.driver.session() as session:
@@ -164,6 +213,7 @@ class Neo4jClient:
     # 辅助功能 (供兼容旧代码)
     # ==============================
 
+    @_traced("create_node")
     async def create_node(self, label: str, properties: Dict) -> Optional[str]:
         """创建节点"""
         query = f"CREATE (n:{label} $properties) RETURN n.node_id as node_id"
@@ -177,6 +227,7 @@ class Neo4jClient:
             logger.error(f"Error creating node {label}: {e}")
             raise
 
+    @_traced("create_relationship")
     async def create_relationship(
         self, source_id: str, target_id: str, relation_type: str, properties: Optional[Dict] = None
     ) -> bool:
@@ -200,6 +251,7 @@ class Neo4jClient:
             logger.error(f"Error creating relationship: {e}")
             return False
 
+    @_traced("get_node_by_name")
     async def get_node_by_name(self, label: str, name: str) -> Optional[Dict]:
         """根据名称获取节点"""
         query = f"MATCH (n:{label} {{name: $name}}) RETURN n"
@@ -212,6 +264,7 @@ class Neo4jClient:
             logger.error(f"Error in get_node_by_name: {e}")
             return None
 
+    @_traced("get_learning_path")
     async def get_learning_path(self, target_concept_name: str) -> List[str]:
         """查找学习路径"""
         # ... (保留原逻辑) ...
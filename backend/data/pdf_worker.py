@@ -0,0 +1,35 @@
+"""
+PDF 文本抽取工作函数
+均为模块级函数，可被 pickle 到 spawn 进程池中执行；每次调用只处理一段页码，
+调用方按批提交，抽取出的页面可以边解析边送入切片。
+"""
+from typing import List
+
+
+def _open_reader(path: str):
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("PDF 解析需要安装 pypdf: pip install pypdf") from e
+    return PdfReader(path)
+
+
+def count_pages(path: str) -> int:
+    """PDF 总页数"""
+    return len(_open_reader(path).pages)
+
+
+def extract_pages(path: str, start: int, end: int) -> List[str]:
+    """
+    抽取 [start, end) 页的文本
+
+    单页抽取失败（字体 / 编码损坏等）时该页返回空字符串，不影响其余页面。
+    """
+    reader = _open_reader(path)
+    texts = []
+    for page in reader.pages[start:end]:
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception:
+            texts.append("")
+    return texts
@@ -0,0 +1,174 @@
+"""
+向量量化存储
+在 float32 向量文件之外维护一份紧凑的量化副本，检索时只扫描量化副本，
+再用 float32 原始向量对前若干名候选精排。扫描阶段常驻内存（页缓存）随之减半（float16）
+或降到约四分之一（int8）。
+
+- float16: 直接截断为半精度
+- int8: 逐行对称量化，q = round(x / max|x| * 127)，每行另存一个 float32 缩放系数
+"""
+import logging
+import os
+from typing import Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 补算量化副本时每批的行数
+_BLOCK_ROWS = 65536
+# 整库点积时每块反量化的行数：块小到能留在 CPU 缓存里，转换后的 float32 不必写回内存
+_SCAN_BLOCK_ROWS = 2048
+
+
+class QuantizedMatrix:
+    """
+    追加写入的量化向量矩阵
+
+    提供与 NumPy 矩阵一致的 len() / 切片 / 行号索引 / `@ query` 接口，检索索引无需区分精度：
+    取行时返回反量化后的 float32，整库点积按块计算。
+
+    目录结构:
+        vectors.f16         float16 模式的向量
+        vectors.i8          int8 模式的向量
+        vectors.i8.scale    int8 模式每行的缩放系数（float32）
+    """
+
+    def __init__(self, path: str, precision: str, dim: Optional[int] = None):
+        """
+        Args:
+            path: 存储目录（与 float32 向量文件同目录）
+            precision: "float16" 或 "int8"
+            dim: 向量维度，可在首次写入时确定
+        """
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"不支持的量化精度: {precision}")
+        self.path = path
+        self.precision = precision
+        self.dim = dim
+        self._dtype = np.float16 if precision == "float16" else np.int8
+        suffix = "f16" if precision == "float16" else "i8"
+        self._data_path = os.path.join(path, f"vectors.{suffix}")
+        self._scale_path = self._data_path + ".scale"
+        self._count = 0
+        self._data: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+
+    # ==============================
+    # 加载与写入
+    # ==============================
+
+    def load(self, matrix: np.ndarray) -> None:
+        """对齐 float32 矩阵：截断多出的尾部，补齐缺失的行（新开启量化或崩溃恢复）"""
+        if self.dim is None and matrix.shape[1]:
+            self.dim = int(matrix.shape[1])
+        rows = self._rows_on_disk()
+        if rows > len(matrix):
+            self._truncate(len(matrix))
+            rows = len(matrix)
+        self._count = rows
+        if rows < len(matrix):
+            for start in range(rows, len(matrix), _BLOCK_ROWS):
+                self.add(np.asarray(matrix[start:start + _BLOCK_ROWS]))
+            logger.info("已为 %s 生成 %d 行 %s 量化向量", self.path, len(matrix) - rows, self.precision)
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim or not os.path.exists(self._data_path):
+            return 0
+        rows = os.path.getsize(self._data_path) // (self.dim * np.dtype(self._dtype).itemsize)
+        if self.precision == "int8":
+            scale_rows = os.path.getsize(self._scale_path) // 4 if os.path.exists(self._scale_path) else 0
+            rows = min(rows, scale_rows)
+        return rows
+
+    def _truncate(self, rows: int) -> None:
+        with open(self._data_path, "r+b") as f:
+            f.truncate(rows * self.dim * np.dtype(self._dtype).itemsize)
+        if self.precision == "int8" and os.path.exists(self._scale_path):
+            with open(self._scale_path, "r+b") as f:
+                f.truncate(rows * 4)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """追加已归一化的 float32 向量（调用方负责加锁）"""
+        if len(vectors) == 0:
+            return
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        if self.precision == "float16":
+            with open(self._data_path, "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+        else:
+            scale = np.abs(vectors).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            quantized = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+            # 先写缩放系数：崩溃时以较短的一方为准
+            with open(self._scale_path, "ab") as f:
+                f.write(scale.astype(np.float32).tobytes())
+            with open(self._data_path, "ab") as f:
+                f.write(quantized.tobytes())
+        self._count += len(vectors)
+
+    def _remap(self) -> None:
+        if self._data is None or len(self._data) < self._count:
+            self._data = np.memmap(self._data_path, dtype=self._dtype, mode="r", shape=(self._count, self.dim))
+            if self.precision == "int8":
+                self._scale = np.memmap(self._scale_path, dtype=np.float32, mode="r", shape=(self._count,))
+
+    def snapshot(self, rows: int) -> "QuantizedMatrix":
+        """前 rows 行的只读视图（与 MmapVectorStore.matrix() 的快照语义一致）"""
+        self._remap()
+        view = QuantizedMatrix.__new__(QuantizedMatrix)
+        view.__dict__.update(self.__dict__)
+        view._count = min(rows, self._count)
+        return view
+
+    # ==============================
+    # NumPy 风格的读取接口
+    # ==============================
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def shape(self):
+        return (self._count, self.dim)
+
+    @property
+    def nbytes(self) -> int:
+        """扫描时需要读取的字节数"""
+        per_row = self.dim * np.dtype(self._dtype).itemsize + (4 if self.precision == "int8" else 0)
+        return self._count * per_row
+
+    def _dequantize(self, index: Union[slice, np.ndarray]) -> np.ndarray:
+        block = np.asarray(self._data[:self._count][index], dtype=np.float32)
+        if self.precision == "int8":
+            block *= np.asarray(self._scale[:self._count][index], dtype=np.float32)[:, None]
+        return block
+
+    def __getitem__(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            return self._dequantize(np.asarray([index]))[0]
+        return self._dequantize(index)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self._dequantize(slice(None)).astype(dtype or np.float32, copy=False)
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        """
+        整库点积：按块转换到复用的 float32 缓冲区后做 BLAS 点积
+
+        int8 的缩放系数在点积之后按行乘上，省去对整块的逐元素乘法。
+        NumPy 没有硬件半精度转换，float16 的转换开销明显高于 int8。
+        """
+        out = np.empty((self._count,) + other.shape[1:], dtype=np.float32)
+        buffer = np.empty((min(_SCAN_BLOCK_ROWS, self._count), self.dim), dtype=np.float32)
+        for start in range(0, self._count, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, self._count)
+            block = buffer[:end - start]
+            block[...] = self._data[start:end]
+            scores = block @ other
+            if self.precision == "int8":
+                scale = self._scale[start:end]
+                scores *= scale.reshape((-1,) + (1,) * (scores.ndim - 1))
+            out[start:end] = scores
+        return out
@@ -0,0 +1,90 @@
+"""
+检索结果缓存
+以 (命名空间, 归一化问题, top_k) 为键缓存 search_context 的结果，重复问题不再向量化和打分。
+每个命名空间（用户 / 共享分区）维护一个写入代数，写入知识时只需把代数加一，
+旧代数下缓存的结果在下次读取时视为过期，不必整体清空。
+"""
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from backend.core.metrics import registry
+
+RETRIEVAL_CACHE_REQUESTS = registry.counter(
+    "retrieval_cache_requests_total", "检索结果缓存查询次数（result: hit / miss / stale）"
+)
+RETRIEVAL_CACHE_ENTRIES = registry.gauge(
+    "retrieval_cache_entries", "检索结果缓存当前条数"
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、统一大小写并压缩空白，使仅有格式差异的问题命中同一条缓存"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip().lower()
+
+
+class RetrievalCache:
+    """
+    带写入代数的 LRU 检索结果缓存
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        """
+        Args:
+            max_entries: 最大缓存条数，0 表示关闭缓存
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], List[Dict]]]" = OrderedDict()
+        self._generations: Dict[Optional[str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self, namespaces: Tuple[Optional[str], ...]) -> Tuple[int, ...]:
+        """检索涉及的各命名空间当前的写入代数（检索开始前读取）"""
+        return tuple(self._generations.get(ns, 0) for ns in namespaces)
+
+    def bump(self, namespace: Optional[str]) -> None:
+        """命名空间有新写入：该命名空间下已缓存的结果全部过期"""
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def get(self, key: Hashable, generation: Tuple[int, ...]) -> Optional[List[Dict]]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            generation: 当前写入代数，与缓存时不一致的条目视为过期并删除
+
+        Returns:
+            缓存结果的拷贝；未命中或已过期返回 None
+        """
+        if self.max_entries <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            RETRIEVAL_CACHE_REQUESTS.inc(result="miss")
+            return None
+        if entry[0] != generation:
+            del self._entries[key]
+            RETRIEVAL_CACHE_ENTRIES.set(len(self._entries))
+            RETRIEVAL_CACHE_REQUESTS.inc(result="stale")
+            return None
+        self._entries.move_to_end(key)
+        RETRIEVAL_CACHE_REQUESTS.inc(result="hit")
+        return [dict(hit) for hit in entry[1]]
+
+    def put(self, key: Hashable, generation: Tuple[int, ...], results: List[Dict]) -> None:
+        """写入缓存；generation 须是检索开始前读取的代数，检索期间发生的写入会使其立即过期"""
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (generation, [dict(hit) for hit in results])
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        RETRIEVAL_CACHE_ENTRIES.set(len(self._entries))
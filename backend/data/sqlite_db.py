@@ -1,69 +1,228 @@
 """
 SQLite 数据库操作
 管理用户数据和对话记录
+
+连接在启动时一次性打开并放入连接池，每个连接只配置一次 PRAGMA
+（WAL 日志、synchronous=NORMAL、mmap、忙等待超时），请求之间复用。
 """
+import asyncio
 import aiosqlite
 import json
+import logging
 import os
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from backend.config import settings
 
+logger = logging.getLogger(__name__)
+
+# 用户查询语句：SQL 文本固定，命中 sqlite3 连接级的预编译语句缓存
+_SELECT_USER_BY_USERNAME = "SELECT * FROM users WHERE username = ?"
+_SELECT_USER_BY_EMAIL = "SELECT * FROM users WHERE email = ?"
+_INSERT_USER = "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)"
+
+# 会话索引：对话节点写入 Neo4j 时同步维护，侧边栏列表只查这张表
+_UPSERT_SESSION = """
+    INSERT INTO sessions (user_id, session_id, title, created_at, last_activity, node_count, conversation_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, session_id) DO UPDATE SET
+        title = COALESCE(sessions.title, excluded.title),
+        last_activity = excluded.last_activity,
+        node_count = sessions.node_count + excluded.node_count,
+        conversation_count = sessions.conversation_count + excluded.conversation_count
+"""
+_INSERT_SESSION_CONVERSATION = """
+    INSERT OR IGNORE INTO session_conversations (user_id, session_id, conversation_id, root_node_id, title, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_SELECT_SESSIONS_FIRST_PAGE = """
+    SELECT session_id, title, created_at, last_activity, node_count, conversation_count
+    FROM sessions WHERE user_id = ?
+    ORDER BY last_activity DESC, session_id DESC LIMIT ?
+"""
+_SELECT_SESSIONS_AFTER = """
+    SELECT session_id, title, created_at, last_activity, node_count, conversation_count
+    FROM sessions WHERE user_id = ? AND (last_activity, session_id) < (?, ?)
+    ORDER BY last_activity DESC, session_id DESC LIMIT ?
+"""
+_SELECT_SESSION_CONVERSATIONS = """
+    SELECT conversation_id, root_node_id, title, created_at
+    FROM session_conversations WHERE user_id = ? AND session_id = ?
+    ORDER BY created_at
+"""
+
+# token 吊销：注销的 token 摘要与强制下线时间，跨 worker 共享、重启后保留
+_INSERT_REVOKED_TOKEN = "INSERT OR REPLACE INTO revoked_tokens (digest, expires_at) VALUES (?, ?)"
+_DELETE_EXPIRED_TOKENS = "DELETE FROM revoked_tokens WHERE expires_at <= ?"
+_UPSERT_USER_NOT_BEFORE = """
+    INSERT INTO user_not_before (user_id, not_before) VALUES (?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET not_before = MAX(user_not_before.not_before, excluded.not_before)
+"""
+_SELECT_TOKEN_REVOCATION = """
+    SELECT
+        EXISTS (SELECT 1 FROM revoked_tokens WHERE digest = ?) AS revoked,
+        (SELECT not_before FROM user_not_before WHERE user_id = ?) AS not_before
+"""
+
 
-async def get_db():
+class SQLitePool:
     """
-    获取数据库连接
-    
-    Returns:
-        数据库连接对象
+    aiosqlite 连接池
+
+    每个 aiosqlite 连接自带一个工作线程；池中的连接在启动时创建，
+    借出时独占使用，归还时回滚未提交的事务。
     """
-    # 确保数据目录存在
-    db_path = settings.SQLITE_DB_PATH
-    db_dir = os.path.dirname(db_path)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-    
-    db = await aiosqlite.connect(db_path)
-    db.row_factory = aiosqlite.Row
-    return db
+
+    def __init__(self, path: str, size: int = 4):
+        """
+        Args:
+            path: 数据库文件路径
+            size: 连接数
+        """
+        self.path = path
+        self.size = size
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        """打开全部连接（幂等）"""
+        async with self._open_lock:
+            if self._idle is not None:
+                return
+            db_dir = os.path.dirname(self.path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            idle: asyncio.Queue = asyncio.Queue()
+            for _ in range(self.size):
+                db = await self._connect()
+                self._connections.append(db)
+                idle.put_nowait(db)
+            self._idle = idle
+            logger.info("SQLite 连接池已打开: path=%s, size=%d", self.path, self.size)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(
+            self.path,
+            timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=settings.SQLITE_CACHED_STATEMENTS,
+        )
+        db.row_factory = aiosqlite.Row
+        # WAL：读不阻塞写；synchronous=NORMAL 在 WAL 下只在检查点 fsync，掉电最多丢失最近提交的事务
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        await db.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        return db
+
+    @asynccontextmanager
+    async def acquire(self):
+        """借出一个连接，用完自动归还（首次使用时打开连接池）"""
+        if self._idle is None:
+            await self.open()
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+
+    async def close(self) -> None:
+        """关闭全部连接"""
+        async with self._open_lock:
+            for db in self._connections:
+                await db.close()
+            self._connections.clear()
+            self._idle = None
+
+
+# 全局连接池（首次使用或 init_db 时打开）
+db_pool = SQLitePool(settings.SQLITE_DB_PATH, size=settings.SQLITE_POOL_SIZE)
 
 
 @asynccontextmanager
 async def get_db_connection():
     """
-    数据库连接上下文管理器
-    自动管理连接的打开和关闭
+    从连接池借出数据库连接
+    用完自动归还（不关闭）
     
     Usage:
         async with get_db_connection() as db:
             # 使用 db 进行数据库操作
             user = await get_user_by_username(db, "username")
     """
-    db = await get_db()
-    try:
+    async with db_pool.acquire() as db:
         yield db
-    finally:
-        await db.close()
 
 
 async def init_db():
-    """初始化数据库表结构"""
-    db = await get_db()
-    
-    # 创建用户表
-    await db.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            hashed_password TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-    """)
-    
-    await db.commit()
-    await db.close()
+    """打开连接池并初始化数据库表结构"""
+    await db_pool.open()
+    async with db_pool.acquire() as db:
+        # 创建用户表
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                hashed_password TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+
+        # 会话表：会话 -> 标题、最近活动时间、节点数；(user_id, last_activity, session_id) 索引支撑键集分页
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                title TEXT,
+                created_at TEXT NOT NULL,
+                last_activity TEXT NOT NULL,
+                node_count INTEGER NOT NULL DEFAULT 0,
+                conversation_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, session_id)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_activity
+            ON sessions (user_id, last_activity DESC, session_id DESC)
+        """)
+
+        # 会话下的根对话
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS session_conversations (
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                root_node_id TEXT NOT NULL,
+                title TEXT,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, session_id, conversation_id)
+            ) WITHOUT ROWID
+        """)
+
+        # token 吊销表：已注销的 token 摘要（过期后清理）与各用户的强制下线时间
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                digest BLOB PRIMARY KEY,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_not_before (
+                user_id TEXT PRIMARY KEY,
+                not_before REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        await db.commit()
+
+
+async def close_db():
+    """关闭连接池"""
+    await db_pool.close()
 
 
 async def create_user(
@@ -86,7 +245,7 @@ async def create_user(
     """
     created_at = datetime.utcnow().isoformat()
     cursor = await db.execute(
-        "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)",
+        _INSERT_USER,
         (username, email, hashed_password, created_at)
     )
     await db.commit()
@@ -107,13 +266,10 @@ async def get_user_by_username(
     Returns:
         用户信息字典，如果不存在则返回 None
     """
-    cursor = await db.execute(
-        "SELECT * FROM users WHERE username = ?",
-        (username,)
-    )
-    row = await cursor.fetchone()
-    if row:
-        return dict(row)
+    # execute_fetchall 在连接线程内一次完成执行与取行，比 execute + fetchone 少一次线程往返
+    rows = await db.execute_fetchall(_SELECT_USER_BY_USERNAME, (username,))
+    if rows:
+        return dict(rows[0])
     return None
 
 
@@ -131,13 +287,132 @@ async def get_user_by_email(
     Returns:
         用户信息字典，如果不存在则返回 None
     """
+    rows = await db.execute_fetchall(_SELECT_USER_BY_EMAIL, (email,))
+    if rows:
+        return dict(rows[0])
+    return None
+
+
+async def record_session_activity(
+    db: aiosqlite.Connection,
+    user_id: str,
+    session_id: str,
+    conversation_id: str,
+    root_node_id: str,
+    title: Optional[str],
+    node_count: int,
+) -> None:
+    """
+    对话节点写入后更新会话索引
+
+    会话首次出现时以本轮对话的标题作为会话标题；之后只累加节点数、对话数并刷新最近活动时间。
+
+    Args:
+        db: 数据库连接
+        user_id: 用户 ID
+        session_id: 会话 ID
+        conversation_id: 对话 ID（AI 节点 ID）
+        root_node_id: 本轮对话的根节点 ID
+        title: 本轮对话标题
+        node_count: 本轮写入的节点数
+    """
+    now = datetime.utcnow().isoformat(timespec="microseconds")
     cursor = await db.execute(
-        "SELECT * FROM users WHERE email = ?",
-        (email,)
+        _INSERT_SESSION_CONVERSATION,
+        (user_id, session_id, conversation_id, root_node_id, title, now)
     )
-    row = await cursor.fetchone()
-    if row:
-        return dict(row)
-    return None
+    # 同一对话重复记录（如降级保存）时不重复计数
+    new_conversation = 1 if cursor.rowcount > 0 else 0
+    await db.execute(
+        _UPSERT_SESSION,
+        (user_id, session_id, title, now, now, node_count, new_conversation)
+    )
+    await db.commit()
+
+
+async def list_sessions(
+    db: aiosqlite.Connection,
+    user_id: str,
+    limit: int = 20,
+    after: Optional[tuple] = None,
+) -> List[Dict]:
+    """
+    按最近活动时间倒序列出会话（键集分页）
+
+    Args:
+        db: 数据库连接
+        user_id: 用户 ID
+        limit: 条数
+        after: 上一页最后一条的 (last_activity, session_id)，None 表示第一页
+
+    Returns:
+        会话列表
+    """
+    if after is None:
+        rows = await db.execute_fetchall(_SELECT_SESSIONS_FIRST_PAGE, (user_id, limit))
+    else:
+        rows = await db.execute_fetchall(_SELECT_SESSIONS_AFTER, (user_id, after[0], after[1], limit))
+    return [dict(row) for row in rows]
 
 
+async def get_session_conversations(
+    db: aiosqlite.Connection,
+    user_id: str,
+    session_id: str,
+) -> List[Dict]:
+    """
+    获取会话下的根对话（按创建时间）
+
+    Args:
+        db: 数据库连接
+        user_id: 用户 ID
+        session_id: 会话 ID
+
+    Returns:
+        对话列表，会话不存在时为空
+    """
+    rows = await db.execute_fetchall(_SELECT_SESSION_CONVERSATIONS, (user_id, session_id))
+    return [dict(row) for row in rows]
+
+
+async def revoke_token_digest(db: aiosqlite.Connection, digest: bytes, expires_at: float) -> None:
+    """
+    记录注销的 token（顺带清理已过期的记录）
+
+    Args:
+        db: 数据库连接
+        digest: token 的 SHA-256 摘要
+        expires_at: token 的 exp，过期后记录即可删除
+    """
+    await db.execute(_DELETE_EXPIRED_TOKENS, (time.time(),))
+    await db.execute(_INSERT_REVOKED_TOKEN, (digest, expires_at))
+    await db.commit()
+
+
+async def set_user_not_before(db: aiosqlite.Connection, user_id: str, not_before: float) -> None:
+    """
+    记录强制下线时间：该用户 iat 早于此时间的 token 一律失效
+
+    Args:
+        db: 数据库连接
+        user_id: 用户 ID
+        not_before: 强制下线时间（Unix 秒，含小数）
+    """
+    await db.execute(_UPSERT_USER_NOT_BEFORE, (user_id, not_before))
+    await db.commit()
+
+
+async def get_token_revocation(db: aiosqlite.Connection, digest: bytes, user_id: str) -> Tuple[bool, Optional[float]]:
+    """
+    查询 token 是否已注销，以及其用户的强制下线时间
+
+    Args:
+        db: 数据库连接
+        digest: token 的 SHA-256 摘要
+        user_id: 用户 ID
+
+    Returns:
+        (是否已注销, 强制下线时间或 None)
+    """
+    rows = await db.execute_fetchall(_SELECT_TOKEN_REVOCATION, (digest, user_id))
+    return bool(rows[0]["revoked"]), rows[0]["not_before"]
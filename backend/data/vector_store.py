@@ -1,27 +1,127 @@
 import os
 os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
-from typing import List, Dict
-
-# --- LlamaIndex 核心组件 ---
-from llama_index.core import (
-    VectorStoreIndex, 
-    Document, 
-    StorageContext, 
-    load_index_from_storage, 
-    Settings
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import List, Dict, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from backend.config import settings
+from backend.core.deadline import bounded
+from backend.core.executor import BoundedExecutor, ExecutorBusyError
+from backend.core.metrics import registry
+from backend.data.ann_index import create_index
+from backend.data.embedding_cache import EmbeddingCache
+from backend.data.embedding_service import EmbeddingService
+from backend.data.embedding_worker import get_embed_model
+from backend.data.lexical_index import LexicalIndex
+from backend.data.mmap_vector_store import MmapVectorStore, rrf_fuse
+from backend.data.metadata_index import INDEXED_FIELDS
+from backend.data.near_dup import MinHasher, NearDuplicateIndex
+from backend.data.retrieval_cache import RetrievalCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 旧版 llama-index SimpleVectorStore 的持久化目录
+LEGACY_PERSIST_DIR = "./local_storage"
+
+# 用户分区目录: <VECTOR_STORE_PATH>/users/u_<user_id>/<_default | c_<course>>
+USERS_DIR = "users"
+DEFAULT_COURSE_DIR = "_default"
+
+PartitionKey = Tuple[Optional[str], Optional[str]]
+
+SEARCH_SECONDS = registry.histogram(
+    "retrieval_search_seconds", "search_context 耗时（mode: 检索方式，cache: hit / miss）"
 )
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from backend.config import settings 
+
+class VectorStoreNotReadyError(RuntimeError):
+    """向量子系统尚未完成加载（模型 / 存储仍在预热）或加载失败"""
+
+
+# 检索方式：lexical 只用 BM25（不向量化问题），vector 只用向量，hybrid 两路 RRF 融合
+SEARCH_MODES = ("lexical", "vector", "hybrid")
+
 
 class VectorStoreManager:
     """
     DeepFocus 向量知识库管理器
+
+    知识库按 (用户, 课程) 分区，每个分区是一套独立的向量文件 + 检索索引 + 元数据倒排，
+    检索只扫描当前用户自己的分区。VECTOR_STORE_PATH 根目录为共享分区（无用户归属的历史数据）。
     """
-    
+
     def __init__(self):
-        self.persist_dir = "./local_storage"
-        
+        """只创建执行器等轻量对象；模型与存储由 start() 在后台加载，导入本模块不阻塞"""
+        self.persist_dir = settings.VECTOR_STORE_PATH
+
+        # 向量化与索引读写都在独立执行器中运行，不占用事件循环
+        self.embed_model_name = settings.EMBED_MODEL_NAME
+        self.embed_executor = BoundedExecutor(
+            "embed",
+            max_workers=settings.VECTOR_EXECUTOR_WORKERS,
+            kind=settings.VECTOR_EXECUTOR_KIND,
+            queue_timeout=settings.VECTOR_EXECUTOR_QUEUE_TIMEOUT,
+        )
+        # 索引操作依赖本进程内的存储状态，始终使用线程池（NumPy 运算会释放 GIL）
+        self.index_executor = BoundedExecutor(
+            "vector-index",
+            max_workers=settings.VECTOR_EXECUTOR_WORKERS,
+            queue_timeout=settings.VECTOR_EXECUTOR_QUEUE_TIMEOUT,
+        )
+        # 并发的短请求在此合并为批量前向计算
+        self.embedder = EmbeddingService(
+            self.embed_model_name,
+            self.embed_executor,
+            max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBED_BATCH_MAX_WAIT_MS,
+        )
+
+        # 近似重复检测：skip 丢弃重复片段，link 只记录其来源，off 关闭
+        self.near_dup_mode = settings.NEAR_DUP_MODE
+        if self.near_dup_mode not in ("skip", "link", "off"):
+            raise ValueError(f"未知的近似重复处理方式: {self.near_dup_mode}")
+        self.minhasher = MinHasher(
+            num_perm=settings.NEAR_DUP_NUM_PERM,
+            shingle_size=settings.NEAR_DUP_SHINGLE_SIZE,
+        )
+
+        # 用户分区在首次访问时打开
+        self._partitions: Dict[PartitionKey, MmapVectorStore] = {}
+        self._near_dups: Dict[PartitionKey, NearDuplicateIndex] = {}
+        # 用户 ID -> 已知的课程分区（None 为默认分区），首次检索时从磁盘列出，之后由 _open_partition 维护
+        self._user_courses: Dict[str, Set[Optional[str]]] = {}
+        self._partitions_lock = threading.Lock()
+        # 检索结果缓存：命名空间为用户 ID（共享分区为 None），写入时按命名空间失效
+        self.retrieval_cache = RetrievalCache(settings.RETRIEVAL_CACHE_MAX_ENTRIES)
+
+        # 预热状态: cold -> loading -> ready / failed
+        self.state = "cold"
+        self.error: Optional[str] = None
+        self.startup_seconds: Optional[float] = None
+        self._start_task: Optional[asyncio.Task] = None
+        self._failures = 0  # 连续预热失败次数，成功后清零
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._maintenance_tasks: Set[asyncio.Task] = set()
+
+    # ==============================
+    # 预热（后台加载模型与存储）
+    # ==============================
+
+    def _load(self):
+        """加载 LlamaIndex 组件、Embedding 模型、向量缓存与共享分区（阻塞调用，在执行器中运行）"""
+        # --- LlamaIndex 核心组件 ---（导入本身就要数秒，放到这里）
+        from llama_index.core import Settings
+        from llama_index.core.node_parser import SentenceSplitter
+        from llama_index.llms.openai import OpenAI
+
         # 1. 配置大脑 (LLM) -> 指向 ModelScope
         model_scope_llm = OpenAI(
             model="Qwen/Qwen2.5-Coder-32B-Instruct",
@@ -31,44 +131,641 @@ class VectorStoreManager:
             max_tokens=2048
         )
         Settings.llm = model_scope_llm
-        
+
         # 2. 配置眼睛 (Embedding) -> 使用 BGE 中文模型
-        Settings.embed_model = HuggingFaceEmbedding(
-            model_name="BAAI/bge-small-zh-v1.5"
+        # 重复上传的片段直接复用已计算的向量；换模型后缓存自动失效
+        self.embed_cache = EmbeddingCache(
+            settings.EMBED_CACHE_PATH,
+            max_entries=settings.EMBED_CACHE_MAX_ENTRIES,
         )
-        
-        # 3. 初始化/加载索引 (记忆库)
-        if not os.path.exists(self.persist_dir):
-            #print("VectorStore] 本地为空，正在初始化新知识库...")
-            self.index = VectorStoreIndex.from_documents([])
-            self.index.storage_context.persist(persist_dir=self.persist_dir)
+        self.embed_cache.bind_model(self.embed_model_name)
+        if settings.VECTOR_EXECUTOR_KIND == "thread":
+            # 进程池模式下模型只在子进程中加载
+            Settings.embed_model = get_embed_model(self.embed_model_name)
+        self.splitter = SentenceSplitter()
+
+        # 3. 映射向量文件 (记忆库)：只读 mmap，不解析向量 JSON，也不再整库重写
+        self.store = self._open_partition(None, None)
+        if len(self.store) == 0:
+            self._migrate_legacy_storage()
+
+    async def _start(self):
+        started_at = time.perf_counter()
+        self.state = "loading"
+        logger.info("向量子系统开始预热")
+        try:
+            await self.index_executor.run(self._load)
+            # 跑一次问题向量化：进程池模式下让子进程加载模型，首个请求不再付出冷启动
+            await self.embedder.embed_query("预热")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            self._failures += 1
+            logger.error("向量子系统预热失败（第 %d 次）: %s", self._failures, e, exc_info=True)
+            self._schedule_retry()
+            return
+        self.startup_seconds = time.perf_counter() - started_at
+        self.state = "ready"
+        self._failures = 0
+        logger.info("向量子系统预热完成，耗时 %.2fs", self.startup_seconds)
+        if settings.WAL_ENABLED and self._checkpoint_task is None:
+            self._checkpoint_task = asyncio.get_running_loop().create_task(self._checkpoint_loop())
+
+    async def _checkpoint_loop(self):
+        """定期把各分区的预写日志并入主存储文件"""
+        while True:
+            await asyncio.sleep(settings.WAL_CHECKPOINT_INTERVAL)
+            with self._partitions_lock:
+                stores = list(self._partitions.values())
+            for store in stores:
+                try:
+                    await self.index_executor.run(store.checkpoint)
+                except Exception as e:
+                    logger.warning("分区 %s 检查点失败: %s", store.path, e)
+
+    def _schedule_retry(self) -> None:
+        """预热失败后按指数退避在后台重试，超过 VECTOR_WARMUP_RETRIES 次后停止（请求触发的懒加载仍会再试）"""
+        if self._failures > settings.VECTOR_WARMUP_RETRIES:
+            logger.error("向量子系统预热连续失败 %d 次，停止自动重试", self._failures)
+            return
+        delay = min(
+            settings.VECTOR_WARMUP_RETRY_SECONDS * 2 ** (self._failures - 1),
+            settings.VECTOR_WARMUP_RETRY_MAX_SECONDS,
+        )
+        logger.info("向量子系统将在 %.1f 秒后重试预热", delay)
+        self._retry_handle = self._loop.call_later(delay, self._retry)
+
+    def _retry(self) -> None:
+        self._retry_handle = None
+        if self.state == "failed":
+            self.start()
+
+    def start(self) -> asyncio.Task:
+        """开始后台预热（幂等）；失败后再次调用会立即重试"""
+        self._loop = asyncio.get_running_loop()
+        if self._start_task is None or (self._start_task.done() and self.state == "failed"):
+            if self._retry_handle is not None:
+                self._retry_handle.cancel()
+                self._retry_handle = None
+            self.error = None
+            self._start_task = self._loop.create_task(self._start())
+        return self._start_task
+
+    async def wait_ready(self, timeout: Optional[float] = None):
+        """
+        等待预热完成；尚未开始时立即触发（懒加载）
+
+        Args:
+            timeout: 最长等待秒数，默认 VECTOR_READY_TIMEOUT
+
+        Raises:
+            VectorStoreNotReadyError: 超时或预热失败
+        """
+        if self.state == "ready":
+            return
+        task = self.start()
+        timeout = settings.VECTOR_READY_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise VectorStoreNotReadyError("知识库正在加载，请稍后重试")
+        if self.state != "ready":
+            raise VectorStoreNotReadyError(f"知识库加载失败: {self.error}")
+
+    def status(self) -> Dict:
+        """预热状态（供就绪探针返回）"""
+        retry_in = None
+        if self._retry_handle is not None:
+            retry_in = round(max(0.0, self._retry_handle.when() - self._loop.time()), 1)
+        return {
+            "state": self.state,
+            "warmup": settings.VECTOR_WARMUP,
+            "error": self.error,
+            "failures": self._failures,
+            "retry_in_seconds": retry_in,
+            "startup_seconds": round(self.startup_seconds, 3) if self.startup_seconds is not None else None,
+        }
+
+    # ==============================
+    # 分区管理（阻塞调用，在执行器中运行）
+    # ==============================
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.persist_dir, USERS_DIR, "u_" + quote(str(user_id), safe=""))
+
+    def _partition_path(self, user_id: Optional[str], course: Optional[str]) -> str:
+        if user_id is None:
+            return self.persist_dir
+        course_dir = "c_" + quote(course, safe="") if course else DEFAULT_COURSE_DIR
+        return os.path.join(self._user_dir(user_id), course_dir)
+
+    def _open_partition(
+        self,
+        user_id: Optional[str],
+        course: Optional[str],
+        create: bool = True,
+    ) -> Optional[MmapVectorStore]:
+        """打开（或创建）分区；create=False 且分区不存在时返回 None"""
+        key = (str(user_id) if user_id is not None else None, course or None)
+        with self._partitions_lock:
+            store = self._partitions.get(key)
+            if store is None:
+                path = self._partition_path(*key)
+                if not create and not os.path.exists(path):
+                    return None
+                # 检索索引与向量文件同目录持久化，随写入增量更新
+                index = create_index(
+                    settings.VECTOR_INDEX,
+                    path,
+                    nlist=settings.IVF_NLIST,
+                    nprobe=settings.IVF_NPROBE,
+                    train_min_rows=settings.IVF_TRAIN_MIN_ROWS,
+                    background=self._submit_maintenance if self._loop is not None else None,
+                )
+                lexical_index = LexicalIndex(
+                    k1=settings.BM25_K1, b=settings.BM25_B, max_df=settings.LEXICAL_MAX_DF
+                )
+                store = self._partitions[key] = MmapVectorStore(
+                    path,
+                    index=index,
+                    lexical_index=lexical_index,
+                    precision=settings.VECTOR_PRECISION,
+                    rerank_factor=settings.VECTOR_RERANK_FACTOR,
+                    wal=settings.WAL_ENABLED,
+                    commit_delay_ms=settings.WAL_GROUP_COMMIT_MS,
+                    checkpoint_bytes=settings.WAL_CHECKPOINT_BYTES,
+                )
+                if self.near_dup_mode != "off":
+                    near_dup = NearDuplicateIndex(
+                        path,
+                        self.minhasher,
+                        bands=settings.NEAR_DUP_BANDS,
+                        threshold=settings.NEAR_DUP_THRESHOLD,
+                    )
+                    near_dup.load([store.get(row)["text"] for row in range(len(store))])
+                    self._near_dups[key] = near_dup
+                if key[0] is not None and key[0] in self._user_courses:
+                    self._user_courses[key[0]].add(key[1])
+            return store
+
+    def _known_courses(self, user_id: str) -> List[Optional[str]]:
+        """用户已有的课程分区；只在首次访问该用户时列出磁盘目录"""
+        user_id = str(user_id)
+        with self._partitions_lock:
+            courses = self._user_courses.get(user_id)
+            if courses is None:
+                user_dir = self._user_dir(user_id)
+                names = os.listdir(user_dir) if os.path.isdir(user_dir) else []
+                courses = self._user_courses[user_id] = {
+                    None if name == DEFAULT_COURSE_DIR else unquote(name[len("c_"):]) for name in names
+                }
+            return sorted(courses, key=lambda c: c or "")
+
+    def _partition_items(self) -> List[Tuple[PartitionKey, MmapVectorStore, Optional[NearDuplicateIndex]]]:
+        """已打开分区的快照（其他线程可能正在打开新分区，不能直接遍历字典）"""
+        with self._partitions_lock:
+            return [(key, store, self._near_dups.get(key)) for key, store in self._partitions.items()]
+
+    def _submit_maintenance(self, fn) -> None:
+        """从执行器线程提交耗时的索引维护（IVF 重新训练），在索引执行器中运行，不占用分区写锁"""
+        self._loop.call_soon_threadsafe(self._start_maintenance, fn)
+
+    def _start_maintenance(self, fn) -> None:
+        task = self._loop.create_task(self._run_maintenance(fn))
+        self._maintenance_tasks.add(task)
+        task.add_done_callback(self._maintenance_tasks.discard)
+
+    async def _run_maintenance(self, fn) -> None:
+        while True:
+            try:
+                await self.index_executor.run(fn)
+                return
+            except ExecutorBusyError:
+                # 维护任务不能丢（索引会一直等它完成），执行器繁忙时稍后重试
+                await asyncio.sleep(1.0)
+
+    def _near_dup(self, user_id: Optional[str], course: Optional[str]) -> Optional[NearDuplicateIndex]:
+        """分区的近似重复索引（分区须已打开；检测关闭时为 None）"""
+        return self._near_dups.get((str(user_id) if user_id is not None else None, course or None))
+
+    def _search_scope(
+        self,
+        user_id: Optional[str],
+        course: Optional[str],
+        include_shared: bool,
+    ) -> List[MmapVectorStore]:
+        """确定检索范围：指定课程只查该分区，否则查该用户的全部分区"""
+        stores = []
+        if user_id is not None:
+            if course:
+                stores.append(self._open_partition(user_id, course, create=False))
+            else:
+                for part_course in self._known_courses(user_id):
+                    stores.append(self._open_partition(user_id, part_course, create=False))
+        if user_id is None or include_shared:
+            stores.append(self.store)
+        return [s for s in stores if s is not None]
+
+    def _search_partitions(
+        self,
+        query: str,
+        query_embedding: Optional[np.ndarray],
+        mode: str,
+        top_k: int,
+        user_id: Optional[str],
+        course: Optional[str],
+        filters: Optional[Dict],
+        include_shared: bool,
+    ) -> List[Dict]:
+        """
+        在检索范围内的各分区中检索并合并结果
+
+        各分区的得分须可比才能合并：余弦相似度可以直接比较；BM25 用所有分区合并后的语料统计打分；
+        混合检索先把各分区的两路候选分别按原始得分合并，再对合并后的两个列表统一做一次 RRF。
+        """
+        stores = self._search_scope(user_id, course, include_shared)
+        stats = None
+        if mode != "vector" and len(stores) > 1:
+            stats = stores[0].lexical_stats(query)
+            for store in stores[1:]:
+                stats = stats.merge(store.lexical_stats(query))
+
+        hits = []
+        if mode == "hybrid":
+            lexical, vector = [], []
+            for i, store in enumerate(stores):
+                lexical_rows, vector_rows = store.hybrid_candidates(
+                    query_embedding,
+                    query,
+                    top_k,
+                    filters=filters,
+                    candidates=settings.HYBRID_CANDIDATES,
+                    prune=settings.HYBRID_PRUNE,
+                    stats=stats,
+                )
+                lexical.extend(((i, row), score) for row, score in lexical_rows)
+                vector.extend(((i, row), score) for row, score in vector_rows)
+            lexical.sort(key=lambda h: h[1], reverse=True)
+            vector.sort(key=lambda h: h[1], reverse=True)
+            fused = rrf_fuse(
+                (lexical[:settings.HYBRID_CANDIDATES], vector[:settings.HYBRID_CANDIDATES]),
+                top_k,
+                settings.HYBRID_RRF_K,
+            )
+            hits = [(score, stores[i], row) for (i, row), score in fused]
         else:
-            #print("[VectorStore] 发现本地记忆，正在加载...")
-            storage_context = StorageContext.from_defaults(persist_dir=self.persist_dir)
-            self.index = load_index_from_storage(storage_context)
-
-    async def add_document(self, text: str, metadata: Dict = None):
-        """存入知识：切片 -> 向量化 -> 存硬盘"""
-        if not text: return
-        
-        doc = Document(text=text, metadata=metadata or {})
-        self.index.insert(doc)
-        self.index.storage_context.persist(persist_dir=self.persist_dir)
-        #print(f"[存入成功] {text[:20]}...")
+            for store in stores:
+                if mode == "lexical":
+                    rows = store.lexical_search(query, top_k, filters=filters, stats=stats)
+                else:
+                    rows = store.search(query_embedding, top_k, filters=filters)
+                for row, score in rows:
+                    hits.append((score, store, row))
+            hits.sort(key=lambda h: h[0], reverse=True)
 
-    async def search_context(self, query: str, top_k: int = 3) -> List[Dict]:
-        """检索知识：语义搜索 -> 返回片段"""
-        retriever = self.index.as_retriever(similarity_top_k=top_k)
-        nodes = retriever.retrieve(query)
-        
+        near_dups = {id(store): near_dup for _, store, near_dup in self._partition_items() if near_dup is not None}
         results = []
-        for node in nodes:
-            results.append({
-                "text": node.text,
-                "score": node.score,
-                "source": node.metadata.get("source", "unknown")
-            })
+        for score, store, row in hits[:top_k]:
+            record = store.get(row)
+            result = {
+                "text": record["text"],
+                "score": score,
+                "source": record["metadata"].get("source", "unknown"),
+                "type": record["metadata"].get("type"),
+                "course": record["metadata"].get("course"),
+            }
+            # link 模式下合并进该片段的重复来源
+            near_dup = near_dups.get(id(store))
+            if near_dup is not None and row in near_dup.links:
+                result["duplicate_sources"] = list(near_dup.links[row])
+            results.append(result)
         return results
 
-# 全局单例
-vector_store_manager = VectorStoreManager()
\ No newline at end of file
+    def _migrate_legacy_storage(self):
+        """一次性导入旧版 llama-index JSON 存储中的节点与向量"""
+        docstore_path = os.path.join(LEGACY_PERSIST_DIR, "docstore.json")
+        vectors_path = os.path.join(LEGACY_PERSIST_DIR, "default__vector_store.json")
+        if not (os.path.exists(docstore_path) and os.path.exists(vectors_path)):
+            return
+
+        try:
+            with open(docstore_path, "r", encoding="utf-8") as f:
+                nodes = json.load(f).get("docstore/data", {})
+            with open(vectors_path, "r", encoding="utf-8") as f:
+                embedding_dict = json.load(f).get("embedding_dict", {})
+
+            embeddings, records = [], []
+            for node_id, embedding in embedding_dict.items():
+                data = nodes.get(node_id, {}).get("__data__", {})
+                if not data.get("text"):
+                    continue
+                embeddings.append(embedding)
+                records.append({
+                    "doc_id": data.get("ref_doc_id") or node_id,
+                    "text": data["text"],
+                    "metadata": data.get("metadata") or {},
+                })
+            if records:
+                rows = self.store.add(np.asarray(embeddings, dtype=np.float32), records)
+                near_dup = self._near_dup(None, None)
+                if near_dup is not None:
+                    # 旧数据原样迁移，不做判重，只登记签名
+                    near_dup.add(rows[0], self.minhasher.signatures([r["text"] for r in records]))
+            logger.info("已从旧版存储迁移 %d 个片段", len(records))
+        except Exception as e:
+            logger.warning("旧版向量存储迁移失败，忽略: %s", e, exc_info=True)
+
+    async def add_document(
+        self,
+        text: str,
+        metadata: Dict = None,
+        user_id: Optional[str] = None,
+        course: Optional[str] = None,
+    ):
+        """
+        存入知识：切片 -> 近似重复检测 -> 向量化 -> 追加写入所属分区
+
+        Args:
+            text: 文档内容
+            metadata: 元数据（source / type 等，可用于检索过滤）
+            user_id: 所属用户，None 写入共享分区
+            course: 所属课程（可选）
+
+        Returns:
+            {"chunks": 切片数, "indexed": 写入数, "duplicates": 判为近似重复的片段数,
+             "skipped": 其中丢弃的片段数, "linked": 其中合并为来源链接的片段数}
+        """
+        report = {"chunks": 0, "indexed": 0, "duplicates": 0, "skipped": 0, "linked": 0}
+        if not text: return report
+        await self.wait_ready()
+
+        chunks = await self.split_text(text)
+        report["chunks"] = len(chunks)
+        chunks, signatures = await self.dedupe_chunks(chunks, metadata, user_id=user_id, course=course)
+        if chunks:
+            embeddings = await self.embed_chunks(chunks)
+            report["indexed"] = await self.index_chunks(
+                chunks, embeddings, metadata, user_id=user_id, course=course, signatures=signatures
+            )
+        report["duplicates"] = report["chunks"] - report["indexed"]
+        report["linked" if self.near_dup_mode == "link" else "skipped"] = report["duplicates"]
+        #print(f"[存入成功] {text[:20]}...")
+        return report
+
+    async def split_text(self, text: str) -> List[str]:
+        """切片"""
+        await self.wait_ready()
+        return await self.index_executor.run(self.splitter.split_text, text)
+
+    async def index_chunks(
+        self,
+        chunks: List[str],
+        embeddings: np.ndarray,
+        metadata: Dict = None,
+        user_id: Optional[str] = None,
+        course: Optional[str] = None,
+        doc_id: Optional[str] = None,
+        signatures: Optional[np.ndarray] = None,
+    ) -> int:
+        """
+        把已向量化的片段追加写入所属分区
+
+        开启近似重复检测时，判重与写入在分区锁内原子完成：并发写入的同一批讲义只会保留一份。
+
+        Args:
+            chunks: 片段文本
+            embeddings: 与片段对应的向量
+            metadata: 元数据
+            user_id: 所属用户
+            course: 所属课程
+            doc_id: 所属文档 ID，同一文档分多批写入时保持一致；None 自动生成
+            signatures: dedupe_chunks 返回的签名；None 时现场计算
+
+        Returns:
+            写入的片段数（不含判为重复的片段）
+        """
+        await self.wait_ready()
+        metadata = dict(metadata or {})
+        if course:
+            metadata["course"] = course
+        metadata["doc_id"] = doc_id or str(uuid.uuid4())
+        records = [
+            {"doc_id": metadata["doc_id"], "text": chunk, "metadata": metadata}
+            for chunk in chunks
+        ]
+        store = await self.index_executor.run(self._open_partition, user_id, course)
+        near_dup = self._near_dup(user_id, course)
+        try:
+            if near_dup is None:
+                await self.index_executor.run(store.add, embeddings, records)
+                return len(records)
+            checked = 0
+            if signatures is None:
+                signatures = await self.index_executor.run(self.minhasher.signatures, chunks)
+                checked = len(chunks)
+            return await self.index_executor.run(
+                self._add_deduplicated, store, near_dup, embeddings, records, signatures, checked
+            )
+        finally:
+            # 写入完成（或中途失败）后使该用户已缓存的检索结果过期
+            self.retrieval_cache.bump(user_id)
+
+    async def dedupe_chunks(
+        self,
+        chunks: List[str],
+        metadata: Dict = None,
+        user_id: Optional[str] = None,
+        course: Optional[str] = None,
+    ) -> Tuple[List[str], Optional[np.ndarray]]:
+        """
+        向量化之前的近似重复检测：去掉与分区已有片段或批内其他片段重复的片段，省去其向量化开销
+
+        Returns:
+            (保留的片段, 保留片段的签名)；检测关闭时原样返回，签名为 None
+        """
+        if self.near_dup_mode == "off" or not chunks:
+            return chunks, None
+        await self.wait_ready()
+        await self.index_executor.run(self._open_partition, user_id, course)
+        near_dup = self._near_dup(user_id, course)
+        signatures = await self.index_executor.run(self.minhasher.signatures, chunks)
+        source = (metadata or {}).get("source", "unknown")
+        keep = await self.index_executor.run(self._check_duplicates, near_dup, signatures, source)
+        return [chunk for chunk, k in zip(chunks, keep) if k], signatures[keep]
+
+    def _check_duplicates(self, near_dup: NearDuplicateIndex, signatures: np.ndarray, source: str) -> np.ndarray:
+        with near_dup.lock:
+            return self._record_duplicates(near_dup, signatures, source, len(signatures))
+
+    def _record_duplicates(
+        self,
+        near_dup: NearDuplicateIndex,
+        signatures: np.ndarray,
+        source: str,
+        checked: int,
+        start_row: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        判重并记录统计 / 来源链接，返回保留掩码（调用方持有 near_dup.lock）
+
+        start_row 为 None 表示写入前的预检：link 模式下批内重复此时还没有可链接的行号，先保留，
+        留到写入时再判定。
+        """
+        keep, duplicates = near_dup.filter(signatures)
+        skipped, links = 0, []
+        for i, row, _ in duplicates:
+            if self.near_dup_mode == "skip":
+                skipped += 1
+            elif row >= 0:
+                links.append((row, source))
+            elif start_row is None:
+                keep[i] = True
+            else:
+                # 批内重复：链接到批内首个相似片段写入后的行号
+                first = -row - 1
+                links.append((start_row + int(np.count_nonzero(keep[:first])), source))
+        near_dup.record(checked, skipped, links)
+        return keep
+
+    def _add_deduplicated(
+        self,
+        store: MmapVectorStore,
+        near_dup: NearDuplicateIndex,
+        embeddings: np.ndarray,
+        records: List[Dict],
+        signatures: np.ndarray,
+        checked: int,
+    ) -> int:
+        with near_dup.lock:
+            source = records[0]["metadata"].get("source", "unknown") if records else "unknown"
+            keep = self._record_duplicates(near_dup, signatures, source, checked, start_row=len(store))
+            if not keep.any():
+                return 0
+            kept_records = [record for record, k in zip(records, keep) if k]
+            rows = store.add(np.asarray(embeddings)[keep], kept_records, durable=False)
+            near_dup.add(rows[0], signatures[keep])
+        # 释放判重锁后再等日志落盘，同一分区的并发写入才能合并 fsync
+        store.sync()
+        return len(rows)
+
+    def dedup_report(self, user_id: str) -> List[Dict]:
+        """当前用户各分区的去重统计（阻塞调用，须在预热完成后于执行器中运行）"""
+        report = []
+        stores = self._search_scope(user_id, None, include_shared=False)
+        keys = {id(store): (key, near_dup) for key, store, near_dup in self._partition_items()}
+        for store in stores:
+            key, near_dup = keys[id(store)]
+            stats = near_dup.stats if near_dup is not None else {"checked": 0, "skipped": 0, "linked": 0}
+            report.append({"course": key[1], "chunks": len(store), **stats})
+        return report
+
+    async def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """向量化片段：先查内容哈希缓存，只对未命中的片段运行模型"""
+        await self.wait_ready()
+        cached = await self.index_executor.run(self.embed_cache.get_many, chunks)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            missing_texts = [chunks[i] for i in missing]
+            computed = await self.embedder.embed_texts(missing_texts)
+            await self.index_executor.run(self.embed_cache.put_many, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = vector
+        return np.stack(cached)
+
+    async def search_context(
+        self,
+        query: str,
+        top_k: int = 3,
+        user_id: Optional[str] = None,
+        course: Optional[str] = None,
+        filters: Optional[Dict] = None,
+        include_shared: bool = False,
+        mode: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        检索知识：关键词 / 语义 / 混合检索 -> 返回片段
+
+        结果按 (用户, 归一化问题, top_k, 检索条件) 缓存，该用户写入新知识后自动失效。
+
+        Args:
+            query: 检索问题
+            top_k: 返回条数
+            user_id: 当前用户，只检索其自己的分区；None 只检索共享分区
+            course: 只检索该课程分区（可选）
+            filters: 元数据过滤条件，如 {"type": "memo", "source": ["a.md", "b.md"]}
+            include_shared: 是否同时检索共享分区
+            mode: lexical / vector / hybrid，None 使用 SEARCH_MODE 配置
+
+        Raises:
+            ValueError: 过滤字段未建立索引或检索方式未知
+            DeadlineExceeded: 请求截止时间已到
+        """
+        return await bounded(
+            "vector.search",
+            self._search_context(query, top_k, user_id, course, filters, include_shared, mode),
+        )
+
+    async def _search_context(
+        self,
+        query: str,
+        top_k: int,
+        user_id: Optional[str],
+        course: Optional[str],
+        filters: Optional[Dict],
+        include_shared: bool,
+        mode: Optional[str],
+    ) -> List[Dict]:
+        await self.wait_ready()
+        mode = mode or settings.SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"未知的检索方式: {mode}，可选: {', '.join(SEARCH_MODES)}")
+        if filters:
+            unknown = set(filters) - set(INDEXED_FIELDS)
+            if unknown:
+                raise ValueError(f"元数据字段 {', '.join(sorted(unknown))} 不支持过滤，可用字段: {', '.join(INDEXED_FIELDS)}")
+        # 检索前读取写入代数：检索期间发生的写入会让本次结果一写入缓存就过期
+        namespaces = (user_id,) if user_id is None or not include_shared else (user_id, None)
+        generation = self.retrieval_cache.generation(namespaces)
+        cache_key = (
+            user_id,
+            normalize_query(query),
+            top_k,
+            mode,
+            course,
+            include_shared,
+            json.dumps(filters, sort_keys=True, ensure_ascii=False) if filters else None,
+        )
+        started = time.perf_counter()
+        cached = self.retrieval_cache.get(cache_key, generation)
+        if cached is not None:
+            SEARCH_SECONDS.observe(time.perf_counter() - started, mode=mode, cache="hit")
+            return cached
+
+        # 纯关键词检索不需要向量化问题
+        query_embedding = None if mode == "lexical" else await self.embedder.embed_query(query)
+        results = await self.index_executor.run(
+            self._search_partitions, query, query_embedding, mode, top_k, user_id, course, filters, include_shared
+        )
+        self.retrieval_cache.put(cache_key, generation, results)
+        SEARCH_SECONDS.observe(time.perf_counter() - started, mode=mode, cache="miss")
+        return results
+
+    def shutdown(self):
+        """关闭执行器，各分区做最后一次检查点"""
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+        if self._checkpoint_task is not None:
+            self._checkpoint_task.cancel()
+        for task in list(self._maintenance_tasks):
+            task.cancel()
+        self.embed_executor.shutdown(wait=False)
+        self.index_executor.shutdown(wait=False)
+        with self._partitions_lock:
+            stores = list(self._partitions.values())
+        for store in stores:
+            store.close()
+        if self.state == "ready":
+            self.embed_cache.close()
+
+# 全局单例（构造开销很小，模型与存储在 start() / 首次使用时加载）
+vector_store_manager = VectorStoreManager()
@@ -0,0 +1,196 @@
+"""
+向量存储的预写日志 (WAL)
+写入先追加到 wal.log，再写入主存储文件（只进页缓存）；只有日志需要 fsync。
+并发写入的 fsync 按组提交：先到的写入线程负责 fsync，期间追加的其他写入一并落盘。
+检查点把主存储文件 fsync 后截掉已落盘的日志；启动时重放主存储缺失的尾部。
+
+日志记录格式:
+    <4s 魔数><I 维度><I 行数><Q 起始行号><I 载荷长度><I 载荷 CRC32>
+    载荷 = float32 向量 + 每行一条的 JSON 元数据
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from backend.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WAL_GROUP_SIZE = registry.histogram(
+    "wal_group_commit_size",
+    "每次日志 fsync 覆盖的写入数",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+WAL_FSYNC_SECONDS = registry.histogram(
+    "wal_fsync_seconds", "日志 fsync 耗时"
+)
+WAL_CHECKPOINTS = registry.counter(
+    "wal_checkpoints_total", "检查点次数"
+)
+WAL_REPLAYED_ROWS = registry.counter(
+    "wal_replayed_rows_total", "启动时从日志重放的行数"
+)
+
+_MAGIC = b"WAL1"
+_HEADER = struct.Struct("<4sIIQII")
+
+WalEntry = Tuple[int, np.ndarray, List[Dict]]
+
+
+def fsync_path(path: str) -> None:
+    """把文件（或目录项）刷到磁盘；文件不存在时忽略"""
+    if not os.path.exists(path):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    追加写入的预写日志（按组 fsync）
+
+    append 由调用方在存储写锁内调用，sync 在写锁外调用，多个写入线程共享一次 fsync。
+    """
+
+    FILE = "wal.log"
+
+    def __init__(self, path: str, commit_delay_ms: float = 0.0):
+        """
+        Args:
+            path: 存储目录
+            commit_delay_ms: 负责 fsync 的线程先等待的毫秒数，让更多并发写入进入同一组
+        """
+        self.path = os.path.join(path, self.FILE)
+        self.commit_delay = commit_delay_ms / 1000
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        # 已追加 / 已落盘的记录序号
+        self._written = 0
+        self._durable = 0
+
+    @property
+    def appended(self) -> int:
+        """最后一条已追加记录的序号"""
+        return self._written
+
+    def size(self) -> int:
+        """日志当前字节数"""
+        with self._lock:
+            return self._file.tell()
+
+    def append(self, start_row: int, vectors: np.ndarray, records: List[Dict]) -> int:
+        """
+        追加一条记录（写入操作系统缓冲，尚未落盘）
+
+        Returns:
+            记录序号，传给 sync 等待其落盘
+        """
+        payload = vectors.astype(np.float32, copy=False).tobytes() + "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        ).encode("utf-8")
+        header = _HEADER.pack(
+            _MAGIC, vectors.shape[1], len(records), start_row, len(payload), zlib.crc32(payload)
+        )
+        with self._lock:
+            self._file.write(header + payload)
+            self._file.flush()
+            self._written += 1
+            return self._written
+
+    def sync(self, seq: int) -> None:
+        """
+        等待序号不超过 seq 的记录落盘（组提交）
+
+        第一个到达的线程成为本组的提交者：fsync 截至当时已追加的全部记录（有其他写入在排队时先等 commit_delay）；
+        其余线程在 _sync_lock 上排队，拿到锁时多半已被覆盖，直接返回。
+        """
+        if self._durable >= seq:
+            return
+        with self._sync_lock:
+            if self._durable >= seq:
+                return
+            # 只有别的写入也在等待落盘时才值得多等一会儿，单个写入直接 fsync
+            if self.commit_delay and self._written - self._durable > 1:
+                time.sleep(self.commit_delay)
+            with self._lock:
+                target = self._written
+                # 复制描述符：fsync 期间检查点可能替换日志文件
+                fd = os.dup(self._file.fileno())
+            started = time.perf_counter()
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            WAL_FSYNC_SECONDS.observe(time.perf_counter() - started)
+            WAL_GROUP_SIZE.observe(target - self._durable)
+            self._durable = max(self._durable, target)
+
+    def replay(self) -> Iterator[WalEntry]:
+        """
+        按写入顺序读出日志记录 (起始行号, 向量, 元数据)
+
+        遇到写了一半或校验失败的记录即停止，并把日志截断到最后一条完整记录。
+        """
+        with open(self.path, "rb") as f:
+            offset = 0
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                magic, dim, rows, start_row, length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if magic != _MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                vector_bytes = dim * rows * 4
+                vectors = np.frombuffer(payload[:vector_bytes], dtype=np.float32).reshape(rows, dim)
+                # 只按 \n 切分：ensure_ascii=False 的 JSON 里可能有 U+2028 等字符
+                records = [json.loads(line) for line in payload[vector_bytes:].decode("utf-8").split("\n")[:-1]]
+                offset = f.tell()
+                yield start_row, vectors, records
+        if offset < os.path.getsize(self.path):
+            logger.warning("预写日志 %s 尾部记录不完整，截断至 %d 字节", self.path, offset)
+            with self._lock:
+                self._file.truncate(offset)
+
+    def compact(self, offset: int) -> None:
+        """
+        丢弃 offset 之前已落入主存储（且主存储已 fsync）的记录
+
+        检查点期间新追加的记录拷贝到新日志文件，fsync 后原子替换。
+        """
+        with self._lock:
+            end = self._file.tell()
+            if offset >= end:
+                self._file.truncate(0)
+                self._file.seek(0)
+            else:
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                fsync_path(os.path.dirname(self.path))
+                self._file.close()
+                self._file = open(self.path, "ab")
+            # 截掉的记录已在主存储中落盘，保留的记录刚刚 fsync 过
+            self._durable = self._written
+        WAL_CHECKPOINTS.inc()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
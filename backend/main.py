@@ -4,10 +4,17 @@ FastAPI 应用入口
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from backend.config import settings
-from backend.api.routes import auth, chat, mindmap, knowledge
+from backend.core.loop_monitor import loop_lag_monitor
+from backend.core.metrics import registry
+from backend.agent.llm_resilience import circuit_status
+from backend.agent.load_shedder import deferred_work, load_shedder
+from backend.api.middleware.profiler import ProfilerMiddleware
+from backend.api.routes import auth, chat, mindmap, knowledge, profiles
 from backend.api.routes import auth, chat
-from backend.data.sqlite_db import init_db
+from backend.data.sqlite_db import close_db, init_db
+from backend.data.vector_store import vector_store_manager
 import asyncio
 
 
@@ -39,10 +46,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求级性能剖析：未开启时不安装中间件
+if settings.PROFILER_TOKEN or settings.PROFILER_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilerMiddleware,
+        store=profiles.profile_store,
+        token=settings.PROFILER_TOKEN,
+        sample_rate=settings.PROFILER_SAMPLE_RATE,
+        paths=json.loads(settings.PROFILER_PATHS),
+    )
+
 # 注册路由
 app.include_router(auth.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
 app.include_router(mindmap.router, prefix="/api")
+app.include_router(profiles.router)
 
 
 @app.on_event("startup")
@@ -51,6 +69,19 @@ async def startup_event():
     logger.info("应用启动，初始化数据库...")
     await init_db()
     logger.info("数据库初始化完成")
+    loop_lag_monitor.start()
+    if settings.VECTOR_WARMUP == "background":
+        # 模型与向量存储在后台加载，不阻塞端口监听；对话、登录等接口立即可用
+        vector_store_manager.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务"""
+    await loop_lag_monitor.stop()
+    await deferred_work.stop()
+    vector_store_manager.shutdown()
+    await close_db()
 
 
 @app.get("/")
@@ -65,6 +96,44 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    就绪检查：报告向量子系统预热状态、当前负载降级级别与各模型熔断状态
+
+    向量子系统只影响知识库相关接口，预热中（或 lazy 模式尚未加载）不影响就绪；
+    只有预热连续失败且自动重试已用完时返回 503。
+    """
+    vector_store = vector_store_manager.status()
+    state = vector_store["state"]
+    if state == "ready" or (state == "cold" and settings.VECTOR_WARMUP == "lazy"):
+        status = "ready"
+    elif state == "failed":
+        status = "degraded" if vector_store["retry_in_seconds"] is not None else "failed"
+    else:
+        status = "warming"
+    return JSONResponse(
+        status_code=503 if status == "failed" else 200,
+        content={
+            "status": status,
+            "components": {
+                "vector_store": vector_store,
+                "load_shedding": load_shedder.status(),
+                "llm_circuit": circuit_status(),
+            },
+        },
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标"""
+    return PlainTextResponse(
+        registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(